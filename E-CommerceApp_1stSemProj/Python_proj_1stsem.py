@@ -1,22 +1,36 @@
+import time
+STARTUP_STARTED = time.perf_counter() # Taken before the other imports so the startup time includes them
 import tkinter as tk
-from tkinter import messagebox, ttk, simpledialog
-from PIL import Image, ImageTk
-import json
+from tkinter import messagebox, ttk, simpledialog, filedialog
 import os
-import re
+import uuid
 from datetime import datetime
-import bcrypt
+import sqlite3
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from thumbnails import get_thumbnail, ThumbnailManifest
+from rendering import KeyedRows, VirtualList
+from storage import open_user_store, CorruptFileError, SqliteUserStore
+from core import Shop, ShopError, DEFAULT_ITEMS
+from catalog import load_catalog
+from columns import SORT_RELEVANCE, SORT_PRICE_ASC, SORT_PRICE_DESC
+from promotions import load_coupon_definitions
+from inventory import STOCK_FILENAME
+from orders import OrderNotSaved
+from cart import format_cents
+from applog import setup_logging, shutdown_logging
+from state import StateChanges, TOPICS, USER, CART, WISHLIST, ORDERS
+import auth
+import metrics
 
 # --- Constants, Data & State Management ---
 
 # Get the absolute path of the directory where the script is located
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Configure logging (Moved after SCRIPT_DIR definition)
+# Configure logging (Moved after SCRIPT_DIR definition): JSON lines written by a background thread, see applog.py
 log_file_path = os.path.join(SCRIPT_DIR, "app_log.log")
-logging.basicConfig(filename=log_file_path, level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+setup_logging(log_file_path)
 
 # Centralized style configuration
 STYLE = {
@@ -31,485 +45,731 @@ STYLE = {
     "button_fg": "#FFFFFF",
 }
 
+# Search/filter changes are coalesced into one render once typing pauses this long
+SEARCH_DEBOUNCE_MS = 150
+
+# Choices of the product sort combobox
+SORT_LABELS = {
+    "Relevance": SORT_RELEVANCE,
+    "Price: Low to High": SORT_PRICE_ASC,
+    "Price: High to Low": SORT_PRICE_DESC,
+}
+
+# Catalogs with at least this many items get the virtualized product list
+VIRTUAL_LIST_MIN_ITEMS = 200
+PRODUCT_CARD_HEIGHT = 132 # 100px thumbnail + paddings + 5px gap above and below
+
+# Order history is read this many orders at a time; the next page loads when the profile is scrolled to the bottom
+ORDER_PAGE_SIZE = 20
+
+# The Sales tab lists the most recent this many days of the chosen range
+SALES_REPORT_DAYS = 31
+
+# Where accounts are kept: "sqlite" (users.db, the default), "journal" (append-only users.journal
+# plus a periodically compacted users.snapshot.json) or "json" (the legacy users.json)
+USER_STORE_BACKEND = os.environ.get("MARKETPLACE_USER_STORE", "sqlite")
+
+# Optional CSV or JSON Lines product feed to sell instead of the built-in items (see catalog.py)
+CATALOG_PATH = os.environ.get("MARKETPLACE_CATALOG")
+
+# Coupon definitions (see promotions.py); without the file only DISCOUNT20 is offered
+COUPONS_PATH = os.environ.get("MARKETPLACE_COUPONS", os.path.join(SCRIPT_DIR, "coupons.json"))
+
+# Stock levels, updated on every checkout (see inventory.py)
+STOCK_PATH = os.path.join(SCRIPT_DIR, STOCK_FILENAME)
+
+# Time from launch until the window is up is always logged. Set MARKETPLACE_STARTUP_TIMING=1 to
+# also print it, or =exit to print it and quit right away (for timing cold starts from a script)
+STARTUP_TIMING = os.environ.get("MARKETPLACE_STARTUP_TIMING", "")
+
+# With MARKETPLACE_METRICS=1 timings and counters are collected (see metrics.py) and shown in a
+# Diagnostics tab that Ctrl+Shift+D reveals. Set MARKETPLACE_METRICS_FILE to also export them on exit.
+METRICS_FILE = os.environ.get("MARKETPLACE_METRICS_FILE")
+
 # --- Data models and persistence ---
 def load_user_data():
-    """Loads user data from users.json, creating a more detailed structure."""
-    path = os.path.join(SCRIPT_DIR, "users.json")
+    """Opens the user store and loads every account, falling back to a fresh store if that fails."""
+    global user_store
+    store = None
     try:
-        if os.path.exists(path):
-            with open(path, "r") as f:
-                data = json.load(f)
-                logging.info("User data loaded successfully.")
-                # Ensure admin password is hashed if it's plaintext
-                if "admin" in data and not data["admin"]["password"].startswith("$2b$"):
-                    logging.warning("Admin password is plaintext, hashing it now.")
-                    data["admin"]["password"] = bcrypt.hashpw("password".encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-                    # Optionally save immediately if you want to ensure admin is always hashed
-                    # with open(path, "w") as fw:
-                    #     json.dump(data, fw, indent=4)
-                return data
-        else:
-            logging.info("users.json not found, initializing with default admin.")
-            # Ensure the initial admin password is hashed
-            return {
-                "admin": {"password": bcrypt.hashpw("password".encode('utf-8'), bcrypt.gensalt()).decode('utf-8'), 
-                          "email": "admin@example.com", "wishlist": [], "orders": []}
-            }
-    except json.JSONDecodeError as e:
-        logging.error(f"Error decoding users.json: {e}. Initializing with default admin.")
+        store = open_user_store(USER_STORE_BACKEND, SCRIPT_DIR)
+        data = store.load()
+        logging.info("User data loaded successfully.")
+    except CorruptFileError as e:
+        logging.error("Error decoding %s. Initializing with default admin.", e)
         messagebox.showerror("Data Error", "Could not read user data. File might be corrupted. Initializing new data.")
-        return {
-            "admin": {"password": bcrypt.hashpw("password".encode('utf-8'), bcrypt.gensalt()).decode('utf-8'), 
-                      "email": "admin@example.com", "wishlist": [], "orders": []}
-        }
+        if store is not None:
+            store.close() # Let go of the damaged store's files before opening them again
+        # Keep the damaged file (users.json, or the journal's snapshot) around instead of overwriting it on the next save
+        os.replace(e.path, f"{e.path}.corrupt-{int(datetime.now().timestamp())}")
+        store = open_user_store(USER_STORE_BACKEND, SCRIPT_DIR)
+        data = store.load()
     except Exception as e:
-        logging.error(f"An unexpected error occurred loading user data: {e}. Initializing with default admin.")
+        logging.error("An unexpected error occurred loading user data: %s. Changes will only be kept in memory.", e)
         messagebox.showerror("Error", "An unexpected error occurred while loading user data.")
-        return {
-            "admin": {"password": bcrypt.hashpw("password".encode('utf-8'), bcrypt.gensalt()).decode('utf-8'), 
-                      "email": "admin@example.com", "wishlist": [], "orders": []}
-        }
+        if store is not None:
+            try:
+                store.close() # Don't leave the half-opened store's files or threads behind
+            except Exception as close_error:
+                logging.error("Could not close the user store: %s", close_error)
+        store = SqliteUserStore(":memory:")
+        data = store.load()
+    user_store = store
+    return data
+
+def load_catalog_items():
+    """Loads the product feed from CATALOG_PATH, falling back to the built-in items if there is none or it fails."""
+    if not CATALOG_PATH:
+        return DEFAULT_ITEMS
+    try:
+        return load_catalog(CATALOG_PATH)
+    except (OSError, ValueError) as e:
+        logging.error("Could not load catalog %s: %s. Using the built-in items.", CATALOG_PATH, e)
+        messagebox.showerror("Catalog Error", f"Could not load the product catalog: {e}\nShowing the built-in products instead.")
+        return DEFAULT_ITEMS
+
+def load_coupons():
+    """Reads the coupon definitions from COUPONS_PATH, or returns None to use the built-in ones."""
+    if not os.path.exists(COUPONS_PATH):
+        return None
+    try:
+        return load_coupon_definitions(COUPONS_PATH)
+    except (OSError, ValueError) as e:
+        logging.error("Could not load coupons from %s: %s. Using the built-in coupons.", COUPONS_PATH, e)
+        messagebox.showerror("Coupon Error", f"Could not load the coupon list: {e}")
+        return None
 
+@metrics.timed("storage.flush")
 def save_user_data():
-    """Saves the current user data to a JSON file."""
-    path = os.path.join(SCRIPT_DIR, "users.json")
+    """Makes sure all user data is on disk (individual changes are saved as they happen)."""
     try:
-        with open(path, "w") as f:
-            json.dump(user_data, f, indent=4)
-            logging.info("User data saved successfully.")
-    except IOError as e:
-        logging.error(f"Error saving user data to {path}: {e}")
+        user_store.flush()
+        logging.info("User data saved successfully.")
+    except (OSError, sqlite3.Error) as e:
+        logging.error("Error saving user data to %s: %s", user_store.path, e)
         messagebox.showerror("Save Error", f"Could not save user data: {e}")
     except Exception as e:
-        logging.error(f"An unexpected error occurred saving user data: {e}")
+        logging.error("An unexpected error occurred saving user data: %s", e)
         messagebox.showerror("Error", "An unexpected error occurred while saving user data.")
 
-# Mapping for uploaded image filenames (assuming they are in the 'images' subdirectory)
-IMAGE_MAP = {
-    "levis_pants.png": "levis_pants.png",
-    "vanheusen_shirt.png": "vanheusen_shirt.png",
-    "arrow_shirt.png": "arrow_shirt.png",
-    "pepe_jeans_pants.png": "pepe_jeans_pants.png"
-}
+# Thumbnails built ahead of time by ingest_images.py (images/manifest.json)
+IMAGES_DIR = os.path.join(SCRIPT_DIR, "images")
+thumbnail_manifest = ThumbnailManifest(IMAGES_DIR)
 
-def get_image_path(filename_in_items_dict):
+def get_image_path(filename_in_items_dict, size=(100, 100)):
     """
-    Creates a reliable, absolute path to an image, considering it's in an 'images' subdirectory.
+    Returns the pre-built thumbnail of an image at 'size' if ingest_images.py made one,
+    otherwise the original in the 'images' subdirectory (resized once on first use).
     """
-    actual_filename = IMAGE_MAP.get(filename_in_items_dict, filename_in_items_dict)
-    return os.path.join(SCRIPT_DIR, "images", actual_filename)
+    return thumbnail_manifest.thumbnail_path(filename_in_items_dict, size) or os.path.join(IMAGES_DIR, filename_in_items_dict)
 
 # --- Global State Variables ---
-user_data = load_user_data() # Load data after defining load_user_data
-current_user = None
-items = {
-    "Levis Pants": {"price": 39, "product": "Pants", "style": "Daily", "desc": "Classic straight-fit denim jeans.", "image": "levis_pants.png"},
-    "Van Heusen Shirt": {"price": 89, "product": "Shirts", "style": "Party", "desc": "A premium formal shirt for parties.", "image": "vanheusen_shirt.png"},
-    "Arrow Polo": {"price": 59, "product": "Shirts", "style": "Daily", "desc": "A smart casual polo shirt.", "image": "arrow_shirt.png"},
-    "Pepe Jeans": {"price": 79, "product": "Pants", "style": "Party", "desc": "Stylish slim-fit jeans.", "image": "pepe_jeans_pants.png"}
-}
-cart_items = {}
-applied_discount = 1.0
+user_store = None
+load_user_data() # Opens user_store
+shop = Shop(load_catalog_items(), user_store, load_coupons(), STOCK_PATH) # All shop logic lives in core.py; this window is one client of it
+try:
+    shop.ensure_default_admin()
+except ShopError as e:
+    messagebox.showerror(e.title, str(e))
+session = shop.new_session() # The logged-in user, cart and discount of this window
+state_changes = StateChanges() # Views re-render from this when the session's data changes
+items = shop.items
+
+# Live search runs here so typing never waits on filtering
+search_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search")
+search_after_id = None   # Pending debounce timer
+search_future = None     # Query queued or running on search_executor
+search_generation = 0    # Bumped for every query; results of older generations are dropped
+# Work that scans the saved orders (sales reports, the first co-occurrence count) runs here, never ahead of a search
+history_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history")
+
+# Idempotency key of the order summary on screen: pressing "Confirm and Pay" again for it returns the same order
+checkout_key = None
+payment_future = None    # Order being saved by the order service
+
+# --- Background Work ---
+
+def poll_future(future, callback, interval_ms=15, on_error=None):
+    """Calls callback(result) on the Tk thread once 'future' has finished (or on_error(exception) if it raised)."""
+    if not future.done():
+        root.after(interval_ms, poll_future, future, callback, interval_ms, on_error)
+        return
+    if future.cancelled():
+        return
+    try:
+        result = future.result()
+    except Exception as e:
+        logging.error("Background task failed: %s", e)
+        if on_error is not None:
+            on_error(e)
+        return
+    callback(result)
 
 # --- Core Application Logic ---
 
 def login():
-    global current_user
+    """Checks the credentials on the auth pool; finish_login completes the login on the Tk thread."""
     username = entry_login_username.get()
     password = entry_login_password.get()
+    try:
+        future = shop.check_login(username, password)
+    except ShopError as e:
+        messagebox.showerror(e.title, str(e))
+        return
+    login_button.config(state=tk.DISABLED) # No second attempt while bcrypt is still working
+    poll_future(future, lambda result: finish_login(username, result),
+                on_error=lambda e: login_error(username, e))
 
-    if username in user_data:
-        stored_password_value = user_data[username]['password']
-
-        # Attempt to check if the stored password is a bcrypt hash
-        if stored_password_value.startswith('$2b$'):
-            try:
-                if bcrypt.checkpw(password.encode('utf-8'), stored_password_value.encode('utf-8')):
-                    current_user = username
-                    messagebox.showinfo("Login Successful", f"Welcome, {current_user}!")
-                    logging.info(f"User '{username}' logged in successfully (bcrypt).")
-                    notebook.select(frame_home)
-                    update_all_dynamic_displays()
-                else:
-                    current_user = None
-                    messagebox.showerror("Login Failed", "Invalid username or password")
-                    logging.warning(f"Failed login attempt for '{username}': Incorrect bcrypt password.")
-            except ValueError:
-                # This could happen if a malformed bcrypt hash is stored
-                messagebox.showerror("Login Failed", "An error occurred with your password. Please contact support or try resetting.")
-                logging.error(f"ValueError: Invalid salt for user '{username}'. Stored: '{stored_password_value}'.")
-                current_user = None
-        else:
-            # Handle plaintext passwords (migration step)
-            if stored_password_value == password:
-                current_user = username
-                # Hash the password and update in user_data for future logins
-                new_hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-                user_data[username]['password'] = new_hashed_password
-                save_user_data()
-                messagebox.showinfo("Login Successful", f"Welcome, {current_user}! Your password has been updated for security.")
-                logging.info(f"User '{username}' logged in successfully (plaintext migration). Password hashed and saved.")
-                notebook.select(frame_home)
-                update_all_dynamic_displays()
-            else:
-                current_user = None
-                messagebox.showerror("Login Failed", "Invalid username or password")
-                logging.warning(f"Failed login attempt for '{username}': Incorrect plaintext password.")
+def finish_login(username, result):
+    """Logs the user in (or reports the failure) once their password has been checked."""
+    login_button.config(state=tk.NORMAL)
+    try:
+        rehashed = shop.finish_login(session, username, result)
+    except ShopError as e:
+        messagebox.showerror(e.title, str(e))
+        return
+    if rehashed:
+        messagebox.showinfo("Login Successful", f"Welcome, {session.user}! Your password has been updated for security.")
     else:
-        current_user = None
-        messagebox.showerror("Login Failed", "Invalid username or password")
-        logging.warning(f"Failed login attempt for non-existent username '{username}'.")
+        messagebox.showinfo("Login Successful", f"Welcome, {session.user}!")
+    state_changes.publish(USER)
+    notebook.select(frame_home)
+
+def login_error(username, error):
+    """Reports a password check that failed, e.g. because a malformed bcrypt hash is stored."""
+    session.user = None
+    login_button.config(state=tk.NORMAL)
+    messagebox.showerror("Login Failed", "An error occurred with your password. Please contact support or try resetting.")
+    logging.error("Password check failed for user '%s': %s", username, error)
 
 def logout():
-    global current_user, cart_items, applied_discount
-    if current_user:
-        logging.info(f"User '{current_user}' logged out.")
-    current_user = None
-    cart_items = {}
-    applied_discount = 1.0
+    shop.logout(session)
     messagebox.showinfo("Logout", "You have been successfully logged out.")
+    state_changes.publish(USER, CART) # Logging out also empties the cart
     notebook.select(frame_home)
-    update_all_dynamic_displays()
 
 def submit_signup():
     username = entry_username.get()
     password = entry_password.get()
     email = entry_email.get()
-
-    # Define a regular expression for basic email validation
-    email_regex = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-
-    if not all([username, password, email]):
-        messagebox.showerror("Error", "All fields must be filled")
-        logging.warning("Sign-up failed: All fields not filled.")
-        return
-    if not re.match(email_regex, email):
-        messagebox.showerror("Error", "Invalid email format. Please enter a valid email address.")
-        logging.warning(f"Sign-up failed for '{username}': Invalid email format.")
+    try:
+        future = shop.check_signup(username, password, email)
+    except ShopError as e:
+        messagebox.showerror(e.title, str(e))
         return
-    if username in user_data:
-        messagebox.showerror("Error", "Username already exists. Please choose another.")
-        logging.warning(f"Sign-up failed for '{username}': Username already exists.")
+    # The password is hashed on the auth pool before the account is saved
+    signup_button.config(state=tk.DISABLED)
+    poll_future(future, lambda hashed_password: finish_signup(username, hashed_password, email),
+                on_error=lambda e: signup_error(username, e))
+
+def finish_signup(username, hashed_password, email):
+    """Saves the new account once its password hash is ready."""
+    signup_button.config(state=tk.NORMAL)
+    try:
+        shop.finish_signup(username, hashed_password, email)
+    except ShopError as e:
+        messagebox.showerror(e.title, str(e))
         return
-
-    # Hash the password before saving
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-    user_data[username] = {"password": hashed_password, "email": email, "wishlist": [], "orders": []}
-    save_user_data()
     messagebox.showinfo("Success", f"Sign-up successful for {username}!")
-    logging.info(f"New user '{username}' signed up successfully.")
     
     entry_username.delete(0, tk.END)
     entry_password.delete(0, tk.END)
     entry_email.delete(0, tk.END)
     notebook.select(frame_login)
 
+def signup_error(username, error):
+    """Reports a sign-up whose password could not be hashed."""
+    signup_button.config(state=tk.NORMAL)
+    messagebox.showerror("Error", "An unexpected error occurred while creating your account.")
+    logging.error("Sign-up failed for '%s': %s", username, error)
+
 def clear_product_filters():
     """Resets all product search and filter criteria."""
     search_var.set("")
     product_var.set("All")
     style_var.set("All")
-    update_product_display()
+    min_price_var.set("")
+    max_price_var.set("")
+    sort_var.set("Relevance") # The variable traces coalesce all these changes into one render
     logging.info("Product filters cleared.")
 
-def update_product_display():
-    """Updates the display of products based on current filters and search query."""
-    for widget in product_display_frame.winfo_children():
-        widget.destroy()
+def create_product_card(parent, name):
+    """Builds the widgets for one product card; update_product_card binds it to an item."""
+    card = tk.Frame(parent, relief=tk.RAISED, borderwidth=1, bg=STYLE['frame_bg'])
+    card.img_label = tk.Label(card, bg=STYLE['frame_bg'])
+    card.img_label.pack(side=tk.LEFT, padx=10, pady=10)
+
+    info_frame = tk.Frame(card, bg=STYLE['frame_bg'])
+    info_frame.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=10)
+    card.name_label = ttk.Label(info_frame, style="Bold.TLabel")
+    card.name_label.pack(anchor="w")
+    card.price_label = ttk.Label(info_frame, style="TLabel")
+    card.price_label.pack(anchor="w")
+    btn_frame = tk.Frame(card, bg=STYLE['frame_bg'])
+    btn_frame.pack(side=tk.RIGHT, padx=10)
+    card.cart_button = ttk.Button(btn_frame, text="Add to Cart")
+    card.cart_button.pack(fill=tk.X, pady=2)
+    card.wishlist_button = ttk.Button(btn_frame, text="Add to Wishlist")
+    card.wishlist_button.pack(fill=tk.X, pady=2)
+    return card
+
+def update_product_card(card, name, data):
+    """Shows an item's name, price and thumbnail on an existing (possibly recycled) product card."""
+    card.name_label.config(text=name)
+    card.cart_button.config(command=lambda n=name: add_to_cart(n))
+    card.wishlist_button.config(command=lambda n=name: add_to_wishlist(n))
+    card.price_label.config(text=f"${data['price']}")
+    try:
+        full_path = get_image_path(data['image'], (100, 100))
+        photo = get_thumbnail(full_path, (100, 100)) # Decoded once, then served from the cache
+        card.img_label.config(image=photo, text="", width=0, height=0, bg=STYLE['frame_bg'])
+        card.img_label.image = photo
+    except FileNotFoundError:
+        logging.warning("Image file not found: %s. Displaying placeholder.", full_path)
+        card.img_label.config(image="", text="No Image", width=12, height=6, bg="#CCC")
+        card.img_label.image = None
+    except Exception as e:
+        logging.error("Error loading image %s: %s. Displaying placeholder.", full_path, e)
+        card.img_label.config(image="", text="Image Error", width=12, height=6, bg="#F00")
+        card.img_label.image = None
+
+def schedule_product_search(*args):
+    """Restarts the debounce timer; the search runs once input has been idle for SEARCH_DEBOUNCE_MS."""
+    global search_after_id
+    if search_after_id is not None:
+        root.after_cancel(search_after_id)
+    search_after_id = root.after(SEARCH_DEBOUNCE_MS, start_product_search)
+
+def start_product_search():
+    """Hands the current search and filters to the search worker, superseding any older query."""
+    global search_after_id, search_future, search_generation
+    search_after_id = None
+    search_generation += 1
+    if search_future is not None:
+        search_future.cancel() # Only succeeds if the worker hasn't picked it up yet
+    search_future = search_executor.submit(run_product_search, search_generation, search_var.get(), product_filters())
+    poll_future(search_future, show_product_results)
+
+def run_product_search(generation, query, filters):
+    """Runs on the search worker. Returns (generation, matches), or None if a newer query arrived."""
+    if generation != search_generation:
+        return None
+    return generation, shop.search(query, **filters)
+
+def parse_price_filter(text):
+    """Turns a price range entry into a number, or None when it is empty or not a number."""
+    try:
+        return float(text) if text.strip() else None
+    except ValueError:
+        return None
 
+def product_filters():
+    """Collects the filter and sort widgets' values as keyword arguments for shop.search."""
     product_type = product_var.get()
     style_type = style_var.get()
-    search_query = search_var.get().lower()
-
-    filtered_items = {
-        name: data for name, data in items.items()
-        if (product_type == "All" or data["product"] == product_type) and
-           (style_type == "All" or data["style"] == style_type) and
-           (search_query in name.lower() or search_query in data.get('desc', '').lower()) # Search in name and description
+    return {
+        "product": None if product_type == "All" else product_type,
+        "style": None if style_type == "All" else style_type,
+        "min_price": parse_price_filter(min_price_var.get()),
+        "max_price": parse_price_filter(max_price_var.get()),
+        "sort": SORT_LABELS[sort_var.get()],
     }
 
-    if not filtered_items:
-        ttk.Label(product_display_frame, text="No items match your search/filter.", style="TLabel").pack(pady=20)
+def show_product_results(result):
+    """Renders search results on the Tk thread unless they've been superseded."""
+    if result is None or result[0] != search_generation:
         return
+    with metrics.timer("products.render"):
+        product_rows.render([(name, items[name]) for name in result[1]])
 
-    for name, data in filtered_items.items():
-        card = tk.Frame(product_display_frame, relief=tk.RAISED, borderwidth=1, bg=STYLE['frame_bg'])
-        card.pack(fill=tk.X, padx=10, pady=5)
-        
-        try:
-            full_path = get_image_path(data['image'])
-            img = Image.open(full_path).resize((100, 100), Image.LANCZOS)
-            photo = ImageTk.PhotoImage(img)
-            img_label = tk.Label(card, image=photo, bg=STYLE['frame_bg'])
-            img_label.image = photo
-            img_label.pack(side=tk.LEFT, padx=10, pady=10)
-        except FileNotFoundError:
-            logging.warning(f"Image file not found: {full_path}. Displaying placeholder.")
-            img_label = tk.Label(card, text="No Image", width=12, height=6, bg="#CCC")
-            img_label.pack(side=tk.LEFT, padx=10, pady=10)
-        except Exception as e:
-            logging.error(f"Error loading image {full_path}: {e}. Displaying placeholder.")
-            img_label = tk.Label(card, text="Image Error", width=12, height=6, bg="#F00")
-            img_label.pack(side=tk.LEFT, padx=10, pady=10)
-
-        info_frame = tk.Frame(card, bg=STYLE['frame_bg'])
-        info_frame.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=10)
-        ttk.Label(info_frame, text=name, style="Bold.TLabel").pack(anchor="w")
-        ttk.Label(info_frame, text=f"${data['price']}", style="TLabel").pack(anchor="w")
-        btn_frame = tk.Frame(card, bg=STYLE['frame_bg'])
-        btn_frame.pack(side=tk.RIGHT, padx=10)
-        ttk.Button(btn_frame, text="Add to Cart", command=lambda n=name: add_to_cart(n)).pack(fill=tk.X, pady=2)
-        ttk.Button(btn_frame, text="Add to Wishlist", command=lambda n=name: add_to_wishlist(n)).pack(fill=tk.X, pady=2)
+@metrics.timed("products.update")
+def update_product_display():
+    """Updates the display of products based on current filters and search query, right away."""
+    global search_generation
+    search_generation += 1 # Results still in flight on the search worker are now stale
+
+    # Every search term must prefix a word of the name or description; best matches come first
+    matches = shop.search(search_var.get(), **product_filters())
+    filtered_items = [(name, items[name]) for name in matches]
+    # Cards are kept alive between renders, only the ones that changed are touched
+    product_rows.render(filtered_items)
 
 def add_to_cart(item_name):
     """Adds an item to the cart or increments its quantity."""
-    if not current_user: 
-        messagebox.showwarning("Not Logged In", "Please log in to add items to your cart.")
-        logging.info(f"Attempted to add '{item_name}' to cart without login.")
+    try:
+        shop.add_to_cart(session, item_name)
+    except ShopError as e:
+        messagebox.showwarning(e.title, str(e))
         return
-    cart_items[item_name] = cart_items.get(item_name, 0) + 1
-    update_cart_display()
+    state_changes.publish(CART)
     messagebox.showinfo("Added to Cart", f"Added {item_name} to your cart.")
-    logging.info(f"User '{current_user}' added '{item_name}' to cart. Current quantity: {cart_items[item_name]}.")
 
 def increase_cart_item(item_name):
     """Increases the quantity of a specific item in the cart."""
-    if item_name in cart_items:
-        cart_items[item_name] += 1
-        update_cart_display()
-        logging.info(f"User '{current_user}' increased quantity of '{item_name}' to {cart_items[item_name]}.")
+    try:
+        shop.increase_cart_item(session, item_name)
+    except ShopError as e:
+        messagebox.showwarning(e.title, str(e))
+        return
+    state_changes.publish(CART)
 
 def decrease_cart_item(item_name):
     """Decreases the quantity of a specific item in the cart, removing if quantity becomes zero."""
-    if item_name in cart_items:
-        cart_items[item_name] -= 1
-        if cart_items[item_name] <= 0:
-            del cart_items[item_name]
-            logging.info(f"User '{current_user}' removed '{item_name}' from cart (quantity reached 0).")
-        else:
-            logging.info(f"User '{current_user}' decreased quantity of '{item_name}' to {cart_items[item_name]}.")
-    update_cart_display()
+    shop.decrease_cart_item(session, item_name)
+    state_changes.publish(CART)
 
 def add_to_wishlist(item_name):
     """Adds an item to the current user's wishlist."""
-    if not current_user: 
-        messagebox.showwarning("Not Logged In", "Please log in to add items to your wishlist.")
-        logging.info(f"Attempted to add '{item_name}' to wishlist without login.")
+    try:
+        added = shop.add_to_wishlist(session, item_name)
+    except ShopError as e:
+        messagebox.showwarning(e.title, str(e))
         return
-    wishlist = user_data[current_user]['wishlist']
-    if item_name not in wishlist:
-        wishlist.append(item_name)
-        save_user_data()
+    if added:
         messagebox.showinfo("Wishlist", f"Added {item_name} to your wishlist.")
-        logging.info(f"User '{current_user}' added '{item_name}' to wishlist.")
-        update_profile_display()
+        state_changes.publish(WISHLIST)
     else:
         messagebox.showinfo("Wishlist", f"{item_name} is already in your wishlist.")
-        logging.info(f"User '{current_user}' attempted to add '{item_name}' to wishlist, but it was already there.")
 
 def remove_from_wishlist(item_name):
     """Removes an item from the current user's wishlist."""
-    if current_user and item_name in user_data[current_user]['wishlist']:
-        user_data[current_user]['wishlist'].remove(item_name)
-        save_user_data()
+    try:
+        removed = shop.remove_from_wishlist(session, item_name)
+    except ShopError as e:
+        messagebox.showerror(e.title, str(e))
+        return
+    if removed:
         messagebox.showinfo("Wishlist", f"Removed {item_name} from your wishlist.")
-        logging.info(f"User '{current_user}' removed '{item_name}' from wishlist.")
-        update_profile_display()
-    else:
-        logging.warning(f"Attempted to remove '{item_name}' from wishlist, but it was not found or user not logged in.")
+        state_changes.publish(WISHLIST)
+
+def create_cart_row(parent, name):
+    """Builds the widgets for one cart line; update_cart_row fills in quantity and price."""
+    item_frame = ttk.Frame(parent)
+    ttk.Label(item_frame, text=f"{name}").pack(side=tk.LEFT, padx=5)
+
+    qty_frame = ttk.Frame(item_frame)
+    qty_frame.pack(side=tk.LEFT, padx=5)
+    ttk.Button(qty_frame, text="-", width=2, command=lambda n=name: decrease_cart_item(n)).pack(side=tk.LEFT)
+    item_frame.qty_label = ttk.Label(qty_frame, width=4, anchor="center")
+    item_frame.qty_label.pack(side=tk.LEFT)
+    ttk.Button(qty_frame, text="+", width=2, command=lambda n=name: increase_cart_item(n)).pack(side=tk.LEFT)
+
+    item_frame.total_label = ttk.Label(item_frame)
+    item_frame.total_label.pack(side=tk.RIGHT, padx=5)
+    ttk.Button(item_frame, text="Remove", command=lambda n=name: decrease_cart_item(n)).pack(side=tk.RIGHT) # Use decrease for single item removal
+    return item_frame
+
+def update_cart_row(item_frame, name, data):
+    """Shows the current quantity and line total on an existing cart row."""
+    quantity, line_cents = data
+    item_frame.qty_label.config(text=f"x{quantity}")
+    item_frame.total_label.config(text=f"${format_cents(line_cents)}")
+
+def create_suggestion_button(parent, name):
+    return ttk.Button(parent, text=f"+ {name}", command=lambda n=name: add_to_cart(n))
 
 def update_cart_display():
     """Updates the shopping cart display with current items and total price."""
-    for widget in cart_display_frame.winfo_children(): 
-        widget.destroy()
-    
-    if not cart_items:
-        ttk.Label(cart_display_frame, text="Your cart is empty.", style="TLabel").pack(pady=20)
-        total_price_label.config(text="Total: $0.00")
-        return
+    snapshot = session.cart.snapshot()
+    cart_rows.render([(name, (qty, line_cents)) for name, qty, _, line_cents in snapshot.lines])
+    total_price_label.config(text=cart_totals_text(snapshot))
+    suggestions = shop.cart_suggestions(session)
+    suggestion_rows.render([(name, None) for name in suggestions])
+    if suggestions:
+        suggestions_frame.pack(fill=tk.X, pady=5, before=total_price_label)
+    else:
+        suggestions_frame.pack_forget()
 
-    subtotal = sum(items[name]['price'] * qty for name, qty in cart_items.items())
-    for name, quantity in cart_items.items():
-        price = items[name]['price']
-        item_frame = ttk.Frame(cart_display_frame); 
-        item_frame.pack(fill=tk.X, pady=2)
-        
-        ttk.Label(item_frame, text=f"{name}").pack(side=tk.LEFT, padx=5)
-        
-        qty_frame = ttk.Frame(item_frame)
-        qty_frame.pack(side=tk.LEFT, padx=5)
-        ttk.Button(qty_frame, text="-", width=2, command=lambda n=name: decrease_cart_item(n)).pack(side=tk.LEFT)
-        ttk.Label(qty_frame, text=f"x{quantity}", width=4, anchor="center").pack(side=tk.LEFT)
-        ttk.Button(qty_frame, text="+", width=2, command=lambda n=name: increase_cart_item(n)).pack(side=tk.LEFT)
-
-        ttk.Label(item_frame, text=f"${price * quantity:.2f}").pack(side=tk.RIGHT, padx=5)
-        ttk.Button(item_frame, text="Remove", command=lambda n=name: decrease_cart_item(n)).pack(side=tk.RIGHT) # Use decrease for single item removal
-
-    final_total = subtotal * applied_discount
-    subtotal_text = f"Subtotal: ${subtotal:.2f}"
+def cart_totals_text(snapshot):
+    """Formats the subtotal, discount and total lines shown in the cart and at checkout."""
+    if not snapshot.lines:
+        return "Total: $0.00"
+    subtotal_text = f"Subtotal: ${format_cents(snapshot.subtotal_cents)}"
     discount_text = ""
-    if applied_discount < 1.0: 
-        discount_amount = subtotal * (1 - applied_discount)
-        discount_text = f"Discount: -${discount_amount:.2f}"
-    
-    total_price_label.config(text=f"{subtotal_text}\n{discount_text}\nTotal: ${final_total:.2f}")
+    if snapshot.discount_cents > 0: 
+        discount_text = f"Discount: -${format_cents(snapshot.discount_cents)}"
+    return f"{subtotal_text}\n{discount_text}\nTotal: ${format_cents(snapshot.total_cents)}"
 
 def apply_coupon():
     """Applies a coupon code to the cart total."""
-    global applied_discount
-    coupon_code = entry_coupon.get().upper()
-    if coupon_code == "DISCOUNT20":
-        applied_discount = 0.80
-        messagebox.showinfo("Coupon Applied", "20% discount has been applied to your cart!")
-        logging.info(f"User '{current_user}' applied 'DISCOUNT20' coupon.")
-    else:
-        applied_discount = 1.0
-        messagebox.showerror("Invalid Coupon", "The entered coupon code is not valid.")
-        logging.warning(f"User '{current_user}' attempted to apply invalid coupon: '{coupon_code}'.")
-    update_cart_display()
-    update_checkout_display() # Also update checkout view
+    try:
+        promotion = shop.apply_coupon(session, entry_coupon.get())
+        if session.cart.discount_cents:
+            messagebox.showinfo("Coupon Applied", f"{promotion.code} has been applied to your cart: {promotion.description}!")
+        else:
+            messagebox.showinfo("Coupon Applied", f"{promotion.code} ({promotion.description}) will take effect once your cart qualifies.")
+    except ShopError as e:
+        messagebox.showerror(e.title, str(e))
+    state_changes.publish(CART) # The cart and checkout views pick up the new discount
 
 def show_checkout():
     """Navigates to the checkout tab if conditions are met."""
-    if not current_user: 
+    if not session.user: 
         messagebox.showwarning("Not Logged In", "Please log in to proceed.")
         return
-    if not cart_items: 
+    if not session.cart: 
         messagebox.showerror("Empty Cart", "Your cart is empty.")
         return
-    update_checkout_display()
-    notebook.select(frame_checkout)
+    notebook.select(frame_checkout) # The summary is re-rendered if the cart changed since it was last shown
 
 def update_checkout_display():
     """Updates the order summary in the checkout tab."""
+    global checkout_key
+    checkout_key = uuid.uuid4().hex # A changed cart is a new order
     checkout_summary_text.config(state=tk.NORMAL)
     checkout_summary_text.delete(1.0, tk.END)
-    if not cart_items:
+    snapshot = session.cart.snapshot() # Same numbers the cart tab shows
+    if not snapshot.lines:
         checkout_summary_text.insert(tk.END, "Your cart is empty.")
     else:
         checkout_summary_text.insert(tk.END, "Order Summary:\n\n")
-        for name, qty in cart_items.items():
-            checkout_summary_text.insert(tk.END, f"- {name} (x{qty}): ${items[name]['price'] * qty:.2f}\n")
-        checkout_summary_text.insert(tk.END, f"\n{total_price_label.cget('text')}")
+        for name, qty, _, line_cents in snapshot.lines:
+            checkout_summary_text.insert(tk.END, f"- {name} (x{qty}): ${format_cents(line_cents)}\n")
+        checkout_summary_text.insert(tk.END, f"\n{cart_totals_text(snapshot)}")
     checkout_summary_text.config(state=tk.DISABLED)
 
 def proceed_to_payment():
-    """Processes the payment, saves the order, and clears the cart."""
-    global cart_items, applied_discount
-    if not current_user: # Should not happen if show_checkout is used, but for robustness
-        messagebox.showerror("Error", "No user logged in to place order.")
-        return
-
-    if not cart_items: # Should not happen if show_checkout is used
-        messagebox.showerror("Error", "Cart is empty, cannot proceed with payment.")
+    """Hands the cart to the order service; finish_payment confirms the order once it is saved."""
+    global payment_future
+    try:
+        future = shop.submit_order(session, checkout_key)
+    except ShopError as e:
+        messagebox.showerror(e.title, str(e))
         return
-
-    new_order = {
-        "order_id": f"ORD-{int(datetime.now().timestamp())}",
-        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "items": cart_items.copy(),
-        "total": sum(items[name]['price'] * qty for name, qty in cart_items.items()) * applied_discount
-    }
-    user_data[current_user]['orders'].append(new_order); 
-    save_user_data()
+    if future is payment_future and not future.done():
+        return # This order is already being saved
+    payment_future = future
+    pay_button.config(state=tk.DISABLED)
+    poll_future(future, finish_payment, on_error=payment_error)
+
+def finish_payment(new_order):
+    """Confirms a saved order and shows it in the profile."""
+    pay_button.config(state=tk.NORMAL)
     messagebox.showinfo("Payment Successful", f"Your order {new_order['order_id']} has been placed!")
-    logging.info(f"User '{current_user}' placed order {new_order['order_id']} for total ${new_order['total']:.2f}.")
-    cart_items = {}; 
-    applied_discount = 1.0
-    update_all_dynamic_displays()
+    state_changes.publish(CART, ORDERS)
     notebook.select(frame_profile)
 
-def update_profile_display():
-    """Updates the user profile display with personal info, wishlist, and order history."""
-    for widget in profile_display_frame.winfo_children(): 
+def payment_error(error):
+    """Reports an order that could not be saved and puts its items back in the cart."""
+    pay_button.config(state=tk.NORMAL)
+    if isinstance(error, OrderNotSaved) and shop.restore_cart(session, error.context):
+        messagebox.showerror("Payment Failed", f"Your order could not be saved: {error}\nThe items are back in your cart.")
+    else:
+        messagebox.showerror("Payment Failed", f"Your order could not be saved: {error}")
+    state_changes.publish(CART)
+
+def create_wishlist_row(parent, item_name):
+    """Builds one wishlist line with its remove button."""
+    item_frame = ttk.Frame(parent)
+    ttk.Label(item_frame, text=f"- {item_name}").pack(side=tk.LEFT)
+    ttk.Button(item_frame, text="Remove", command=lambda n=item_name: remove_from_wishlist(n)).pack(side=tk.RIGHT)
+    return item_frame
+
+def create_order_row(parent, position):
+    """Builds the summary line for one past order; its line items are only built when expanded."""
+    order_frame = ttk.LabelFrame(parent, padding=10)
+    summary_frame = ttk.Frame(order_frame)
+    summary_frame.pack(fill=tk.X)
+    order_frame.summary_label = ttk.Label(summary_frame, style="Bold.TLabel")
+    order_frame.summary_label.pack(side=tk.LEFT)
+    order_frame.details_button = ttk.Button(summary_frame, text="Details", command=lambda: toggle_order_details(order_frame))
+    order_frame.details_button.pack(side=tk.RIGHT)
+    order_frame.details_frame = ttk.Frame(order_frame)
+    order_frame.order = None
+    return order_frame
+
+def update_order_row(order_frame, position, order):
+    """Shows an order's date, item count and total, collapsed."""
+    order_frame.order = order
+    order_frame.config(text=f"Order {order['order_id']} ({order['date']})")
+    order_frame.summary_label.config(text=f"{sum(order['items'].values())} item(s) - Total: ${order['total']:.2f}")
+    for widget in order_frame.details_frame.winfo_children():
         widget.destroy()
-    
-    if not current_user: 
-        ttk.Label(profile_display_frame, text="Please log in to view your profile.", style="TLabel").pack(pady=20)
+    order_frame.details_frame.pack_forget()
+    order_frame.details_button.config(text="Details")
+
+def toggle_order_details(order_frame):
+    """Expands or collapses an order's line items, building them the first time."""
+    details_frame = order_frame.details_frame
+    if details_frame.winfo_manager():
+        details_frame.pack_forget()
+        order_frame.details_button.config(text="Details")
+        return
+    if not details_frame.winfo_children():
+        for name, qty in order_frame.order['items'].items(): 
+            ttk.Label(details_frame, text=f"- {name} (x{qty})").pack(anchor="w")
+    details_frame.pack(fill=tk.X, pady=(5, 0))
+    order_frame.details_button.config(text="Hide")
+
+def show_order_history():
+    """Renders the pages of order history loaded so far, most recent orders first."""
+    # Keyed by position counted from the oldest order, which stays the same as new orders arrive
+    order_rows.render([(order_total - i, order) for i, order in enumerate(shown_orders)])
+    order_history_label.config(text=f"Order History ({order_total})" if order_total else "Order History")
+
+def load_more_orders():
+    """Appends the next page of order history, if there is one."""
+    global order_load_pending
+    order_load_pending = False
+    if not session.user or len(shown_orders) >= order_total:
+        return
+    shown_orders.extend(shop.order_history(session, len(shown_orders), ORDER_PAGE_SIZE))
+    show_order_history()
+
+def on_profile_scroll(first, last):
+    """Scrollbar callback for the profile canvas; loads another page of orders near the bottom."""
+    global order_load_pending
+    scrollbar_profile.set(first, last)
+    if float(last) >= 0.98 and not order_load_pending and len(shown_orders) < order_total:
+        order_load_pending = True
+        root.after_idle(load_more_orders) # Not while Tk is still laying out the canvas
+
+def update_profile_display(changed=TOPICS):
+    """Updates the user profile display with personal info and whichever of wishlist and order history changed."""
+    global profile_shown_user, order_total
+    if session.user != profile_shown_user:
+        # Different account: drop the previous user's rows instead of keeping them hidden
+        wishlist_rows.clear()
+        order_rows.clear()
+        profile_shown_user = session.user
+
+    if not session.user: 
+        profile_content_frame.pack_forget()
+        profile_guest_label.pack(pady=20)
         return
     
-    user_info = user_data[current_user]
-    header_frame = ttk.Frame(profile_display_frame); 
-    header_frame.pack(fill=tk.X, pady=10)
-    
-    ttk.Label(header_frame, text=f"Welcome, {current_user}!", style="Title.TLabel").pack(side=tk.LEFT)
-    ttk.Button(header_frame, text="Logout", command=logout).pack(side=tk.RIGHT)
-    
-    ttk.Label(profile_display_frame, text=f"Email: {user_info['email']}", style="Bold.TLabel").pack(anchor="w", padx=10)
-    
-    # --- Wishlist Section ---
-    ttk.Separator(profile_display_frame, orient='horizontal').pack(fill='x', pady=15)
-    ttk.Label(profile_display_frame, text="Your Wishlist", style="Bold.TLabel").pack(anchor="w", padx=10)
-    wishlist_frame = ttk.Frame(profile_display_frame); 
-    wishlist_frame.pack(fill=tk.X, padx=10)
-    
-    if not user_info['wishlist']: 
-        ttk.Label(wishlist_frame, text="Your wishlist is empty.").pack(pady=5)
-    else:
-        for item_name in user_info['wishlist']:
-            item_frame = ttk.Frame(wishlist_frame); 
-            item_frame.pack(fill=tk.X, pady=2)
-            ttk.Label(item_frame, text=f"- {item_name}").pack(side=tk.LEFT)
-            ttk.Button(item_frame, text="Remove", command=lambda n=item_name: remove_from_wishlist(n)).pack(side=tk.RIGHT)
-    
-    # --- Order History Section ---
-    ttk.Separator(profile_display_frame, orient='horizontal').pack(fill='x', pady=15)
-    ttk.Label(profile_display_frame, text="Order History", style="Bold.TLabel").pack(anchor="w", padx=10)
-    history_frame = ttk.Frame(profile_display_frame); 
-    history_frame.pack(fill=tk.BOTH, expand=True, padx=10)
-    
-    if not user_info['orders']: 
-        ttk.Label(history_frame, text="You have no past orders.").pack(pady=5)
-    else:
-        for order in reversed(user_info['orders']): # Display most recent orders first
-            order_frame = ttk.LabelFrame(history_frame, text=f"Order {order['order_id']} ({order['date']})", padding=10)
-            order_frame.pack(fill=tk.X, pady=5)
-            for name, qty in order['items'].items(): 
-                ttk.Label(order_frame, text=f"- {name} (x{qty})").pack(anchor="w")
-            ttk.Label(order_frame, text=f"Total: ${order['total']:.2f}", style="Bold.TLabel").pack(anchor="e")
-
-    # This is important for the scrollbar to work correctly with dynamically added content
-    profile_display_frame.update_idletasks()
-    canvas_profile.config(scrollregion=canvas_profile.bbox("all"))
-
-
-def update_all_dynamic_displays():
-    """Calls all functions that update dynamic content across tabs."""
-    update_profile_display()
-    update_cart_display()
-    update_home_display()
-    update_checkout_display() # Ensure checkout summary is refreshed
+    user_info = shop.users[session.user]
+    profile_guest_label.pack_forget()
+    profile_content_frame.pack(fill=tk.BOTH, expand=True)
+    profile_welcome_label.config(text=f"Welcome, {session.user}!")
+    profile_email_label.config(text=f"Email: {user_info['email']}")
+
+    if USER in changed or WISHLIST in changed:
+        wishlist_rows.render([(item_name, item_name) for item_name in user_info['wishlist']])
+    if USER in changed or ORDERS in changed:
+        # Start over from the newest page; further pages load as the profile is scrolled
+        order_total = shop.order_count(session)
+        shown_orders[:] = shop.order_history(session, 0, ORDER_PAGE_SIZE)
+        show_order_history()
+
+
+def ensure_tab_built(frame):
+    """Builds a tab's widgets the first time it is needed."""
+    builder = tab_builders.pop(str(frame), None)
+    if builder is not None:
+        started = time.perf_counter()
+        builder()
+        elapsed = time.perf_counter() - started
+        metrics.observe("tab.build", elapsed)
+        logging.info("Built tab %s in %.1f ms.", notebook.tab(frame, 'text'), elapsed * 1000)
 
 def on_tab_changed(event):
-    """Event handler for notebook tab changes to update content."""
-    selected_tab = notebook.tab(notebook.select(), "text")
-    logging.info(f"Tab changed to: {selected_tab}")
-    if selected_tab == "Profile": 
-        update_profile_display()
-    elif selected_tab == "Shopping Cart": 
-        update_cart_display()
-    elif selected_tab == "Home": 
-        update_home_display()
-    elif selected_tab == "Checkout": 
-        update_checkout_display()
-    elif selected_tab == "Products":
-        update_product_display() # Ensure products are always refreshed on tab switch
+    """Event handler for notebook tab changes: builds the tab on its first visit and re-renders it if its data changed."""
+    selected = str(notebook.select())
+    ensure_tab_built(selected)
+    tab_name = notebook.tab(selected, 'text')
+    logging.info("Tab changed to: %s", tab_name, extra={"event": "tab_changed", "tab": tab_name})
+    view = tab_views.get(selected)
+    if view is not None:
+        view.refresh()
+
+def is_selected(frame):
+    """Returns a function telling whether 'frame' is the visible tab."""
+    return lambda: str(notebook.select()) == str(frame)
 
 def update_home_display():
     """Updates the home tab content based on login status."""
-    for widget in frame_home.winfo_children(): 
-        widget.destroy() # Clear existing widgets
-    
-    if current_user:
-        ttk.Label(frame_home, text=f"Welcome back, {current_user}!", style="Title.TLabel").pack(pady=20)
-        ttk.Label(frame_home, text="Check out our latest products or view your profile.", wraplength=400).pack(pady=10)
-        ttk.Button(frame_home, text="Go to Products", command=lambda: notebook.select(frame_products)).pack(pady=5)
-        ttk.Button(frame_home, text="View My Profile", command=lambda: notebook.select(frame_profile)).pack(pady=5)
+    if session.user:
+        home_guest_frame.pack_forget()
+        home_welcome_label.config(text=f"Welcome back, {session.user}!")
+        home_member_frame.pack(fill=tk.BOTH, expand=True)
+    else:
+        home_member_frame.pack_forget()
+        home_guest_frame.pack(fill=tk.BOTH, expand=True)
+
+def update_diagnostics_display():
+    """Shows the current latency percentiles and counters."""
+    diagnostics_text.config(state=tk.NORMAL)
+    diagnostics_text.delete(1.0, tk.END)
+    diagnostics_text.insert(tk.END, metrics.format_report())
+    diagnostics_text.config(state=tk.DISABLED)
+
+def export_diagnostics():
+    """Saves the collected timings and counters to a JSON file of the user's choosing."""
+    path = filedialog.asksaveasfilename(parent=root, initialdir=SCRIPT_DIR, defaultextension=".json",
+                                        initialfile=f"metrics-{datetime.now():%Y%m%d-%H%M%S}.json",
+                                        filetypes=[("JSON", "*.json")])
+    if not path:
+        return
+    try:
+        metrics.export(path)
+    except OSError as e:
+        messagebox.showerror("Export Failed", f"Could not write {path}: {e}")
+        return
+    logging.info("Exported metrics to %s.", path)
+    messagebox.showinfo("Diagnostics", f"Metrics saved to {path}.")
+
+def reset_diagnostics():
+    metrics.reset()
+    update_diagnostics_display()
+
+def toggle_diagnostics_tab(event=None):
+    """Shows or hides the Diagnostics tab, which isn't in the tab bar until asked for (Ctrl+Shift+D)."""
+    if str(frame_diagnostics) in notebook.tabs() and notebook.tab(frame_diagnostics, 'state') != 'hidden':
+        notebook.hide(frame_diagnostics)
+        return
+    notebook.add(frame_diagnostics, text='Diagnostics') # Also brings back a hidden tab
+    ensure_tab_built(frame_diagnostics)
+    notebook.select(frame_diagnostics)
+    update_diagnostics_display()
+
+def update_admin_access():
+    """Shows the Sales tab while the admin is logged in, and hides it otherwise."""
+    if shop.is_admin(session):
+        notebook.add(frame_admin, text='Sales') # Also brings back a hidden tab
+    elif str(frame_admin) in notebook.tabs():
+        notebook.hide(frame_admin)
+
+def format_sales_report(report):
+    """Formats a Shop.sales_report as plain-text tables."""
+    orders = report["orders"]
+    average = format_cents(report["revenue_cents"] // orders) if orders else "0.00"
+    lines = [f"Orders: {orders}   Units: {report['units']}   Revenue: ${format_cents(report['revenue_cents'])}   "
+             f"Average order: ${average}", ""]
+    for group, title in (("item", "Item"), ("product", "Product type"), ("style", "Style")):
+        lines.append(f"{title:<32}{'units':>8}{'revenue':>14}")
+        for value, units, cents in report[group]:
+            lines.append(f"{value[:31]:<32}{units:>8}{'$' + format_cents(cents):>14}")
+        lines.append("")
+    lines.append(f"{'Day':<16}{'orders':>8}{'units':>8}{'revenue':>14}")
+    for day, day_orders, units, cents in report["days"][-SALES_REPORT_DAYS:]:
+        lines.append(f"{day:<16}{day_orders:>8}{units:>8}{'$' + format_cents(cents):>14}")
+    return "\n".join(lines)
+
+def update_admin_display():
+    """Recomputes the sales report for the chosen date range off the Tk thread."""
+    if not shop.is_admin(session):
+        return
+    start, end = (entry.get().strip() or None for entry in (entry_sales_from, entry_sales_to))
+    poll_future(history_executor.submit(shop.sales_report, session, start, end), show_sales_report,
+                on_error=sales_report_error)
+
+def rebuild_sales_totals():
+    """Recounts every order in the store, then shows the fresh report."""
+    poll_future(history_executor.submit(shop.rebuild_analytics, session), lambda analytics: update_admin_display(),
+                on_error=sales_report_error)
+
+def show_sales_report(report):
+    sales_text.config(state=tk.NORMAL)
+    sales_text.delete(1.0, tk.END)
+    sales_text.insert(tk.END, format_sales_report(report))
+    sales_text.config(state=tk.DISABLED)
+
+def sales_report_error(error):
+    if isinstance(error, ShopError):
+        messagebox.showerror(error.title, str(error))
     else:
-        ttk.Label(frame_home, text="Welcome to MarketPlace Express", style="Title.TLabel").pack(pady=20)
-        ttk.Label(frame_home, text="Your one-stop shop for fashion. Please sign up or log in to continue.", wraplength=400).pack(pady=10)
-        ttk.Button(frame_home, text="Login", command=lambda: notebook.select(frame_login)).pack(pady=5)
-        ttk.Button(frame_home, text="Sign Up", command=lambda: notebook.select(frame_signup)).pack(pady=5)
+        messagebox.showerror("Sales Report", f"Could not compute the sales report: {error}")
 
 # --- GUI Setup ---
 root = tk.Tk()
@@ -543,6 +803,8 @@ frame_profile = ttk.Frame(notebook, padding=10)
 frame_coupons = ttk.Frame(notebook, padding=20)
 frame_login = ttk.Frame(notebook, padding=20)
 frame_signup = ttk.Frame(notebook, padding=20)
+frame_diagnostics = ttk.Frame(notebook, padding=10) # Hidden until toggle_diagnostics_tab
+frame_admin = ttk.Frame(notebook, padding=10) # Only in the tab bar while the admin is logged in
 
 # Add tabs to the notebook
 notebook.add(frame_home, text='Home')
@@ -554,93 +816,257 @@ notebook.add(frame_coupons, text='Coupons')
 notebook.add(frame_login, text='Login')
 notebook.add(frame_signup, text='Sign Up')
 
-# --- Home, Signup, Login Frames (Content) ---
-update_home_display() # Initialize home display
-
-# Signup Frame
-ttk.Label(frame_signup, text="Create a New Account", style="Title.TLabel").pack(pady=10)
-ttk.Label(frame_signup, text="Username").pack()
-entry_username = ttk.Entry(frame_signup, width=30); entry_username.pack(pady=2)
-ttk.Label(frame_signup, text="Password").pack()
-entry_password = ttk.Entry(frame_signup, show="*", width=30); entry_password.pack(pady=2)
-ttk.Label(frame_signup, text="Email").pack()
-entry_email = ttk.Entry(frame_signup, width=30); entry_email.pack(pady=2)
-ttk.Button(frame_signup, text="Submit", command=submit_signup).pack(pady=20)
-
-# Login Frame
-ttk.Label(frame_login, text="Welcome Back!", style="Title.TLabel").pack(pady=10)
-ttk.Label(frame_login, text="Username").pack()
-entry_login_username = ttk.Entry(frame_login, width=30); entry_login_username.pack(pady=2)
-ttk.Label(frame_login, text="Password").pack()
-entry_login_password = ttk.Entry(frame_login, show="*", width=30); entry_login_password.pack(pady=2)
-ttk.Button(frame_login, text="Login", command=login).pack(pady=20)
-
-# --- Products Frame (Content) ---
-filter_frame = ttk.Frame(frame_products, padding=10); filter_frame.pack(fill=tk.X)
-ttk.Label(filter_frame, text="Search:").pack(side=tk.LEFT, padx=(0, 5))
-search_var = tk.StringVar()
-search_entry = ttk.Entry(filter_frame, textvariable=search_var)
-search_entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
-search_entry.bind("<KeyRelease>", lambda event: update_product_display()) # Live search
-
-product_var = tk.StringVar(value="All")
-ttk.Combobox(filter_frame, textvariable=product_var, values=["All"] + list(set(d['product'] for d in items.values())), state="readonly", width=10).pack(side=tk.LEFT, padx=5)
-product_var.trace_add("write", lambda *args: update_product_display()) # Update on combobox change
-
-style_var = tk.StringVar(value="All")
-ttk.Combobox(filter_frame, textvariable=style_var, values=["All"] + list(set(d['style'] for d in items.values())), state="readonly", width=10).pack(side=tk.LEFT, padx=5)
-style_var.trace_add("write", lambda *args: update_product_display()) # Update on combobox change
-
-ttk.Button(filter_frame, text="Clear Filters", command=clear_product_filters).pack(side=tk.LEFT, padx=5)
-
-# Product display area with scrollbar
-canvas = tk.Canvas(frame_products, bg=STYLE['frame_bg']); 
-scrollbar = ttk.Scrollbar(frame_products, orient="vertical", command=canvas.yview)
-product_display_frame = ttk.Frame(canvas); 
-product_display_frame.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-canvas.create_window((0, 0), window=product_display_frame, anchor="nw"); 
-canvas.configure(yscrollcommand=scrollbar.set)
-canvas.pack(side="left", fill="both", expand=True); 
-scrollbar.pack(side="right", fill="y")
-
-# --- Cart, Checkout, Coupons Frames (Content) ---
-ttk.Label(frame_cart, text="Your Shopping Cart", style="Title.TLabel").pack(pady=10)
-cart_display_frame = ttk.Frame(frame_cart, padding=10); 
-cart_display_frame.pack(fill=tk.BOTH, expand=True)
-total_price_label = ttk.Label(frame_cart, text="Total: $0.00", style="Bold.TLabel", justify=tk.RIGHT); 
-total_price_label.pack(pady=10, anchor="e")
-ttk.Button(frame_cart, text="Proceed to Checkout", command=show_checkout).pack(pady=10)
-
-ttk.Label(frame_checkout, text="Confirm Your Order", style="Title.TLabel").pack(pady=10)
-checkout_summary_text = tk.Text(frame_checkout, height=15, width=60, wrap=tk.WORD, state=tk.DISABLED, font=STYLE['font_normal'], relief=tk.FLAT, bg=STYLE['frame_bg'])
-checkout_summary_text.pack(pady=10, padx=10)
-ttk.Button(frame_checkout, text="Confirm and Pay", command=proceed_to_payment).pack(pady=20)
-
-ttk.Label(frame_coupons, text="Apply a Coupon", style="Title.TLabel").pack(pady=10)
-ttk.Label(frame_coupons, text="Enter Coupon Code: (Hint: DISCOUNT20)").pack(pady=5)
-entry_coupon = ttk.Entry(frame_coupons, width=30); entry_coupon.pack(pady=5)
-ttk.Button(frame_coupons, text="Apply Coupon", command=apply_coupon).pack(pady=10)
-
-# --- Profile Frame (Content) ---
-canvas_profile = tk.Canvas(frame_profile, bg=STYLE['frame_bg']); 
-scrollbar_profile = ttk.Scrollbar(frame_profile, orient="vertical", command=canvas_profile.yview)
-profile_display_frame = ttk.Frame(canvas_profile, padding=10); 
-profile_display_frame.bind("<Configure>", lambda e: canvas_profile.configure(scrollregion=canvas_profile.bbox("all")))
-canvas_profile.create_window((0, 0), window=profile_display_frame, anchor="nw", width=600); 
-canvas_profile.configure(yscrollcommand=scrollbar_profile.set)
-canvas_profile.pack(side="left", fill="both", expand=True); 
-scrollbar_profile.pack(side="right", fill="y")
+# --- Tab Contents ---
+# Each tab is filled in by its build_* function the first time it is shown (see ensure_tab_built)
+
+def build_home_tab():
+    """Builds both variants of the home tab; update_home_display only swaps them."""
+    global home_member_frame, home_welcome_label, home_guest_frame
+    home_member_frame = ttk.Frame(frame_home)
+    home_welcome_label = ttk.Label(home_member_frame, style="Title.TLabel")
+    home_welcome_label.pack(pady=20)
+    ttk.Label(home_member_frame, text="Check out our latest products or view your profile.", wraplength=400).pack(pady=10)
+    ttk.Button(home_member_frame, text="Go to Products", command=lambda: notebook.select(frame_products)).pack(pady=5)
+    ttk.Button(home_member_frame, text="View My Profile", command=lambda: notebook.select(frame_profile)).pack(pady=5)
+
+    home_guest_frame = ttk.Frame(frame_home)
+    ttk.Label(home_guest_frame, text="Welcome to MarketPlace Express", style="Title.TLabel").pack(pady=20)
+    ttk.Label(home_guest_frame, text="Your one-stop shop for fashion. Please sign up or log in to continue.", wraplength=400).pack(pady=10)
+    ttk.Button(home_guest_frame, text="Login", command=lambda: notebook.select(frame_login)).pack(pady=5)
+    ttk.Button(home_guest_frame, text="Sign Up", command=lambda: notebook.select(frame_signup)).pack(pady=5)
+
+def build_signup_tab():
+    global entry_username, entry_password, entry_email, signup_button
+    ttk.Label(frame_signup, text="Create a New Account", style="Title.TLabel").pack(pady=10)
+    ttk.Label(frame_signup, text="Username").pack()
+    entry_username = ttk.Entry(frame_signup, width=30); entry_username.pack(pady=2)
+    ttk.Label(frame_signup, text="Password").pack()
+    entry_password = ttk.Entry(frame_signup, show="*", width=30); entry_password.pack(pady=2)
+    ttk.Label(frame_signup, text="Email").pack()
+    entry_email = ttk.Entry(frame_signup, width=30); entry_email.pack(pady=2)
+    signup_button = ttk.Button(frame_signup, text="Submit", command=submit_signup)
+    signup_button.pack(pady=20)
+
+def build_login_tab():
+    global entry_login_username, entry_login_password, login_button
+    ttk.Label(frame_login, text="Welcome Back!", style="Title.TLabel").pack(pady=10)
+    ttk.Label(frame_login, text="Username").pack()
+    entry_login_username = ttk.Entry(frame_login, width=30); entry_login_username.pack(pady=2)
+    ttk.Label(frame_login, text="Password").pack()
+    entry_login_password = ttk.Entry(frame_login, show="*", width=30); entry_login_password.pack(pady=2)
+    login_button = ttk.Button(frame_login, text="Login", command=login)
+    login_button.pack(pady=20)
+
+def build_products_tab():
+    global search_var, product_var, style_var, min_price_var, max_price_var, sort_var
+    global canvas, scrollbar, product_display_frame, product_rows
+    filter_frame = ttk.Frame(frame_products, padding=10); filter_frame.pack(fill=tk.X)
+    ttk.Label(filter_frame, text="Search:").pack(side=tk.LEFT, padx=(0, 5))
+    search_var = tk.StringVar()
+    search_entry = ttk.Entry(filter_frame, textvariable=search_var)
+    search_entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+    search_var.trace_add("write", schedule_product_search) # Live search, debounced
+
+    product_var = tk.StringVar(value="All")
+    ttk.Combobox(filter_frame, textvariable=product_var, values=["All"] + items.facet_values("product"), state="readonly", width=10).pack(side=tk.LEFT, padx=5)
+    product_var.trace_add("write", schedule_product_search) # Update on combobox change
+
+    style_var = tk.StringVar(value="All")
+    ttk.Combobox(filter_frame, textvariable=style_var, values=["All"] + items.facet_values("style"), state="readonly", width=10).pack(side=tk.LEFT, padx=5)
+    style_var.trace_add("write", schedule_product_search) # Update on combobox change
+
+    ttk.Button(filter_frame, text="Clear Filters", command=clear_product_filters).pack(side=tk.LEFT, padx=5)
+
+    # Price range and sort order, on a second row
+    range_frame = ttk.Frame(frame_products, padding=(10, 0, 10, 10)); range_frame.pack(fill=tk.X)
+    ttk.Label(range_frame, text="Price: $").pack(side=tk.LEFT)
+    min_price_var = tk.StringVar()
+    ttk.Entry(range_frame, textvariable=min_price_var, width=8).pack(side=tk.LEFT)
+    ttk.Label(range_frame, text=" to $").pack(side=tk.LEFT)
+    max_price_var = tk.StringVar()
+    ttk.Entry(range_frame, textvariable=max_price_var, width=8).pack(side=tk.LEFT)
+    min_price_var.trace_add("write", schedule_product_search)
+    max_price_var.trace_add("write", schedule_product_search)
+
+    sort_var = tk.StringVar(value="Relevance")
+    ttk.Combobox(range_frame, textvariable=sort_var, values=list(SORT_LABELS), state="readonly", width=18).pack(side=tk.RIGHT, padx=5)
+    ttk.Label(range_frame, text="Sort by:").pack(side=tk.RIGHT)
+    sort_var.trace_add("write", schedule_product_search)
+
+    # Product display area with scrollbar
+    canvas = tk.Canvas(frame_products, bg=STYLE['frame_bg']); 
+    scrollbar = ttk.Scrollbar(frame_products, orient="vertical", command=canvas.yview)
+    canvas.pack(side="left", fill="both", expand=True); 
+    scrollbar.pack(side="right", fill="y")
+    if len(items) >= VIRTUAL_LIST_MIN_ITEMS:
+        # Large catalogs: only the cards inside the viewport exist, recycled while scrolling
+        product_rows = VirtualList(canvas, scrollbar, create_product_card, update_product_card, PRODUCT_CARD_HEIGHT,
+                                   empty_text="No items match your search/filter.")
+    else:
+        product_display_frame = ttk.Frame(canvas); 
+        product_display_frame.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
+        canvas.create_window((0, 0), window=product_display_frame, anchor="nw"); 
+        canvas.configure(yscrollcommand=scrollbar.set)
+        product_rows = KeyedRows(product_display_frame, create_product_card, update_product_card,
+                                 empty_text="No items match your search/filter.", fill=tk.X, padx=10, pady=5)
+
+def build_cart_tab():
+    global cart_display_frame, cart_rows, total_price_label, suggestions_frame, suggestion_rows
+    ttk.Label(frame_cart, text="Your Shopping Cart", style="Title.TLabel").pack(pady=10)
+    cart_display_frame = ttk.Frame(frame_cart, padding=10); 
+    cart_display_frame.pack(fill=tk.BOTH, expand=True)
+    cart_rows = KeyedRows(cart_display_frame, create_cart_row, update_cart_row, empty_text="Your cart is empty.", fill=tk.X, pady=2)
+    suggestions_frame = ttk.Frame(frame_cart, padding=(10, 0)) # Packed by update_cart_display when there is something to suggest
+    ttk.Label(suggestions_frame, text="Frequently bought together:", style="Bold.TLabel").pack(anchor="w")
+    suggestion_buttons = ttk.Frame(suggestions_frame); suggestion_buttons.pack(fill=tk.X, pady=5)
+    suggestion_rows = KeyedRows(suggestion_buttons, create_suggestion_button, lambda row, key, data: None, side=tk.LEFT, padx=(0, 5))
+    total_price_label = ttk.Label(frame_cart, text="Total: $0.00", style="Bold.TLabel", justify=tk.RIGHT); 
+    total_price_label.pack(pady=10, anchor="e")
+    ttk.Button(frame_cart, text="Proceed to Checkout", command=show_checkout).pack(pady=10)
+
+def build_checkout_tab():
+    global checkout_summary_text, pay_button
+    ttk.Label(frame_checkout, text="Confirm Your Order", style="Title.TLabel").pack(pady=10)
+    checkout_summary_text = tk.Text(frame_checkout, height=15, width=60, wrap=tk.WORD, state=tk.DISABLED, font=STYLE['font_normal'], relief=tk.FLAT, bg=STYLE['frame_bg'])
+    checkout_summary_text.pack(pady=10, padx=10)
+    pay_button = ttk.Button(frame_checkout, text="Confirm and Pay", command=proceed_to_payment)
+    pay_button.pack(pady=20)
+
+def build_coupons_tab():
+    global entry_coupon
+    ttk.Label(frame_coupons, text="Apply a Coupon", style="Title.TLabel").pack(pady=10)
+    ttk.Label(frame_coupons, text="Enter Coupon Code: (Hint: DISCOUNT20)").pack(pady=5)
+    entry_coupon = ttk.Entry(frame_coupons, width=30); entry_coupon.pack(pady=5)
+    ttk.Button(frame_coupons, text="Apply Coupon", command=apply_coupon).pack(pady=10)
+
+def build_diagnostics_tab():
+    global diagnostics_text
+    ttk.Label(frame_diagnostics, text="Diagnostics", style="Title.TLabel").pack(pady=10)
+    button_frame = ttk.Frame(frame_diagnostics); button_frame.pack(fill=tk.X)
+    ttk.Button(button_frame, text="Refresh", command=update_diagnostics_display).pack(side=tk.LEFT, padx=5)
+    ttk.Button(button_frame, text="Export...", command=export_diagnostics).pack(side=tk.LEFT, padx=5)
+    ttk.Button(button_frame, text="Reset", command=reset_diagnostics).pack(side=tk.LEFT, padx=5)
+    diagnostics_text = tk.Text(frame_diagnostics, height=25, width=80, wrap=tk.NONE, state=tk.DISABLED,
+                               font=("Courier", 9), relief=tk.FLAT, bg=STYLE['frame_bg'])
+    diagnostics_text.pack(fill=tk.BOTH, expand=True, pady=10)
+
+def build_admin_tab():
+    global entry_sales_from, entry_sales_to, sales_text
+    ttk.Label(frame_admin, text="Sales Analytics", style="Title.TLabel").pack(pady=10)
+    range_frame = ttk.Frame(frame_admin); range_frame.pack(fill=tk.X)
+    ttk.Label(range_frame, text="From (YYYY-MM-DD):").pack(side=tk.LEFT)
+    entry_sales_from = ttk.Entry(range_frame, width=12); entry_sales_from.pack(side=tk.LEFT, padx=5)
+    ttk.Label(range_frame, text="To:").pack(side=tk.LEFT)
+    entry_sales_to = ttk.Entry(range_frame, width=12); entry_sales_to.pack(side=tk.LEFT, padx=5)
+    ttk.Button(range_frame, text="Show", command=update_admin_display).pack(side=tk.LEFT, padx=5)
+    ttk.Button(range_frame, text="Rebuild Totals", command=rebuild_sales_totals).pack(side=tk.RIGHT, padx=5)
+    sales_text = tk.Text(frame_admin, height=25, width=80, wrap=tk.NONE, state=tk.DISABLED,
+                         font=("Courier", 9), relief=tk.FLAT, bg=STYLE['frame_bg'])
+    sales_text.pack(fill=tk.BOTH, expand=True, pady=10)
+
+def build_profile_tab():
+    global canvas_profile, scrollbar_profile, profile_display_frame, profile_guest_label, profile_content_frame
+    global profile_welcome_label, profile_email_label, wishlist_rows, order_history_label, order_rows
+    canvas_profile = tk.Canvas(frame_profile, bg=STYLE['frame_bg']); 
+    scrollbar_profile = ttk.Scrollbar(frame_profile, orient="vertical", command=canvas_profile.yview)
+    profile_display_frame = ttk.Frame(canvas_profile, padding=10); 
+    profile_display_frame.bind("<Configure>", lambda e: canvas_profile.configure(scrollregion=canvas_profile.bbox("all")))
+    canvas_profile.create_window((0, 0), window=profile_display_frame, anchor="nw", width=600); 
+    canvas_profile.configure(yscrollcommand=on_profile_scroll)
+    canvas_profile.pack(side="left", fill="both", expand=True); 
+    scrollbar_profile.pack(side="right", fill="y")
+
+    profile_guest_label = ttk.Label(profile_display_frame, text="Please log in to view your profile.", style="TLabel")
+    profile_content_frame = ttk.Frame(profile_display_frame)
+    header_frame = ttk.Frame(profile_content_frame); 
+    header_frame.pack(fill=tk.X, pady=10)
+    profile_welcome_label = ttk.Label(header_frame, style="Title.TLabel")
+    profile_welcome_label.pack(side=tk.LEFT)
+    ttk.Button(header_frame, text="Logout", command=logout).pack(side=tk.RIGHT)
+    profile_email_label = ttk.Label(profile_content_frame, style="Bold.TLabel")
+    profile_email_label.pack(anchor="w", padx=10)
+
+    # --- Wishlist Section ---
+    ttk.Separator(profile_content_frame, orient='horizontal').pack(fill='x', pady=15)
+    ttk.Label(profile_content_frame, text="Your Wishlist", style="Bold.TLabel").pack(anchor="w", padx=10)
+    wishlist_frame = ttk.Frame(profile_content_frame); 
+    wishlist_frame.pack(fill=tk.X, padx=10)
+    wishlist_rows = KeyedRows(wishlist_frame, create_wishlist_row, lambda row, key, data: None,
+                              empty_text="Your wishlist is empty.", empty_pady=5, fill=tk.X, pady=2)
+
+    # --- Order History Section ---
+    ttk.Separator(profile_content_frame, orient='horizontal').pack(fill='x', pady=15)
+    order_history_label = ttk.Label(profile_content_frame, text="Order History", style="Bold.TLabel")
+    order_history_label.pack(anchor="w", padx=10)
+    history_frame = ttk.Frame(profile_content_frame); 
+    history_frame.pack(fill=tk.BOTH, expand=True, padx=10)
+    order_rows = KeyedRows(history_frame, create_order_row, update_order_row,
+                           empty_text="You have no past orders.", empty_pady=5, fill=tk.X, pady=5)
+
+tab_builders = {
+    str(frame_home): build_home_tab,
+    str(frame_products): build_products_tab,
+    str(frame_cart): build_cart_tab,
+    str(frame_checkout): build_checkout_tab,
+    str(frame_profile): build_profile_tab,
+    str(frame_coupons): build_coupons_tab,
+    str(frame_login): build_login_tab,
+    str(frame_signup): build_signup_tab,
+    str(frame_diagnostics): build_diagnostics_tab,
+    str(frame_admin): build_admin_tab,
+}
+profile_shown_user = None
+shown_orders = []           # Orders loaded into the profile so far, newest first
+order_total = 0             # How many orders the shown user has in all
+order_load_pending = False  # A load_more_orders call is already scheduled
+
+# Tabs with content that depends on the session, and the state topics each one is drawn from.
+# A view is only re-rendered while its tab is visible; otherwise it waits until the tab is shown.
+tab_views = {
+    str(frame_home): state_changes.add_view([USER], lambda changed: update_home_display(), is_selected(frame_home)),
+    str(frame_products): state_changes.add_view([], lambda changed: update_product_display(), is_selected(frame_products)),
+    str(frame_cart): state_changes.add_view([CART], lambda changed: update_cart_display(), is_selected(frame_cart)),
+    str(frame_checkout): state_changes.add_view([CART], lambda changed: update_checkout_display(), is_selected(frame_checkout)),
+    str(frame_profile): state_changes.add_view([USER, WISHLIST, ORDERS], update_profile_display, is_selected(frame_profile)),
+    str(frame_admin): state_changes.add_view([USER, ORDERS], lambda changed: update_admin_display(), is_selected(frame_admin)),
+}
+state_changes.add_view([USER], lambda changed: update_admin_access(), lambda: True) # Not a tab: the Sales tab's place in the tab bar
+
 
 # --- Finalize ---
 notebook.pack(expand=True, fill='both', padx=10, pady=10)
-update_all_dynamic_displays() # Initial update for all dynamic content
-update_product_display() # Initial display of products
+ensure_tab_built(frame_home) # The only tab visible at startup; the rest are built on first visit
+tab_views[str(frame_home)].refresh()
+history_executor.submit(lambda: shop.recommendations) # Counts past orders off the UI thread, before the cart first needs them
 
 # Ensure data is saved on application close
 def on_closing():
+    search_executor.shutdown(wait=False, cancel_futures=True)
+    history_executor.shutdown(wait=False, cancel_futures=True)
+    auth.shutdown()
+    shop.close() # Waits for orders still being saved
     save_user_data()
+    user_store.close()
+    if METRICS_FILE:
+        try:
+            metrics.export(METRICS_FILE)
+        except OSError as e:
+            logging.error("Could not export metrics to %s: %s", METRICS_FILE, e)
     root.destroy()
     logging.info("Application closed.")
+    shutdown_logging()
+
+def report_startup_time():
+    """Logs (and optionally prints) how long it took from launch until the window was ready."""
+    startup_ms = (time.perf_counter() - STARTUP_STARTED) * 1000
+    metrics.observe("startup", startup_ms / 1000)
+    logging.info("Startup took %.1f ms.", startup_ms)
+    if STARTUP_TIMING:
+        print(f"Startup took {startup_ms:.1f} ms")
+    if STARTUP_TIMING == "exit":
+        on_closing()
 
 root.protocol("WM_DELETE_WINDOW", on_closing) # Bind closing event
+root.bind_all("<Control-D>", toggle_diagnostics_tab) # Ctrl+Shift+D (Shift makes the keysym a capital D)
+root.after_idle(report_startup_time) # Runs once the window has been drawn
 root.mainloop()
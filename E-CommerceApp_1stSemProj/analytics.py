@@ -0,0 +1,220 @@
+import heapq
+import threading
+from datetime import date
+
+try:
+    import numpy
+except ImportError:  # Optional: without NumPy the range queries run as plain Python loops
+    numpy = None
+
+from cart import to_cents
+from search import FACETS
+
+# --- Sales Analytics ---
+#
+# SalesAnalytics keeps running totals that dashboard questions read directly: units and
+# revenue per item, per product type and style, and per day. Each saved order adds to
+# them in O(items in the order), and from_orders() rebuilds them in one pass over the
+# store, so a report costs the same with a hundred orders or ten million.
+#
+# Revenue is what was charged: an order's discount is spread over its lines in proportion
+# to the price each item sold for, which the order keeps in 'unit_cents' (orders saved
+# before that fall back to today's catalog price, or to their units if the catalog no longer
+# has any of their items). So later price changes don't rewrite history, and per-item,
+# per-category and daily revenue all add up to the order totals (give or take a cent of
+# rounding per line).
+#
+# Breakdowns over a date range can't come from all-time totals, so OrderColumns exports
+# every order line into flat columns (day, item code, units, revenue) and answers them with
+# a mask and a bincount, vectorized with NumPy when it is installed.
+
+GROUPS = ("item",) + FACETS   # What totals can be grouped by
+UNKNOWN = "(not in catalog)"  # Product type/style of items the catalog no longer sells
+
+
+def _item_info(catalog, name, cache):
+    """Returns (list price in cents, product, style) for 'name', caching the Decimal conversion."""
+    info = cache.get(name)
+    if info is None:
+        product = catalog.get(name)
+        if product is None:
+            info = (0, UNKNOWN, UNKNOWN)
+        else:
+            info = (to_cents(product['price']),) + tuple(product[facet] for facet in FACETS)
+        cache[name] = info
+    return info
+
+
+def order_lines(order, catalog, cache):
+    """Yields (name, units, revenue cents, product, style) for each line of an order."""
+    sold_at = order.get("unit_cents") or {}
+    lines = []
+    for name, qty in order["items"].items():
+        cents, product, style = _item_info(catalog, name, cache)
+        lines.append((name, qty, sold_at.get(name, cents), product, style))
+    list_cents = sum(qty * cents for _, qty, cents, _, _ in lines)
+    units = sum(qty for _, qty, _, _, _ in lines)
+    total_cents = round(order["total"] * 100)
+    for name, qty, cents, product, style in lines:
+        if list_cents:
+            line_cents = round(qty * cents * total_cents / list_cents)
+        else:
+            line_cents = round(qty * total_cents / units) if units else 0
+        yield name, qty, line_cents, product, style
+
+
+class SalesAnalytics:
+    """Units and revenue per item, product type, style and day, kept current as orders are saved."""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.prices = {}                             # name -> (price cents, product, style), filled as items sell
+        self.totals = {group: {} for group in GROUPS}  # group -> value -> [units, revenue cents]
+        self.daily = {}                              # "YYYY-MM-DD" -> [orders, units, revenue cents]
+        self.orders = 0
+        self.revenue_cents = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_orders(cls, orders, catalog):
+        """Builds the totals in one pass over an iterable of order dicts."""
+        analytics = cls(catalog)
+        for order in orders:
+            analytics._add(order)
+        return analytics
+
+    def add_order(self, order):
+        """Counts one newly saved order."""
+        with self.lock:
+            self._add(order)
+
+    def _add(self, order):
+        items, products, styles = self.totals["item"], self.totals["product"], self.totals["style"]
+        units = 0
+        for name, qty, cents, product, style in order_lines(order, self.catalog, self.prices):
+            units += qty
+            for table, key in ((items, name), (products, product), (styles, style)):
+                row = table.get(key)
+                if row is None:
+                    table[key] = [qty, cents]
+                else:
+                    row[0] += qty
+                    row[1] += cents
+        total_cents = round(order["total"] * 100)
+        day = self.daily.get(order["date"][:10])
+        if day is None:
+            self.daily[order["date"][:10]] = [1, units, total_cents]
+        else:
+            day[0] += 1
+            day[1] += units
+            day[2] += total_cents
+        self.orders += 1
+        self.revenue_cents += total_cents
+
+    def summary(self):
+        """Returns {"orders", "revenue_cents", "units"} over every order."""
+        with self.lock:
+            units = sum(units for units, _ in self.totals["product"].values())
+            return {"orders": self.orders, "revenue_cents": self.revenue_cents, "units": units}
+
+    def top(self, group="item", k=10, by="revenue"):
+        """Returns the k (value, units, revenue cents) rows of 'group' with the most revenue (or units)."""
+        if group not in GROUPS:
+            raise ValueError(f"Unknown group: {group!r}")
+        column = 1 if by == "revenue" else 0
+        with self.lock:
+            rows = heapq.nlargest(k, self.totals[group].items(), key=lambda entry: entry[1][column])
+            return [(value, units, cents) for value, (units, cents) in rows]
+
+    def days(self, start=None, end=None):
+        """Returns (day, orders, units, revenue cents) for each day with orders from start to end (inclusive), oldest first."""
+        with self.lock:
+            rows = [(day, *totals) for day, totals in self.daily.items()
+                    if (start is None or day >= start) and (end is None or day <= end)]
+        return sorted(rows)
+
+
+class OrderColumns:
+    """Every order line as flat columns, for totals over any date range; NumPy arrays when available."""
+
+    def __init__(self, catalog, use_numpy=None):
+        self.use_numpy = numpy is not None if use_numpy is None else use_numpy
+        self.catalog = catalog
+        self.names = []                 # Item code -> name
+        self.code_of = {}               # Name -> item code
+        self.facets = {facet: [] for facet in FACETS}   # facet -> item code -> value
+        self.day, self.item, self.units, self.revenue = [], [], [], []
+
+    @classmethod
+    def from_orders(cls, orders, catalog, use_numpy=None):
+        """Exports an iterable of order dicts in one pass."""
+        table = cls(catalog, use_numpy)
+        prices = {}
+        day, item, units, revenue = table.day, table.item, table.units, table.revenue
+        for order in orders:
+            ordinal = date.fromisoformat(order["date"][:10]).toordinal()
+            for name, qty, cents, *facet_values in order_lines(order, catalog, prices):
+                code = table.code_of.get(name)
+                if code is None:
+                    code = table.code_of[name] = len(table.names)
+                    table.names.append(name)
+                    for facet, value in zip(FACETS, facet_values):
+                        table.facets[facet].append(value)
+                day.append(ordinal)
+                item.append(code)
+                units.append(qty)
+                revenue.append(cents)
+        if table.use_numpy:
+            table.day = numpy.array(day, dtype=numpy.int32)
+            table.item = numpy.array(item, dtype=numpy.int32)
+            table.units = numpy.array(units, dtype=numpy.int64)
+            table.revenue = numpy.array(revenue, dtype=numpy.int64)
+        return table
+
+    def __len__(self):
+        return len(self.day)
+
+    def totals(self, group="item", start=None, end=None):
+        """
+        Returns {value: [units, revenue cents]} of 'group' over the lines ordered from start
+        to end ("YYYY-MM-DD", inclusive; None means unbounded).
+        """
+        if group not in GROUPS:
+            raise ValueError(f"Unknown group: {group!r}")
+        first = date.fromisoformat(start).toordinal() if start else None
+        last = date.fromisoformat(end).toordinal() if end else None
+        if self.use_numpy:
+            units, revenue = self._item_totals_numpy(first, last)
+        else:
+            units, revenue = self._item_totals_python(first, last)
+        # Items were summed first; rolling them up into a facet only touches one row per distinct item
+        labels = self.names if group == "item" else self.facets[group]
+        result = {}
+        for code, label in enumerate(labels):
+            if units[code]:
+                row = result.setdefault(label, [0, 0])
+                row[0] += int(units[code])
+                row[1] += int(revenue[code])
+        return result
+
+    def _item_totals_numpy(self, first, last):
+        mask = None
+        if first is not None:
+            mask = self.day >= first
+        if last is not None:
+            mask = self.day <= last if mask is None else mask & (self.day <= last)
+        item, units, revenue = ((self.item, self.units, self.revenue) if mask is None
+                                else (self.item[mask], self.units[mask], self.revenue[mask]))
+        size = len(self.names)
+        # Float weights are exact here: per-item sums stay far below 2**53
+        return (numpy.bincount(item, weights=units, minlength=size),
+                numpy.bincount(item, weights=revenue, minlength=size))
+
+    def _item_totals_python(self, first, last):
+        units = [0] * len(self.names)
+        revenue = [0] * len(self.names)
+        for day, code, qty, cents in zip(self.day, self.item, self.units, self.revenue):
+            if (first is None or day >= first) and (last is None or day <= last):
+                units[code] += qty
+                revenue[code] += cents
+        return units, revenue
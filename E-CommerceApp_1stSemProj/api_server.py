@@ -0,0 +1,352 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import secrets
+import time
+from urllib.parse import urlsplit, parse_qs
+
+from cart import format_cents
+from catalog import load_catalog
+from applog import setup_logging
+from columns import SORT_RELEVANCE
+from promotions import load_coupon_definitions
+from core import Shop, ShopError, DEFAULT_ITEMS
+from inventory import STOCK_FILENAME
+from orders import OrderNotSaved
+from recommendations import TOP_K
+from storage import open_user_store
+import metrics
+
+# --- JSON API over the shop core ---
+#
+# A small HTTP/1.1 server on asyncio streams (standard library only). Every client
+# gets its own core.Session, identified by the token from POST /sessions and sent
+# back in the X-Session header, so many shoppers can use one Shop concurrently.
+#
+#   POST /sessions                          -> {"session": token}
+#   GET  /products?q=&product=&style=       -> {"products": [...]}
+#        &min_price=&max_price=&sort=          (sort: relevance, price_asc or price_desc)
+#                                              ('available': units left to reserve, null if not stock-tracked)
+#   GET  /products/related?item=&k=         -> {"related": [...]} (items most often ordered with it)
+#   POST /signup   {username, password, email}
+#   POST /login    {username, password}
+#   POST /logout
+#   GET  /cart                              -> {"items": {...}, "subtotal", "discount", "total"} (amounts as "12.34")
+#   POST /cart/add | /cart/increase | /cart/decrease   {item}
+#   POST /coupon   {code}
+#   POST /wishlist/add | /wishlist/remove  {item}
+#   POST /checkout                          -> {"order": {...}}
+#        (optional Idempotency-Key header: a retry with the same key returns the same order)
+#   GET  /orders?offset=&limit=             -> {"orders": [...], "total": n} (newest first)
+#   GET  /admin/sales?start=&end=&k=        -> sales totals, top items/types/styles and daily totals
+#        (admin session only; start and end as YYYY-MM-DD, both optional)
+#   GET  /metrics                           -> latency percentiles and counters (with --metrics)
+#
+# Shop errors come back as 400 {"error": title, "message": text}.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SESSION_TTL = 30 * 60      # Seconds of inactivity before a session is dropped
+MAX_BODY_BYTES = 64 * 1024
+MAX_PAGE_SIZE = 100        # Largest 'limit' accepted by GET /orders
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+               405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ApiServer:
+    """Routes JSON requests to a Shop, keeping one Session per client token."""
+
+    def __init__(self, shop):
+        self.shop = shop
+        self.sessions = {}   # token -> [Session, last used (monotonic seconds)]
+        self.last_prune = time.monotonic()
+        self.routes = {
+            ("POST", "/sessions"): self.create_session,
+            ("GET", "/products"): self.products,
+            ("GET", "/products/related"): self.related,
+            ("POST", "/signup"): self.signup,
+            ("POST", "/login"): self.login,
+            ("POST", "/logout"): self.logout,
+            ("GET", "/cart"): self.cart,
+            ("POST", "/cart/add"): self.cart_add,
+            ("POST", "/cart/increase"): self.cart_increase,
+            ("POST", "/cart/decrease"): self.cart_decrease,
+            ("POST", "/coupon"): self.coupon,
+            ("POST", "/wishlist/add"): self.wishlist_add,
+            ("POST", "/wishlist/remove"): self.wishlist_remove,
+            ("POST", "/checkout"): self.checkout,
+            ("GET", "/orders"): self.orders,
+            ("GET", "/admin/sales"): self.sales,
+            ("GET", "/metrics"): self.metrics_snapshot,
+        }
+
+    # --- Sessions ---
+
+    def _session(self, headers):
+        entry = self.sessions.get(headers.get("x-session", ""))
+        if entry is None:
+            raise HttpError(401, "Unknown or expired session; POST /sessions first")
+        entry[1] = time.monotonic()
+        return entry[0]
+
+    def _prune_sessions(self):
+        now = time.monotonic()
+        if now - self.last_prune < 60:
+            return
+        self.last_prune = now
+        for token in [t for t, (_, last_used) in self.sessions.items() if now - last_used > SESSION_TTL]:
+            del self.sessions[token]
+
+    async def _in_thread(self, function, *args):
+        """Runs a shop call that writes to the user store on the default executor, so a slow save can't stall other clients."""
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    # --- Handlers: (query, headers, body) -> JSON-serialisable dict ---
+
+    async def create_session(self, query, headers, body):
+        self._prune_sessions()
+        token = secrets.token_urlsafe(16)
+        self.sessions[token] = [self.shop.new_session(), time.monotonic()]
+        return {"session": token}
+
+    async def products(self, query, headers, body):
+        try:
+            min_price, max_price = (float(query[key]) if query.get(key) else None for key in ("min_price", "max_price"))
+            names = self.shop.search(query.get("q", ""), product=query.get("product"), style=query.get("style"),
+                                     min_price=min_price, max_price=max_price, sort=query.get("sort", SORT_RELEVANCE))
+        except ValueError as e:
+            raise HttpError(400, str(e))
+        available = self.shop.inventory.available
+        return {"products": [dict(self.shop.items[name], name=name, available=available(name)) for name in names]}
+
+    async def related(self, query, headers, body):
+        item = query.get("item", "")
+        if item not in self.shop.items:
+            raise HttpError(404, f"No product named {item!r}")
+        try:
+            k = min(max(int(query.get("k", 5)), 1), TOP_K)
+        except ValueError:
+            raise HttpError(400, "k must be an integer")
+        # In a thread: the first call counts every past order, which shouldn't stall other clients
+        related = await asyncio.get_running_loop().run_in_executor(None, self.shop.related_items, item, k)
+        return {"related": related}
+
+    async def signup(self, query, headers, body):
+        username, email = body.get("username", ""), body.get("email", "")
+        hashed = await asyncio.wrap_future(self.shop.check_signup(username, body.get("password", ""), email))
+        await self._in_thread(self.shop.finish_signup, username, hashed, email)
+        return {"username": username}
+
+    async def login(self, query, headers, body):
+        session = self._session(headers)
+        username = body.get("username", "")
+        result = await asyncio.wrap_future(self.shop.check_login(username, body.get("password", "")))
+        await self._in_thread(self.shop.finish_login, session, username, result)  # May save a rehashed password
+        return {"username": session.user}
+
+    async def logout(self, query, headers, body):
+        self.shop.logout(self._session(headers))
+        return {}
+
+    async def cart(self, query, headers, body):
+        snapshot = self._session(headers).cart.snapshot()
+        return {"items": {name: qty for name, qty, _, _ in snapshot.lines},
+                "subtotal": format_cents(snapshot.subtotal_cents),
+                "discount": format_cents(snapshot.discount_cents),
+                "total": format_cents(snapshot.total_cents)}
+
+    async def cart_add(self, query, headers, body):
+        session = self._session(headers)
+        self.shop.add_to_cart(session, body.get("item", ""))
+        return await self.cart(query, headers, body)
+
+    async def cart_increase(self, query, headers, body):
+        self.shop.increase_cart_item(self._session(headers), body.get("item", ""))
+        return await self.cart(query, headers, body)
+
+    async def cart_decrease(self, query, headers, body):
+        self.shop.decrease_cart_item(self._session(headers), body.get("item", ""))
+        return await self.cart(query, headers, body)
+
+    async def coupon(self, query, headers, body):
+        self.shop.apply_coupon(self._session(headers), body.get("code", ""))
+        return await self.cart(query, headers, body)
+
+    async def wishlist_add(self, query, headers, body):
+        return {"added": await self._in_thread(self.shop.add_to_wishlist, self._session(headers), body.get("item", ""))}
+
+    async def wishlist_remove(self, query, headers, body):
+        return {"removed": await self._in_thread(self.shop.remove_from_wishlist, self._session(headers), body.get("item", ""))}
+
+    async def checkout(self, query, headers, body):
+        session = self._session(headers)
+        future = self.shop.submit_order(session, headers.get("idempotency-key") or None)
+        try:
+            # Waiting here lets the event loop serve other checkouts, which are then saved in the same commit
+            return {"order": await asyncio.wrap_future(future)}
+        except OrderNotSaved as e:
+            self.shop.restore_cart(session, e.context)
+            raise ShopError("Save Error", f"Could not save your order: {e}")
+
+    async def orders(self, query, headers, body):
+        session = self._session(headers)
+        try:
+            offset = max(int(query.get("offset", 0)), 0)
+            limit = min(max(int(query.get("limit", 20)), 1), MAX_PAGE_SIZE)
+        except ValueError:
+            raise HttpError(400, "offset and limit must be integers")
+        return {"orders": self.shop.order_history(session, offset, limit), "total": self.shop.order_count(session)}
+
+    async def sales(self, query, headers, body):
+        session = self._session(headers)
+        try:
+            k = min(max(int(query.get("k", 10)), 1), MAX_PAGE_SIZE)
+        except ValueError:
+            raise HttpError(400, "k must be an integer")
+        # In a thread: the first report (or a new date range) reads every order from the store
+        report = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self.shop.sales_report(session, query.get("start") or None, query.get("end") or None, k))
+        rows = lambda entries: [{"name": value, "units": units, "revenue": format_cents(cents)}
+                                for value, units, cents in entries]
+        return {"orders": report["orders"], "units": report["units"], "revenue": format_cents(report["revenue_cents"]),
+                "items": rows(report["item"]), "products": rows(report["product"]), "styles": rows(report["style"]),
+                "days": [{"day": day, "orders": orders, "units": units, "revenue": format_cents(cents)}
+                         for day, orders, units, cents in report["days"]]}
+
+    async def metrics_snapshot(self, query, headers, body):
+        return metrics.snapshot()
+
+    # --- HTTP plumbing ---
+
+    async def dispatch(self, method, target, headers, raw_body):
+        """Runs one request and returns (status, response dict)."""
+        url = urlsplit(target)
+        handler = self.routes.get((method, url.path))
+        if handler is None:
+            if any(path == url.path for _, path in self.routes):
+                return 405, {"error": "Method Not Allowed"}
+            return 404, {"error": "Not Found"}
+        try:
+            body = json.loads(raw_body) if raw_body else {}
+            if not isinstance(body, dict):
+                raise ValueError("body must be a JSON object")
+        except ValueError as e:
+            return 400, {"error": "Bad Request", "message": str(e)}
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            with metrics.timer(f"api.{method} {url.path}"):
+                return 200, await handler(query, headers, body)
+        except ShopError as e:
+            return 400, {"error": e.title, "message": str(e)}
+        except HttpError as e:
+            return e.status, {"error": STATUS_TEXT[e.status], "message": str(e)}
+        except Exception as e:
+            logging.exception("Unhandled error in %s %s: %s", method, url.path, e)
+            return 500, {"error": "Internal Server Error"}
+
+    async def handle_connection(self, reader, writer):
+        """Serves requests on one keep-alive connection until the client closes it."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get("content-length", "0") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    # Without a usable length the body can't be skipped, so the connection can't be reused either
+                    status, response = 400, {"error": STATUS_TEXT[400], "message": "Invalid Content-Length"}
+                    keep_alive = False
+                elif length > MAX_BODY_BYTES:
+                    status, response = 413, {"error": STATUS_TEXT[413]}
+                    keep_alive = False
+                else:
+                    raw_body = await reader.readexactly(length) if length else b""
+                    status, response = await self.dispatch(method, target, headers, raw_body)
+                    keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+                payload = json.dumps(response).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host, port, shop):
+    api = ApiServer(shop)
+    server = await asyncio.start_server(api.handle_connection, host, port)
+    logging.info("API server listening on %s:%s", host, port)
+    print(f"Serving MarketPlace Express API on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the MarketPlace Express shop as a JSON API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--store", default=os.environ.get("MARKETPLACE_USER_STORE", "sqlite"),
+                        help="user store backend: sqlite, journal or json")
+    parser.add_argument("--data-dir", default=SCRIPT_DIR, help="directory holding the user store")
+    parser.add_argument("--catalog", default=os.environ.get("MARKETPLACE_CATALOG"),
+                        help="CSV or JSON Lines product feed (default: the built-in items)")
+    parser.add_argument("--coupons", default=os.environ.get("MARKETPLACE_COUPONS", os.path.join(SCRIPT_DIR, "coupons.json")),
+                        help="JSON list of coupon definitions (default: coupons.json, if present)")
+    parser.add_argument("--log-file", help="write JSON-lines logs here in the background instead of to stderr")
+    parser.add_argument("--metrics", action="store_true", help="collect timings and counters for GET /metrics")
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enable()
+    if args.log_file:
+        setup_logging(args.log_file)
+    else:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = open_user_store(args.store, args.data_dir)
+    store.load()
+    coupons = load_coupon_definitions(args.coupons) if os.path.exists(args.coupons) else None
+    shop = Shop(load_catalog(args.catalog) if args.catalog else DEFAULT_ITEMS, store, coupons,
+                os.path.join(args.data_dir, STOCK_FILENAME))
+    shop.ensure_default_admin()
+    try:
+        asyncio.run(serve(args.host, args.port, shop))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shop.close()
+        store.flush()
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+
+import metrics
+
+# --- Application Logging ---
+#
+# A log call only puts its record on a queue. A background thread turns records into
+# JSON lines and writes them in batches, rotating the file once it grows past max_bytes,
+# so logging from a Tk callback never waits on the disk:
+#
+#   {"ts": "2026-01-31T12:00:00.123", "level": "INFO", "logger": "root", "thread": "MainThread",
+#    "msg": "User 'bob' added 'Arrow Polo' to cart. Current quantity: 1.", "event": "cart_add", ...}
+#
+# Messages are formatted on the writer thread, so use %-style arguments rather than
+# f-strings, and pass values that won't change after the call. Fields passed with
+# extra={...} (such as "event") become keys of the JSON line.
+
+BATCH_SIZE = 256          # Most records written with one write()
+BATCH_WAIT = 0.2          # Seconds the first record of a batch waits for more to join it
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 3          # Rotated files kept: app_log.log.1 (newest) ... app_log.log.3
+
+# Attributes every LogRecord has; any others came from extra={...}
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+_STOP = object()
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queues records untouched; the writer thread does all formatting."""
+
+    def prepare(self, record):
+        return record
+
+
+def record_to_json(record):
+    """Returns one JSON line (with its newline) for a LogRecord."""
+    try:
+        message = record.getMessage()
+    except (TypeError, ValueError):
+        message = f"{record.msg} (bad log arguments: {record.args!r})"
+    event = {
+        "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+        "level": record.levelname,
+        "logger": record.name,
+        "thread": record.threadName,
+        "msg": message,
+    }
+    for key, value in vars(record).items():
+        if key not in _STANDARD_ATTRS:
+            event[key] = value
+    if record.exc_info:
+        event["exc"] = "".join(traceback.format_exception(*record.exc_info))
+    return json.dumps(event, default=str) + "\n"
+
+
+class BatchingLogWriter(threading.Thread):
+    """Drains the log queue, writing each batch of records as JSON lines with one write()."""
+
+    def __init__(self, path, log_queue, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT):
+        super().__init__(name="log-writer", daemon=True)
+        self.path = path
+        self.queue = log_queue
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.file = open(path, "a", encoding="utf-8")
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + BATCH_WAIT
+            while len(batch) < BATCH_SIZE and batch[-1] is not _STOP:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is _STOP
+            if stopping:
+                batch.pop()
+            if batch:
+                self._write(batch)
+            if stopping:
+                self.file.close()
+                return
+
+    def _write(self, batch):
+        try:
+            if self.file.closed:  # A rotation couldn't reopen it; try again
+                self.file = open(self.path, "a", encoding="utf-8")
+            data = "".join(record_to_json(record) for record in batch)
+            self.file.write(data)
+            self.file.flush()
+            metrics.count("log.bytes_written", len(data))
+            if self.file.tell() >= self.max_bytes:
+                self._rotate()
+        except (OSError, ValueError) as e:
+            # Nowhere to log this to; don't let a full disk (or a file left closed) kill the writer
+            sys.stderr.write(f"Could not write {len(batch)} log records to {self.path}: {e}\n")
+
+    def _rotate(self):
+        """Shifts app_log.log -> .1 -> .2 ..., dropping the oldest, and starts a new file."""
+        self.file.close()
+        try:
+            for n in range(self.backup_count - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{n}"):
+                    os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+            if self.backup_count:
+                os.replace(self.path, f"{self.path}.1")
+        finally:
+            # Reopened even if a rename failed; the file then keeps growing until the next rotation works
+            self.file = open(self.path, "a" if self.backup_count else "w", encoding="utf-8")
+
+
+_handler = None
+_writer = None
+
+
+def setup_logging(path, level=logging.INFO, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT):
+    """Sends the root logger's records through a queue to a batching JSON-lines writer for 'path'."""
+    global _handler, _writer
+    log_queue = queue.SimpleQueue()
+    _writer = BatchingLogWriter(path, log_queue, max_bytes, backup_count)
+    _writer.start()
+    _handler = _QueueHandler(log_queue)
+    root_logger = logging.getLogger()
+    root_logger.setLevel(level)
+    root_logger.addHandler(_handler)
+    atexit.register(shutdown_logging)  # Also flushes if the app exits without on_closing
+
+
+def shutdown_logging():
+    """Writes out every queued record and closes the log file."""
+    global _handler, _writer
+    if _writer is None:
+        return
+    logging.getLogger().removeHandler(_handler)
+    _handler.queue.put(_STOP)
+    _writer.join()
+    _handler = _writer = None
@@ -0,0 +1,99 @@
+import hmac
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+import metrics
+
+# --- Password Hashing Service ---
+#
+# bcrypt is deliberately slow, so all hashing runs on a small worker pool and callers
+# get a Future back. bcrypt releases the GIL while it works, so threads are enough to
+# use several cores and keep the Tk thread responsive.
+
+# Work factor for new hashes; existing hashes with a lower cost are upgraded on the next login
+BCRYPT_ROUNDS = int(os.environ.get("MARKETPLACE_BCRYPT_ROUNDS", "12"))
+AUTH_WORKERS = int(os.environ.get("MARKETPLACE_AUTH_WORKERS", "2"))
+
+_executor = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="auth")
+
+
+BCRYPT_PREFIXES = ("$2b$", "$2a$", "$2y$")
+
+
+def is_bcrypt_hash(value):
+    return value.startswith(BCRYPT_PREFIXES)
+
+
+def needs_rehash(stored):
+    """True for plaintext passwords and for hashes made with fewer than BCRYPT_ROUNDS rounds."""
+    if not is_bcrypt_hash(stored):
+        return True
+    try:
+        return int(stored.split("$")[2]) < BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False  # Malformed, verify_password will report it
+
+
+@metrics.timed("auth.hash")
+def hash_password(password):
+    """Returns the bcrypt hash of 'password' as a str. Blocks for as long as bcrypt takes."""
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+
+@metrics.timed("auth.verify")
+def verify_password(password, stored):
+    """
+    Checks 'password' against a stored bcrypt hash (or a legacy plaintext password).
+    Returns (matches, upgraded_hash); upgraded_hash is a fresh hash to store when the
+    password matched but the stored value is plaintext or uses a lower cost, else None.
+    Raises ValueError if the stored hash is malformed.
+    """
+    if is_bcrypt_hash(stored):
+        matches = bcrypt.checkpw(password.encode('utf-8'), stored.encode('utf-8'))
+    else:
+        matches = hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8'))
+    upgraded_hash = hash_password(password) if matches and needs_rehash(stored) else None
+    return matches, upgraded_hash
+
+
+def submit_hash(password):
+    """Hashes 'password' on the auth pool. Returns a Future with the hash."""
+    return _executor.submit(hash_password, password)
+
+
+def submit_verify(password, stored):
+    """Runs verify_password on the auth pool. Returns a Future with (matches, upgraded_hash)."""
+    return _executor.submit(verify_password, password, stored)
+
+
+def _rehash_plaintext(store, username, plaintext):
+    new_hash = hash_password(plaintext)
+    try:
+        with store.lock:
+            # Skip it if the password was changed while we were hashing
+            if store.users.get(username, {}).get("password") == plaintext:
+                store.set_password(username, new_hash)
+                logging.info("Rehashed legacy plaintext password for '%s'.", username)
+    except Exception as e:
+        logging.error("Could not save rehashed password for '%s': %s", username, e)
+
+
+def rehash_legacy_passwords(store):
+    """
+    Queues a background hash for every account still storing a plaintext password.
+    Low-cost bcrypt hashes can't be upgraded without the password, so they are
+    upgraded by verify_password on the user's next login instead.
+    """
+    with store.lock:
+        legacy = list(store.passwords(skip_prefixes=BCRYPT_PREFIXES))
+    for username, plaintext in legacy:
+        _executor.submit(_rehash_plaintext, store, username, plaintext)
+    return len(legacy)
+
+
+def shutdown():
+    """Stops the auth pool, dropping queued background rehashes (they are retried next start)."""
+    _executor.shutdown(wait=True, cancel_futures=True)
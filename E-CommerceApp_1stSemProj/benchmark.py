@@ -0,0 +1,405 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import auth
+from cart import Cart, to_cents
+from catalog import Catalog
+from columns import CatalogColumns, SORT_PRICE_ASC, numpy
+from core import Shop
+from search import SearchIndex
+from storage import open_user_store, SqliteUserStore
+
+# --- Benchmarks ---
+#
+# Headless timings of the hot paths on synthetic data, written as JSON so runs can be
+# compared over time:
+#
+#   python benchmark.py                                  # 1k/10k/100k, writes benchmark-results.json
+#   python benchmark.py --scales 1000 --compare old.json # fails if anything got >20% slower
+#   xvfb-run python benchmark.py --tk                    # also time profile rendering in Tk
+#
+# Catalogs, user bases and order histories are generated from --seed, so two runs on
+# the same machine time exactly the same work. Each timing is taken --repeat times and
+# reported as min/median/p95 milliseconds per operation.
+
+DEFAULT_SCALES = (1_000, 10_000, 100_000)
+BACKENDS = ("sqlite", "journal", "json")
+
+PRODUCT_TYPES = ("Pants", "Shirts", "Shoes", "Jackets", "Hats", "Bags", "Socks", "Dresses")
+STYLES = ("Daily", "Party", "Sport", "Formal", "Outdoor")
+BRANDS = ("Levis", "Arrow", "Pepe", "Van Heusen", "Allen Solly", "Raymond", "Puma", "Nike", "Zara", "Mango")
+WORDS = ("classic", "slim", "premium", "cotton", "denim", "linen", "casual", "stretch",
+         "vintage", "organic", "waterproof", "lightweight", "relaxed", "tailored", "soft")
+
+# (label, query, filters) timed by bench_search
+SEARCHES = (
+    ("browse_all", "", {}),
+    ("browse_facets", "", {"product": "Shirts", "style": "Party"}),
+    ("price_range_sorted", "", {"min_price": 20, "max_price": 80, "sort": SORT_PRICE_ASC}),
+    ("text", "denim", {}),
+    ("text_prefix", "pre", {}),
+    ("text_two_words_facet", "slim cotton", {"style": "Daily"}),
+)
+
+ORDER_PAGE_SIZE = 20  # Same page size as the profile tab
+MIN_COMPARED_MS = 0.01  # Faster timings are mostly timer noise, --compare doesn't flag them
+
+
+# --- Synthetic data ---
+
+def synthetic_catalog(size, rng):
+    """Builds a Catalog of 'size' generated products."""
+    catalog = Catalog()
+    for i in range(size):
+        product = rng.choice(PRODUCT_TYPES)
+        words = rng.sample(WORDS, 3)
+        catalog.add_row({
+            "name": f"{rng.choice(BRANDS)} {words[0].title()} {product} {i}",
+            "price": round(rng.uniform(5, 250), rng.choice((0, 2))),
+            "product": product,
+            "style": rng.choice(STYLES),
+            "desc": f"A {words[1]} {words[2]} {product.lower()} for every day.",
+            "image": "",
+        })
+    return catalog
+
+
+def synthetic_order(names, rng, number):
+    items = {name: rng.randint(1, 3) for name in rng.sample(names, rng.randint(1, 4))}
+    return {"order_id": f"ORD-{number}", "date": "2026-01-01 12:00:00", "items": items,
+            "total": round(rng.uniform(10, 500), 2)}
+
+
+def synthetic_users(size, names, rng, orders_per_user=3):
+    """Builds 'size' accounts in users.json format, each with a short wishlist and a few orders."""
+    password = auth.hash_password("password")  # Hashing once keeps generation fast; logins aren't timed here
+    users = {}
+    for i in range(size):
+        users[f"user{i}"] = {
+            "password": password,
+            "email": f"user{i}@example.com",
+            "wishlist": rng.sample(names, 3),
+            "orders": [synthetic_order(names, rng, i * orders_per_user + n) for n in range(orders_per_user)],
+        }
+    return users
+
+
+# --- Measuring ---
+
+def measure(func, repeat, number=1):
+    """Times 'repeat' samples of 'number' calls of func(). Returns seconds per call for each sample."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - started) / number)
+    return samples
+
+
+def record(results, name, scale, samples, **extra):
+    """Adds one result row; durations are milliseconds per operation."""
+    ordered = sorted(samples)
+    median = statistics.median(ordered)
+    results.append(dict({
+        "name": name,
+        "scale": scale,
+        "samples": len(ordered),
+        "min_ms": round(ordered[0] * 1000, 4),
+        "median_ms": round(median * 1000, 4),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 4),
+        "ops_per_s": round(1 / median, 1) if median else None,
+    }, **extra))
+    print(f"  {name:<40} {median * 1000:>10.3f} ms", flush=True)
+
+
+# --- Benchmarks ---
+
+def bench_catalog(results, scale, catalog, repeat):
+    record(results, "catalog.search_index_build", scale, measure(lambda: SearchIndex(catalog), max(1, repeat // 5)))
+    record(results, "catalog.columns_build", scale, measure(lambda: CatalogColumns(catalog), max(1, repeat // 5)))
+
+
+def bench_search(results, scale, shop, repeat):
+    shop.warm_up()  # Built up front; bench_catalog times the builds
+    for label, query, filters in SEARCHES:
+        matches = len(shop.search(query, **filters))
+        record(results, f"search.{label}", scale, measure(lambda: shop.search(query, **filters), repeat),
+               matches=matches)
+
+
+def bench_cart(results, scale, shop, rng, repeat):
+    """Re-pricing a cart of scale/100 lines (10 to 1000) with a product-scoped coupon applied."""
+    lines = max(1, min(scale // 100, len(shop.items)))
+    names = rng.sample(list(shop.items), lines)
+    promotion = shop.promotions.get("SHIRTS10") or next(iter(shop.promotions.values()))
+    cart = Cart()
+    cart.set_promotion(promotion)
+    for name in names:
+        cart.add(name, to_cents(shop.items[name]["price"]))
+
+    def fill():
+        filled = Cart()
+        filled.set_promotion(promotion)
+        for name in names:
+            filled.add(name, to_cents(shop.items[name]["price"]))
+        return filled.snapshot()
+
+    def change():
+        name = rng.choice(names)
+        cart.increase(name)
+        cart.decrease(name)
+    record(results, "cart.fill_and_total", scale, measure(fill, repeat), lines=lines)
+    record(results, "cart.change_quantity", scale, measure(change, repeat, number=10), lines=lines)
+    record(results, "cart.snapshot", scale, measure(cart.snapshot, repeat, number=10), lines=lines)
+
+
+def open_store(backend, directory):
+    store = open_user_store(backend, directory)
+    store.load()
+    return store
+
+
+def save_all(store, backend, users):
+    """Writes a whole user base into a freshly opened store, the way each backend bulk-saves."""
+    if backend == "sqlite":
+        store.import_users(users)
+    elif backend == "journal":
+        store.users = users
+        store.compact()
+    else:
+        store.users = users
+        store.flush()
+
+
+def bench_persistence(results, scale, users, backends, repeat):
+    """save_user_data/load_user_data round-trips: bulk save, reopen + first lookup, and single changes."""
+    usernames = list(users)
+    for backend in backends:
+        directory = tempfile.mkdtemp(prefix=f"bench-{backend}-")
+        try:
+            def save():
+                for name in os.listdir(directory):
+                    os.remove(os.path.join(directory, name))
+                store = open_store(backend, directory)
+                try:
+                    save_all(store, backend, users)
+                finally:
+                    store.close()
+
+            def load():
+                store = open_store(backend, directory)
+                try:
+                    store.users[usernames[-1]]["email"]  # SQLite reads accounts lazily
+                finally:
+                    store.close()
+
+            slow = backend == "json" and scale >= 10_000  # Every json change rewrites the whole file
+            record(results, f"persist.{backend}.save_all", scale, measure(save, max(1, repeat // 5)))
+            record(results, f"persist.{backend}.load", scale, measure(load, max(1, repeat // 5)))
+            store = open_store(backend, directory)
+            try:
+                def change():
+                    username = usernames[len(usernames) // 2]
+                    store.add_to_wishlist(username, "benchmark item")
+                    store.remove_from_wishlist(username, "benchmark item")
+                record(results, f"persist.{backend}.change", scale, measure(change, 3 if slow else repeat))
+                store.flush()
+            finally:
+                store.close()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_order_history(results, scale, names, rng, backends, repeat):
+    """One account with 'scale' orders: reading the newest page and the count, as the profile does."""
+    orders = [synthetic_order(names, rng, n) for n in range(scale)]
+    users = {"shopper": {"password": "x", "email": "shopper@example.com", "wishlist": [], "orders": orders}}
+    for backend in backends:
+        directory = tempfile.mkdtemp(prefix=f"bench-{backend}-")
+        try:
+            store = open_store(backend, directory)
+            save_all(store, backend, users)
+            store.close()
+            store = open_store(backend, directory)
+            try:
+                record(results, f"orders.{backend}.first_page", scale,
+                       measure(lambda: store.orders_page("shopper", 0, ORDER_PAGE_SIZE), repeat))
+                record(results, f"orders.{backend}.last_page", scale,
+                       measure(lambda: store.orders_page("shopper", max(scale - ORDER_PAGE_SIZE, 0), ORDER_PAGE_SIZE), repeat))
+                record(results, f"orders.{backend}.count", scale, measure(lambda: store.order_count("shopper"), repeat))
+            finally:
+                store.close()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_profile_render(results, scale, names, rng, repeat):
+    """Renders the first page of a 'scale'-order history and scrolls through ten more pages, in Tk."""
+    import tkinter as tk
+    from tkinter import ttk
+    from rendering import KeyedRows
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"  profile rendering skipped: {e}")
+        return
+    root.withdraw()
+    try:
+        store = SqliteUserStore(":memory:")
+        store.load()
+        store.add_user("shopper", "x", "shopper@example.com")
+        for n in range(scale):
+            store.add_order("shopper", synthetic_order(names, rng, n))
+
+        def create_row(parent, key):
+            frame = ttk.LabelFrame(parent, padding=10)
+            frame.summary_label = ttk.Label(frame)
+            frame.summary_label.pack(side=tk.LEFT)
+            ttk.Button(frame, text="Details").pack(side=tk.RIGHT)
+            return frame
+
+        def update_row(frame, key, order):
+            frame.config(text=f"Order {order['order_id']} ({order['date']})")
+            frame.summary_label.config(text=f"{sum(order['items'].values())} item(s) - Total: ${order['total']:.2f}")
+
+        def render():
+            container = ttk.Frame(root)
+            rows = KeyedRows(container, create_row, update_row, fill=tk.X)
+            shown = []
+            for page in range(11):
+                shown.extend(store.orders_page("shopper", len(shown), ORDER_PAGE_SIZE))
+                rows.render([(scale - i, order) for i, order in enumerate(shown)])
+                root.update_idletasks()
+            container.destroy()
+        record(results, "profile.render_11_pages", scale, measure(render, max(1, repeat // 5)))
+    finally:
+        root.destroy()
+
+
+def bench_login(results, logins, rounds):
+    """Throughput of concurrent bcrypt logins through the auth pool at cost 'rounds'."""
+    saved_rounds = auth.BCRYPT_ROUNDS
+    auth.BCRYPT_ROUNDS = rounds
+    try:
+        stored = auth.hash_password("password")
+        latencies = []
+
+        def timed_verify():
+            started = time.perf_counter()
+            auth.verify_password("password", stored)
+            latencies.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        futures = [auth._executor.submit(timed_verify) for _ in range(logins)]
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - started
+    finally:
+        auth.BCRYPT_ROUNDS = saved_rounds
+    record(results, "auth.login", None, latencies, bcrypt_rounds=rounds, workers=auth.AUTH_WORKERS,
+           logins_per_s=round(logins / elapsed, 2))
+
+
+# --- Running and comparing ---
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": numpy.__version__ if numpy is not None else None,
+    }
+
+
+def compare(results, baseline_path, threshold):
+    """Prints the change of every result against a previous run. Returns the names that got slower than threshold allows."""
+    with open(baseline_path, "r") as f:
+        baseline = {(row["name"], row["scale"]): row for row in json.load(f)["results"]}
+    regressions = []
+    print(f"\nCompared with {baseline_path}:")
+    for row in results:
+        old = baseline.get((row["name"], row["scale"]))
+        if old is None or not old["median_ms"]:
+            continue
+        noise = max(old["median_ms"], row["median_ms"]) < MIN_COMPARED_MS
+        ratio = row["median_ms"] / old["median_ms"]
+        flag = ""
+        if ratio > 1 + threshold and not noise:
+            flag = "  REGRESSION"
+            regressions.append(f"{row['name']} @ {row['scale']}")
+        print(f"  {row['name']:<40} {str(row['scale']):>7} {old['median_ms']:>10.3f} -> {row['median_ms']:>10.3f} ms ({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the MarketPlace Express hot paths on synthetic data.")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(DEFAULT_SCALES),
+                        help="catalog sizes, user counts and order history lengths to test (default: 1000 10000 100000)")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--repeat", type=int, default=20, help="samples per timing")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--bcrypt-rounds", type=int, default=auth.BCRYPT_ROUNDS)
+    parser.add_argument("--logins", type=int, default=4 * auth.AUTH_WORKERS, help="concurrent logins to time")
+    parser.add_argument("--tk", action="store_true", help="also time profile rendering (needs a display, e.g. xvfb-run)")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="results file of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="with --compare, exit with status 1 if a median is this much slower (default: 0.2 = 20%%)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    results = []
+    for scale in args.scales:
+        rng = random.Random(args.seed)
+        print(f"Scale {scale}:", flush=True)
+        catalog = synthetic_catalog(scale, rng)
+        names = list(catalog)
+        store = SqliteUserStore(":memory:")
+        store.load()
+        shop = Shop(catalog, store)
+        try:
+            bench_catalog(results, scale, catalog, args.repeat)
+            bench_search(results, scale, shop, args.repeat)
+            bench_cart(results, scale, shop, rng, args.repeat)
+            bench_persistence(results, scale, synthetic_users(scale, names, rng), args.backends, args.repeat)
+            bench_order_history(results, scale, names, rng, args.backends, args.repeat)
+            if args.tk:
+                bench_profile_render(results, scale, names, rng, args.repeat)
+        finally:
+            shop.close()  # Stops its order committer thread
+            store.close()
+    print(f"Logins ({args.logins} at bcrypt cost {args.bcrypt_rounds}, {auth.AUTH_WORKERS} workers):", flush=True)
+    bench_login(results, args.logins, args.bcrypt_rounds)
+    auth.shutdown()
+
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment(), "settings": vars(args), "results": results}, f, indent=4)
+    print(f"\nWrote {len(results)} results to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            sys.exit(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+
+# --- Shopping Cart ---
+#
+# Money is kept in integer cents so totals never pick up float rounding errors.
+# The cart updates its line totals, subtotal and discount on every change, so reading
+# a total is O(1) and the cart, checkout and order views always agree. The discount
+# comes from the applied promotion (see promotions.py), re-evaluated on every change.
+
+
+def to_cents(amount):
+    """Converts a price such as 39, 59.99 or "12.50" to integer cents."""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def format_cents(cents):
+    """Formats integer cents as a dollar amount string, e.g. 6320 -> "63.20"."""
+    sign = "-" if cents < 0 else ""
+    return f"{sign}{abs(cents) // 100}.{abs(cents) % 100:02d}"
+
+
+class CartLine:
+    """One item in the cart."""
+    __slots__ = ("name", "unit_cents", "qty", "line_cents")
+
+    def __init__(self, name, unit_cents):
+        self.name = name
+        self.unit_cents = unit_cents
+        self.qty = 0
+        self.line_cents = 0
+
+
+# An immutable view of the cart for checkout and order creation.
+# 'lines' is a tuple of (name, qty, unit_cents, line_cents).
+CartSnapshot = namedtuple("CartSnapshot", "lines subtotal_cents discount_cents total_cents")
+
+
+class Cart:
+    """Cart lines plus incrementally maintained subtotal and discount."""
+    __slots__ = ("_lines", "subtotal_cents", "promotion", "discount_cents", "_snapshot")
+
+    def __init__(self):
+        self._lines = {}            # item name -> CartLine, in the order items were added
+        self.subtotal_cents = 0
+        self.promotion = None       # Applied coupon: anything with a discount_cents(cart) method
+        self.discount_cents = 0
+        self._snapshot = None       # Cached until the next change
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __contains__(self, name):
+        return name in self._lines
+
+    def __iter__(self):
+        return iter(self._lines)
+
+    def quantity(self, name):
+        line = self._lines.get(name)
+        return line.qty if line else 0
+
+    def items(self):
+        """(name, qty) pairs, like dict.items() on the old {name: qty} cart."""
+        return ((line.name, line.qty) for line in self._lines.values())
+
+    def lines(self):
+        return self._lines.values()
+
+    @property
+    def total_cents(self):
+        return self.subtotal_cents - self.discount_cents
+
+    def _changed(self, line, delta):
+        line.qty += delta
+        line.line_cents += delta * line.unit_cents
+        self.subtotal_cents += delta * line.unit_cents
+        if line.qty <= 0:
+            del self._lines[line.name]
+        self._reprice()
+
+    def _reprice(self):
+        self.discount_cents = self.promotion.discount_cents(self) if self.promotion is not None else 0
+        self._snapshot = None
+
+    def add(self, name, unit_cents, qty=1):
+        """Adds 'qty' of an item at 'unit_cents' each. Returns the new quantity."""
+        line = self._lines.get(name)
+        if line is None:
+            line = self._lines[name] = CartLine(name, unit_cents)
+        self._changed(line, qty)
+        return line.qty
+
+    def increase(self, name):
+        """Adds one more of an item already in the cart. Returns the new quantity (0 if it isn't in the cart)."""
+        line = self._lines.get(name)
+        if line is None:
+            return 0
+        self._changed(line, 1)
+        return line.qty
+
+    def decrease(self, name):
+        """Removes one of an item, dropping the line at zero. Returns the remaining quantity."""
+        line = self._lines.get(name)
+        if line is None:
+            return 0
+        self._changed(line, -1)
+        return max(line.qty, 0)
+
+    def set_promotion(self, promotion):
+        """Applies a coupon (None removes it) and re-prices the cart."""
+        self.promotion = promotion
+        self._reprice()
+
+    def clear(self):
+        self._lines = {}
+        self.subtotal_cents = 0
+        self.promotion = None
+        self._reprice()
+
+    def snapshot(self):
+        """Returns a CartSnapshot; repeated calls without changes in between return the same object."""
+        if self._snapshot is None:
+            self._snapshot = CartSnapshot(
+                tuple((line.name, line.qty, line.unit_cents, line.line_cents) for line in self._lines.values()),
+                self.subtotal_cents, self.discount_cents, self.total_cents)
+        return self._snapshot
@@ -0,0 +1,203 @@
+import csv
+import json
+import logging
+import math
+import mmap
+import os
+import sys
+from collections.abc import Mapping
+
+from search import FACETS
+
+# --- Product Catalog ---
+#
+# Product feeds can be CSV files (with a header row) or JSON Lines, one product per line.
+# Both are read through a read-only memory map and parsed one row at a time, so the raw
+# file is never held in memory next to the parsed catalog. Every row is validated and
+# stored as a compact Product; rows that fail validation are logged and skipped.
+#
+#   name,price,product,style,desc,image,stock
+#   Levis Pants,39,Pants,Daily,Classic straight-fit denim jeans.,levis_pants.png,50
+#
+# 'stock' is optional: products without it aren't stock-tracked (see inventory.py).
+
+REQUIRED_FIELDS = ("name", "price", "product", "style")
+MAX_LOGGED_ERRORS = 20  # Further bad rows are only counted
+
+
+class Product:
+    """One catalog item. Reads like the old item dicts: product['price'], product.get('desc')."""
+    __slots__ = ("price", "product", "style", "desc", "image")
+    FIELDS = __slots__
+
+    def __init__(self, price, product, style, desc="", image=""):
+        self.price = price
+        self.product = product
+        self.style = style
+        self.desc = desc
+        self.image = image
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+    def keys(self):
+        return self.FIELDS
+
+    def __repr__(self):
+        return f"Product({', '.join(f'{field}={getattr(self, field)!r}' for field in self.FIELDS)})"
+
+
+def parse_price(value):
+    """Returns a non-negative price as an int when it is whole (39) and a float otherwise (59.99)."""
+    price = float(value)
+    if not math.isfinite(price) or price < 0:
+        raise ValueError(f"invalid price {value!r}")
+    return int(price) if price.is_integer() else price
+
+
+class Catalog(Mapping):
+    """
+    Product name -> Product, in feed order, plus facet tables counting the products per
+    product type and style, so filter choices never need a scan over the catalog.
+    """
+
+    def __init__(self):
+        self.products = {}
+        self.facets = {facet: {} for facet in FACETS}  # facet -> value -> number of products
+        self.stock = {}   # name -> units in stock at load time, for the products that have a stock count
+        self.skipped = 0  # Rows rejected while loading
+
+    @classmethod
+    def from_items(cls, items):
+        """Builds a catalog from a {name: {"price": ..., "product": ..., ...}} dict."""
+        catalog = cls()
+        for name, data in items.items():
+            catalog.add_row(dict(data, name=name))
+        return catalog
+
+    def __getitem__(self, name):
+        return self.products[name]
+
+    def __contains__(self, name):
+        return name in self.products
+
+    def __iter__(self):
+        return iter(self.products)
+
+    def __len__(self):
+        return len(self.products)
+
+    def add_row(self, row):
+        """Validates one feed row and adds it. Raises KeyError or ValueError for a bad row."""
+        name = str(row["name"]).strip()
+        if not name:
+            raise ValueError("empty name")
+        if name in self.products:
+            raise ValueError(f"duplicate product {name!r}")
+        price = parse_price(row["price"])
+        # Interned, so the many products sharing a type or style share one string
+        product, style = (sys.intern(str(row[facet] or "").strip()) for facet in FACETS)
+        if not product or not style:
+            raise ValueError("empty product or style")
+        desc = str(row.get("desc") or "")
+        image = str(row.get("image") or "")
+        stock = row.get("stock")
+        if stock is not None and str(stock).strip() != "":
+            stock = int(stock)
+            if stock < 0:
+                raise ValueError(f"negative stock {stock}")
+            self.stock[name] = stock
+
+        for facet, value in zip(FACETS, (product, style)):
+            counts = self.facets[facet]
+            counts[value] = counts.get(value, 0) + 1
+        self.products[name] = Product(price, product, style, desc, image)
+
+    def facet_values(self, facet):
+        """Returns the sorted distinct values of a facet ('product' or 'style')."""
+        return sorted(self.facets[facet])
+
+
+def _mapped_lines(path):
+    """Yields the decoded lines of 'path', read through a read-only memory map."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return  # mmap can't map an empty file
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            first = True
+            for line in iter(mm.readline, b""):
+                text = line.decode("utf-8")
+                if first:
+                    text = text.lstrip("\ufeff")  # Spreadsheet exports often start with a BOM
+                    first = False
+                yield text
+
+
+def _csv_rows(path):
+    """Yields (line number, row dict) for a CSV feed."""
+    reader = csv.DictReader(_mapped_lines(path))
+    missing = [field for field in REQUIRED_FIELDS if field not in (reader.fieldnames or ())]
+    if missing:
+        raise ValueError(f"{path} is missing the column(s): {', '.join(missing)}")
+    try:
+        for row in reader:
+            yield reader.line_num, row
+    except csv.Error as e:
+        raise ValueError(f"{path}, line {reader.line_num}: {e}")
+
+
+def _jsonl_rows(path):
+    """Yields (line number, row dict) for a JSON Lines feed."""
+    for line_no, line in enumerate(_mapped_lines(path), 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, e  # Reported as a bad row by load_catalog
+            continue
+        yield line_no, row
+
+
+def load_catalog(path):
+    """
+    Streams a .csv or .jsonl/.ndjson product feed into a Catalog.
+    Raises OSError if the file can't be read and ValueError for an unsupported or headerless feed.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        rows = _csv_rows(path)
+    elif extension in (".jsonl", ".ndjson"):
+        rows = _jsonl_rows(path)
+    else:
+        raise ValueError(f"Unsupported catalog format {extension!r}, expected .csv or .jsonl")
+
+    catalog = Catalog()
+    for line_no, row in rows:
+        try:
+            if isinstance(row, ValueError):
+                raise row
+            if not isinstance(row, dict):
+                raise ValueError("not a JSON object")
+            catalog.add_row(row)
+        except (KeyError, ValueError, TypeError) as e:
+            catalog.skipped += 1
+            if catalog.skipped <= MAX_LOGGED_ERRORS:
+                logging.warning("Skipping catalog row at line %s of %s: %s", line_no, path, e)
+    logging.info("Loaded %s products from %s (%s rows skipped).", len(catalog), path, catalog.skipped)
+    return catalog
+
+
+if __name__ == "__main__":
+    # python catalog.py products.csv
+    if len(sys.argv) != 2:
+        sys.exit("usage: python catalog.py <products.csv|products.jsonl>")
+    loaded = load_catalog(sys.argv[1])
+    print(f"{len(loaded)} products, {loaded.skipped} rows skipped")
+    for facet in FACETS:
+        print(f"{facet}: {', '.join(f'{value} ({count})' for value, count in sorted(loaded.facets[facet].items()))}")
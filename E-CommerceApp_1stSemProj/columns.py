@@ -0,0 +1,111 @@
+try:
+    import numpy
+except ImportError:  # Optional: without NumPy the same queries run as plain Python loops
+    numpy = None
+
+from search import FACETS
+
+# --- Columnar Catalog ---
+#
+# A column-per-field copy of the catalog for browsing: prices in one array and product
+# type/style as small integer codes into a table of distinct values. Facet and price
+# filters become whole-array comparisons and price sorts a single argsort, which keeps
+# browsing fast on catalogs of millions of rows.
+
+SORT_RELEVANCE = "relevance"     # Catalog order, or best text match first when searching
+SORT_PRICE_ASC = "price_asc"
+SORT_PRICE_DESC = "price_desc"
+SORT_ORDERS = (SORT_RELEVANCE, SORT_PRICE_ASC, SORT_PRICE_DESC)
+
+
+class CatalogColumns:
+    """Prices and facet codes of a Catalog as NumPy arrays (plain lists if NumPy isn't installed)."""
+
+    def __init__(self, catalog, use_numpy=None):
+        self.use_numpy = numpy is not None if use_numpy is None else use_numpy
+        self.names = list(catalog)                      # Row number -> product name
+        self.row_of = {name: row for row, name in enumerate(self.names)}
+        self.categories = {facet: catalog.facet_values(facet) for facet in FACETS}  # facet -> code -> value
+        self.codes_of = {facet: {value: code for code, value in enumerate(values)}
+                         for facet, values in self.categories.items()}   # facet -> value -> code
+
+        products = catalog.values()
+        prices = [product['price'] for product in products]
+        codes = {facet: [self.codes_of[facet][product[facet]] for product in products] for facet in FACETS}
+        if self.use_numpy:
+            self.name_array = numpy.array(self.names, dtype=object)
+            self.prices = numpy.array(prices, dtype=numpy.float64)
+            self.codes = {facet: numpy.array(values, dtype=numpy.int32) for facet, values in codes.items()}
+        else:
+            self.prices = prices
+            self.codes = codes
+
+    def __len__(self):
+        return len(self.names)
+
+    def select(self, names=None, product=None, style=None, min_price=None, max_price=None, sort=SORT_RELEVANCE):
+        """
+        Returns the names of the rows matching every given filter (None means any), in
+        catalog order or, when 'names' is given, in that order and only among those names.
+        'sort' is one of SORT_ORDERS; price sorts are stable, so ties keep that order.
+        """
+        if sort not in SORT_ORDERS:
+            raise ValueError(f"Unknown sort order: {sort!r}")
+        wanted_codes = []
+        for facet, value in zip(FACETS, (product, style)):
+            if value is not None:
+                code = self.codes_of[facet].get(value)
+                if code is None:
+                    return []
+                wanted_codes.append((facet, code))
+        if names is None and not wanted_codes and min_price is None and max_price is None and sort == SORT_RELEVANCE:
+            return list(self.names)
+        if self.use_numpy:
+            return self.name_array[self._select_numpy(names, wanted_codes, min_price, max_price, sort)].tolist()
+        return [self.names[row] for row in self._select_python(names, wanted_codes, min_price, max_price, sort)]
+
+    def _select_numpy(self, names, wanted_codes, min_price, max_price, sort):
+        if names is None:
+            rows = None  # Every row; the columns are used as they are instead of being copied
+            column = lambda values: values
+        else:
+            rows = numpy.fromiter((self.row_of[name] for name in names), dtype=numpy.intp, count=len(names))
+            column = lambda values: values[rows]
+
+        mask = None
+        prices = column(self.prices)
+        for facet, code in wanted_codes:
+            mask = _and(mask, column(self.codes[facet]) == code)
+        if min_price is not None:
+            mask = _and(mask, prices >= min_price)
+        if max_price is not None:
+            mask = _and(mask, prices <= max_price)
+
+        if rows is None:
+            rows = numpy.arange(len(self.names)) if mask is None else numpy.flatnonzero(mask)
+        elif mask is not None:
+            rows = rows[mask]
+        if sort != SORT_RELEVANCE:
+            selected_prices = self.prices[rows]
+            order = numpy.argsort(selected_prices if sort == SORT_PRICE_ASC else -selected_prices, kind="stable")
+            rows = rows[order]
+        return rows
+
+    def _select_python(self, names, wanted_codes, min_price, max_price, sort):
+        rows = range(len(self.names)) if names is None else [self.row_of[name] for name in names]
+        prices = self.prices
+        for facet, code in wanted_codes:
+            codes = self.codes[facet]
+            rows = [row for row in rows if codes[row] == code]
+        if min_price is not None:
+            rows = [row for row in rows if prices[row] >= min_price]
+        if max_price is not None:
+            rows = [row for row in rows if prices[row] <= max_price]
+        if sort != SORT_RELEVANCE:
+            rows = sorted(rows, key=prices.__getitem__, reverse=sort == SORT_PRICE_DESC)
+        return rows
+
+
+def _and(mask, condition):
+    """Combines boolean arrays, treating None as 'no condition yet'."""
+    return condition if mask is None else mask & condition
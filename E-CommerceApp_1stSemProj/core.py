@@ -0,0 +1,517 @@
+import heapq
+import logging
+import re
+import sqlite3
+import threading
+from datetime import date
+
+import auth
+import metrics
+from analytics import OrderColumns, SalesAnalytics
+from cart import Cart, to_cents
+from catalog import Catalog
+from inventory import Inventory, OutOfStock
+from columns import CatalogColumns, SORT_RELEVANCE
+from orders import OrderNotSaved, OrderService
+from promotions import compile_promotions, DEFAULT_COUPONS
+from recommendations import CoOccurrence
+from search import SearchIndex, tokenize
+
+# --- Display-free Shop Logic ---
+#
+# Everything a shopper can do, without any Tk. The desktop app and api_server.py are both
+# clients of a Shop; each shopper gets their own Session, so many can shop at once.
+
+DEFAULT_ITEMS = {
+    "Levis Pants": {"price": 39, "product": "Pants", "style": "Daily", "desc": "Classic straight-fit denim jeans.", "image": "levis_pants.png", "stock": 50},
+    "Van Heusen Shirt": {"price": 89, "product": "Shirts", "style": "Party", "desc": "A premium formal shirt for parties.", "image": "vanheusen_shirt.png", "stock": 20},
+    "Arrow Polo": {"price": 59, "product": "Shirts", "style": "Daily", "desc": "A smart casual polo shirt.", "image": "arrow_shirt.png", "stock": 40},
+    "Pepe Jeans": {"price": 79, "product": "Pants", "style": "Party", "desc": "Stylish slim-fit jeans.", "image": "pepe_jeans_pants.png", "stock": 30}
+}
+
+ADMIN_USERNAME = "admin"  # The one account that may see sales analytics
+
+# Basic email validation
+EMAIL_REGEX = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+
+
+class ShopError(Exception):
+    """A failure to show to the shopper: 'title' is a short heading, str(error) the message."""
+
+    def __init__(self, title, message):
+        super().__init__(message)
+        self.title = title
+
+
+class Session:
+    """One shopper's state: who is logged in and what is in their cart."""
+
+    def __init__(self):
+        self.user = None
+        self.cart = Cart()
+
+
+class Shop:
+    """The catalog, the user store and every shop operation, shared by all sessions."""
+
+    def __init__(self, items, user_store, coupons=None, stock_path=None):
+        # A Catalog from catalog.load_catalog, or a plain {name: {...}} dict such as DEFAULT_ITEMS
+        self.items = items if isinstance(items, Catalog) else Catalog.from_items(items)
+        # Coupon definitions as in coupons.json (see promotions.py), compiled into a code -> Promotion index
+        self.promotions = compile_promotions(DEFAULT_COUPONS if coupons is None else coupons, self.items)
+        self.store = user_store
+        self.users = user_store.users
+        # Stock levels and cart reservations, with the stock levels saved to stock_path (e.g. stock.json) if given
+        self.inventory = Inventory.load(stock_path, self.items.stock) if stock_path else Inventory(self.items.stock)
+        # Saves orders on its own thread, several per commit, along with the stock levels they changed
+        self.orders = OrderService(user_store, on_saved=self._order_saved, before_commit=self.inventory.save)
+        self._search_index = None
+        self._columns = None
+        self._recommendations = None
+        self._analytics = None
+        self._order_columns = None
+        # One lock per lazy structure, so building one never holds up a caller that needs another
+        self._search_index_lock = threading.Lock()
+        self._columns_lock = threading.Lock()
+        self._recommendations_lock = threading.Lock()
+        self._analytics_lock = threading.Lock()
+        self._order_columns_lock = threading.Lock()
+        self._saved_lock = threading.Lock()
+        self._saved_during_builds = []  # One list per build from the store, collecting the orders saved while it runs
+
+    @property
+    def search_index(self):
+        """The catalog's SearchIndex, built on first use so startup doesn't pay for indexing."""
+        if self._search_index is None:
+            with self._search_index_lock:
+                if self._search_index is None:
+                    self._search_index = SearchIndex(self.items)
+        return self._search_index
+
+    @property
+    def columns(self):
+        """The catalog's CatalogColumns for filtering and sorting, built on first use."""
+        if self._columns is None:
+            with self._columns_lock:
+                if self._columns is None:
+                    self._columns = CatalogColumns(self.items)
+        return self._columns
+
+    @property
+    def recommendations(self):
+        """Co-occurrence counts over every saved order, built on first use in one pass over the store."""
+        if self._recommendations is None:
+            with self._recommendations_lock:
+                if self._recommendations is None:
+                    with metrics.timer("recommendations.rebuild"):
+                        self._build_from_orders(
+                            lambda until: CoOccurrence.from_orders(self.store.iter_order_items(until)),
+                            self._publish_recommendations)
+        return self._recommendations
+
+    def _publish_recommendations(self, recommendations, saved_meanwhile):
+        for order in saved_meanwhile:
+            recommendations.add_order(order["items"])
+        self._recommendations = recommendations
+
+    @property
+    def analytics(self):
+        """Sales totals over every saved order, built on first use in one pass over the store."""
+        if self._analytics is None:
+            with self._analytics_lock:
+                if self._analytics is None:
+                    with metrics.timer("analytics.rebuild"):
+                        self._build_from_orders(self._count_sales, self._publish_analytics)
+        return self._analytics
+
+    def _count_sales(self, until):
+        return SalesAnalytics.from_orders(self.store.iter_orders(until=until), self.items)
+
+    def _publish_analytics(self, analytics, saved_meanwhile):
+        for order in saved_meanwhile:
+            analytics.add_order(order)
+        self._analytics = analytics
+        self._order_columns = None  # Re-exported on the next date-range report
+
+    def warm_up(self):
+        """Builds the search index and catalog columns now, so the first search doesn't pay for them. Returns both."""
+        return self.search_index, self.columns
+
+    def _build_from_orders(self, build, publish):
+        """
+        Runs build(until) over the orders saved so far (see UserStore.order_mark), without
+        holding up checkouts, then calls publish(result, orders saved since) under _saved_lock.
+        Every order is thus counted exactly once: either the build read it or publish gets it.
+        """
+        saved_meanwhile = []
+
+        def start():
+            with self._saved_lock:
+                self._saved_during_builds.append(saved_meanwhile)
+            return self.store.order_mark()
+        until = self.orders.between_commits(start)
+        try:
+            result = build(until)
+        except BaseException:
+            with self._saved_lock:
+                self._saved_during_builds.remove(saved_meanwhile)
+            raise
+        with self._saved_lock:  # Also what _order_saved holds, so no order slips in between
+            self._saved_during_builds.remove(saved_meanwhile)
+            publish(result, saved_meanwhile)
+        return result
+
+    def _order_saved(self, username, order):
+        # Runs on the order committer. Before the first build there is nothing to update, and a build
+        # in progress gets the order through _build_from_orders.
+        with self._saved_lock:
+            for saved_meanwhile in self._saved_during_builds:
+                saved_meanwhile.append(order)
+            recommendations, analytics = self._recommendations, self._analytics
+        if recommendations is not None:
+            recommendations.add_order(order["items"])
+        if analytics is not None:
+            analytics.add_order(order)
+
+    def new_session(self):
+        return Session()
+
+    def close(self):
+        """Waits for queued orders to be saved and saves the stock levels. Call before closing the user store."""
+        self.orders.close()
+        self.inventory.close()
+
+    def ensure_default_admin(self):
+        """Creates the default admin account in an empty store and queues hashing of plaintext passwords."""
+        if not self.users:
+            logging.info("No users found, initializing with default admin.")
+            # Hashed before the first write so the plaintext never reaches disk; only a first run waits for it
+            password_hash = auth.submit_hash("password").result()
+            self._save(self.store.add_user, ADMIN_USERNAME, password_hash, "admin@example.com")
+        # Startup doesn't wait for bcrypt: plaintext passwords left by older versions are hashed on the auth pool
+        pending = auth.rehash_legacy_passwords(self.store)
+        if pending:
+            logging.warning("%s plaintext password(s) found, hashing them in the background.", pending)
+
+    def _save(self, change, *args):
+        """Applies one store change, turning storage failures into a ShopError."""
+        try:
+            with metrics.timer("storage.save"):
+                return change(*args)
+        except (OSError, sqlite3.Error) as e:
+            logging.error("Error saving user data: %s", e)
+            raise ShopError("Save Error", f"Could not save user data: {e}")
+
+    # --- Catalog ---
+
+    @metrics.timed("search")
+    def search(self, query="", product=None, style=None, min_price=None, max_price=None, sort=SORT_RELEVANCE):
+        """
+        Returns the names of matching items. Text queries go through the SearchIndex (best
+        matches first); browsing without one, price ranges and price sorts run on the columns.
+        """
+        if not tokenize(query):
+            return self.columns.select(product=product, style=style, min_price=min_price, max_price=max_price, sort=sort)
+        names = self.search_index.search(query, product=product, style=style)
+        if min_price is None and max_price is None and sort == SORT_RELEVANCE:
+            return names
+        return self.columns.select(names, min_price=min_price, max_price=max_price, sort=sort)
+
+    def related_items(self, item_name, k=5):
+        """Returns up to k items most often ordered together with 'item_name'."""
+        return [name for name in self.recommendations.related(item_name, k) if name in self.items]
+
+    def cart_suggestions(self, session, k=3):
+        """Returns up to k items often ordered with what is in the cart, but not in it yet."""
+        if not session.cart:
+            return []
+        return [name for name in self.recommendations.suggest(list(session.cart), k + 2) if name in self.items][:k]
+
+    # --- Accounts ---
+
+    def check_login(self, username, password):
+        """Starts checking credentials on the auth pool. Returns a Future for finish_login."""
+        if username not in self.users:
+            logging.warning("Failed login attempt for non-existent username '%s'.", username,
+                            extra={"event": "login_failed", "user": username})
+            raise ShopError("Login Failed", "Invalid username or password")
+        return metrics.time_future("login.check", auth.submit_verify(password, self.users[username]['password']))
+
+    def finish_login(self, session, username, result):
+        """Logs 'session' in with check_login's result. Returns True if the stored hash was upgraded."""
+        matches, upgraded_hash = result
+        if not matches:
+            session.user = None
+            logging.warning("Failed login attempt for '%s': Incorrect password.", username,
+                            extra={"event": "login_failed", "user": username})
+            raise ShopError("Login Failed", "Invalid username or password")
+        session.user = username
+        if upgraded_hash:
+            # Plaintext or low-cost hash: store the fresh hash computed alongside the check
+            self._save(self.store.set_password, username, upgraded_hash)
+            logging.info("User '%s' logged in successfully. Password rehashed and saved.", username,
+                         extra={"event": "login", "user": username, "rehashed": True})
+            return True
+        logging.info("User '%s' logged in successfully (bcrypt).", username,
+                     extra={"event": "login", "user": username})
+        return False
+
+    def logout(self, session):
+        if session.user:
+            logging.info("User '%s' logged out.", session.user,
+                         extra={"event": "logout", "user": session.user})
+        self.inventory.release(session, list(session.cart))
+        session.user = None
+        session.cart = Cart()
+
+    def check_signup(self, username, password, email):
+        """Validates a sign-up and starts hashing the password. Returns a Future for finish_signup."""
+        if not all([username, password, email]):
+            logging.warning("Sign-up failed: All fields not filled.")
+            raise ShopError("Error", "All fields must be filled")
+        if not re.match(EMAIL_REGEX, email):
+            logging.warning("Sign-up failed for '%s': Invalid email format.", username)
+            raise ShopError("Error", "Invalid email format. Please enter a valid email address.")
+        if username in self.users:
+            logging.warning("Sign-up failed for '%s': Username already exists.", username)
+            raise ShopError("Error", "Username already exists. Please choose another.")
+        return auth.submit_hash(password)
+
+    def finish_signup(self, username, hashed_password, email):
+        """Creates the account once check_signup's hash is ready."""
+        with self.store.lock:
+            if username in self.users:  # Taken while we were hashing
+                logging.warning("Sign-up failed for '%s': Username already exists.", username)
+                raise ShopError("Error", "Username already exists. Please choose another.")
+            self._save(self.store.add_user, username, hashed_password, email)
+        logging.info("New user '%s' signed up successfully.", username,
+                     extra={"event": "signup", "user": username})
+
+    # --- Cart ---
+
+    def add_to_cart(self, session, item_name):
+        """Adds an item to the cart or increments its quantity. Returns the new quantity."""
+        if not session.user:
+            logging.info("Attempted to add '%s' to cart without login.", item_name)
+            raise ShopError("Not Logged In", "Please log in to add items to your cart.")
+        if item_name not in self.items:
+            raise ShopError("Error", f"Unknown item: {item_name}")
+        self._reserve(session, item_name, session.cart.quantity(item_name) + 1)
+        qty = session.cart.add(item_name, to_cents(self.items[item_name]['price']))
+        logging.info("User '%s' added '%s' to cart. Current quantity: %s.", session.user, item_name, qty,
+                     extra={"event": "cart_add", "user": session.user, "item": item_name, "qty": qty})
+        return qty
+
+    def increase_cart_item(self, session, item_name):
+        """Increases the quantity of a specific item in the cart."""
+        if item_name in session.cart:
+            self._reserve(session, item_name, session.cart.quantity(item_name) + 1)
+            qty = session.cart.increase(item_name)
+            logging.info("User '%s' increased quantity of '%s' to %s.", session.user, item_name, qty,
+                         extra={"event": "cart_increase", "user": session.user, "item": item_name, "qty": qty})
+
+    def decrease_cart_item(self, session, item_name):
+        """Decreases the quantity of a specific item in the cart, removing if quantity becomes zero."""
+        if item_name in session.cart:
+            qty = session.cart.decrease(item_name)
+            self.inventory.shrink(session, item_name, qty)  # Never fails, even once the hold has lapsed
+            if qty <= 0:
+                logging.info("User '%s' removed '%s' from cart (quantity reached 0).", session.user, item_name,
+                             extra={"event": "cart_remove", "user": session.user, "item": item_name})
+            else:
+                logging.info("User '%s' decreased quantity of '%s' to %s.", session.user, item_name, qty,
+                             extra={"event": "cart_decrease", "user": session.user, "item": item_name, "qty": qty})
+
+    def _reserve(self, session, item_name, qty):
+        """Holds 'qty' units of an item for the session's cart, or raises ShopError if there aren't enough."""
+        try:
+            self.inventory.reserve(session, item_name, qty)
+        except OutOfStock as e:
+            left = e.available[item_name]
+            logging.info("User '%s' could not get %s x '%s': %s left.", session.user, qty, item_name, left,
+                         extra={"event": "out_of_stock", "user": session.user, "item": item_name, "available": left})
+            if left <= 0:
+                raise ShopError("Out of Stock", f"Sorry, {item_name} is out of stock.")
+            raise ShopError("Out of Stock", f"Sorry, only {left} x {item_name} left in stock.")
+
+    def apply_coupon(self, session, code):
+        """Applies a coupon code and returns its Promotion; an invalid or expired code removes any discount."""
+        code = code.strip().upper()
+        promotion = self.promotions.get(code)
+        if promotion is None:
+            session.cart.set_promotion(None)
+            logging.warning("User '%s' attempted to apply invalid coupon: '%s'.", session.user, code,
+                            extra={"event": "coupon_rejected", "user": session.user, "code": code})
+            raise ShopError("Invalid Coupon", "The entered coupon code is not valid.")
+        if promotion.expired():
+            session.cart.set_promotion(None)
+            logging.warning("User '%s' attempted to apply expired coupon: '%s'.", session.user, code,
+                            extra={"event": "coupon_rejected", "user": session.user, "code": code})
+            raise ShopError("Invalid Coupon", "This coupon code has expired.")
+        session.cart.set_promotion(promotion)
+        logging.info("User '%s' applied '%s' coupon.", session.user, code,
+                     extra={"event": "coupon_applied", "user": session.user, "code": code})
+        return promotion
+
+    # --- Wishlist ---
+
+    def add_to_wishlist(self, session, item_name):
+        """Adds an item to the user's wishlist. Returns False if it was already there."""
+        if not session.user:
+            logging.info("Attempted to add '%s' to wishlist without login.", item_name)
+            raise ShopError("Not Logged In", "Please log in to add items to your wishlist.")
+        if self._save(self.store.add_to_wishlist, session.user, item_name):
+            logging.info("User '%s' added '%s' to wishlist.", session.user, item_name,
+                         extra={"event": "wishlist_add", "user": session.user, "item": item_name})
+            return True
+        logging.info("User '%s' attempted to add '%s' to wishlist, but it was already there.", session.user, item_name)
+        return False
+
+    def remove_from_wishlist(self, session, item_name):
+        """Removes an item from the user's wishlist. Returns False if it wasn't there."""
+        if session.user and self._save(self.store.remove_from_wishlist, session.user, item_name):
+            logging.info("User '%s' removed '%s' from wishlist.", session.user, item_name,
+                         extra={"event": "wishlist_remove", "user": session.user, "item": item_name})
+            return True
+        logging.warning("Attempted to remove '%s' from wishlist, but it was not found or user not logged in.", item_name)
+        return False
+
+    # --- Orders ---
+
+    def submit_order(self, session, idempotency_key=None):
+        """
+        Turns the cart into an order and empties it. Returns a Future with the order dict once
+        it is saved. If saving fails the Future raises OrderNotSaved, whose 'context' is the
+        cart to hand to restore_cart(). Repeating an idempotency key returns the Future of
+        the order first placed with it.
+        """
+        if not session.user:
+            raise ShopError("Error", "No user logged in to place order.")
+        claimed = None
+        if idempotency_key is not None:
+            # Claimed before any stock is taken, so two requests with the same key can't both sell the cart
+            claimed, new = self.orders.claim(session.user, idempotency_key)
+            if not new:
+                return claimed
+        try:
+            return self._submit_cart(session, idempotency_key, claimed)
+        except BaseException as e:
+            if claimed is not None:
+                self.orders.abandon(session.user, idempotency_key, claimed, e)
+            raise
+
+    def _submit_cart(self, session, idempotency_key, claimed):
+        if not session.cart:
+            raise ShopError("Error", "Cart is empty, cannot proceed with payment.")
+        cart = session.cart
+        snapshot = cart.snapshot()
+        lines = {name: qty for name, qty, _, _ in snapshot.lines}
+        unit_cents = {name: cents for name, _, cents, _ in snapshot.lines}
+        try:
+            # Sells the cart's reservations (and any lapsed ones that are still in stock) all at once
+            self.inventory.commit(session, lines)
+        except OutOfStock as e:
+            logging.info("User '%s' could not check out, out of stock: %s.", session.user, e,
+                         extra={"event": "out_of_stock", "user": session.user, "items": e.available})
+            raise ShopError("Out of Stock", f"Not enough stock left for: {e}. Please update your cart.")
+
+        # The stock goes back as soon as a save fails; the cart is the caller's to restore, on its own thread
+        try:
+            future = self.orders.submit(session.user, lines, snapshot.total_cents / 100, idempotency_key,
+                                        on_failure=lambda: self.inventory.restock(lines), context=cart, future=claimed,
+                                        unit_cents=unit_cents)
+        except BaseException:
+            self.inventory.restock(lines)  # Not queued (e.g. the shop is closing), so nothing was sold
+            raise
+        session.cart = Cart()
+        return future
+
+    def place_order(self, session, idempotency_key=None):
+        """Like submit_order, but waits until the order is saved and returns it."""
+        future = self.submit_order(session, idempotency_key)
+        try:
+            return future.result()
+        except OrderNotSaved as e:
+            self.restore_cart(session, e.context)
+            raise ShopError("Save Error", f"Could not save your order: {e}")
+
+    def restore_cart(self, session, cart):
+        """
+        Puts back the cart of an order that couldn't be saved, unless the shopper has started a
+        new one, reserving its items again as far as the stock allows. Returns False if it wasn't restored.
+        """
+        if session.cart:
+            return False
+        restored = Cart()
+        for name, qty, unit_cents, _ in cart.snapshot().lines:
+            held = self.inventory.reserve_up_to(session, name, qty)
+            if held:
+                restored.add(name, unit_cents, held)
+            if held < qty:
+                logging.info("User '%s' got %s of %s x '%s' back in their cart.", session.user, held, qty, name,
+                             extra={"event": "out_of_stock", "user": session.user, "item": name, "available": held})
+        restored.set_promotion(cart.promotion)
+        session.cart = restored
+        return True
+
+    def order_history(self, session, offset=0, limit=20):
+        """Returns one page of the user's orders, newest first."""
+        if not session.user:
+            return []
+        return self.store.orders_page(session.user, offset, limit)
+
+    def order_count(self, session):
+        return self.store.order_count(session.user) if session.user else 0
+
+    # --- Sales Analytics ---
+
+    def is_admin(self, session):
+        return session.user == ADMIN_USERNAME
+
+    def _check_admin(self, session):
+        if not self.is_admin(session):
+            raise ShopError("Access Denied", "Only the admin can view sales analytics.")
+
+    def rebuild_analytics(self, session):
+        """Recounts the sales totals from the store, e.g. after orders were imported or edited outside the app."""
+        self._check_admin(session)
+        # No lock held while it scans: reports keep using the old totals until the new ones are published
+        with metrics.timer("analytics.rebuild"):
+            return self._build_from_orders(self._count_sales, self._publish_analytics)
+
+    def _columns_for_range(self):
+        """The columnar order export, re-exported once orders were saved since the last one."""
+        orders = self.analytics.orders
+        with self._order_columns_lock:
+            if self._order_columns is None or self._order_columns[0] != orders:
+                with metrics.timer("analytics.export"):
+                    self._order_columns = (orders, OrderColumns.from_orders(self.store.iter_orders(), self.items))
+            return self._order_columns[1]
+
+    def sales_report(self, session, start=None, end=None, k=10):
+        """
+        Returns totals, the top k items, product types and styles by revenue, and daily
+        totals, over every order or those from 'start' to 'end' ("YYYY-MM-DD", inclusive).
+        """
+        self._check_admin(session)
+        try:
+            # Also normalizes spellings fromisoformat accepts (e.g. 20240131) to the YYYY-MM-DD the totals are keyed by
+            start, end = (None if day is None else date.fromisoformat(day).isoformat() for day in (start, end))
+        except (TypeError, ValueError):
+            raise ShopError("Invalid Date", "Dates must look like 2024-01-31.")
+        analytics = self.analytics
+        with metrics.timer("analytics.report"):
+            days = analytics.days(start, end)
+            if start is None and end is None:
+                report = analytics.summary()
+                report.update((group, analytics.top(group, k)) for group in ("item", "product", "style"))
+            else:
+                columns = self._columns_for_range()
+                groups = {group: columns.totals(group, start, end) for group in ("item", "product", "style")}
+                report = {"orders": sum(row[1] for row in days), "revenue_cents": sum(row[3] for row in days),
+                          "units": sum(units for units, _ in groups["product"].values())}
+                for group, totals in groups.items():
+                    rows = heapq.nlargest(k, totals.items(), key=lambda entry: entry[1][1])
+                    report[group] = [(value, units, cents) for value, (units, cents) in rows]
+        report["days"] = days
+        return report
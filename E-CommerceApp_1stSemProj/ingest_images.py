@@ -0,0 +1,183 @@
+import argparse
+import hashlib
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from storage import write_json_atomically
+from thumbnails import IMAGES_DIR, MANIFEST_FILENAME, ThumbnailManifest
+
+# --- Image Ingestion ---
+#
+# Builds every product thumbnail ahead of time, so the app only ever loads ready-sized PNGs:
+#
+#   python ingest_images.py                      # everything in images/
+#   python ingest_images.py --catalog feed.csv   # only the images a product feed uses
+#
+# Decoding and resizing run on a process pool, one image per task, so a catalog with tens
+# of thousands of images uses every core. Thumbnails are named after the SHA-256 of the
+# source image, and images/manifest.json maps each image name to its hash and thumbnails:
+#
+#   {"version": 1, "images": {"levis_pants.png": {"sha256": "...", "mtime_ns": ..., "bytes": ...,
+#                             "thumbs": {"100x100": ".thumbs/3f2a..._100x100.png"}}}}
+#
+# Runs are incremental: an image whose mtime and size match its manifest entry is skipped
+# without being read, and one whose content hash already has thumbnails isn't resized again.
+# Thumbnails no image uses any more are deleted.
+
+DEFAULT_SIZES = ((100, 100), (200, 200))  # The product cards' size, and double it for high-DPI screens
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp")
+THUMBS_DIRNAME = ".thumbs"
+MANIFEST_VERSION = 1
+THUMB_NAME = re.compile(r"^[0-9a-f]{16}_\d+x\d+\.png$")  # Ingested thumbnails, as opposed to the app's own cache
+
+
+def parse_size(text):
+    """Parses '100x100' into (100, 100)."""
+    try:
+        width, height = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {text!r}")
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError(f"size must be positive, got {text!r}")
+    return width, height
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_thumbnails(source, sizes, thumbs_dir, force=False):
+    """
+    Runs in a worker process: hashes 'source' and writes its thumbnails unless thumbnails of
+    that content already exist. Returns (sha256, {"WxH": thumbnail filename}, resized).
+    """
+    digest = _file_digest(source)
+    thumbs = {f"{width}x{height}": f"{digest[:16]}_{width}x{height}.png" for width, height in sizes}
+    if not force and all(os.path.exists(os.path.join(thumbs_dir, name)) for name in thumbs.values()):
+        return digest, thumbs, False  # Same content as an image ingested before
+
+    from PIL import Image
+    with Image.open(source) as img:
+        img.draft("RGB", max(sizes))  # JPEGs decode straight at a reduced scale
+        img = img.convert("RGBA") if img.mode not in ("RGB", "RGBA") else img.copy()
+    for (width, height), name in zip(sizes, thumbs.values()):
+        path = os.path.join(thumbs_dir, name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"  # Per process: two images with the same content may race here
+        img.resize((width, height), Image.LANCZOS).save(tmp_path, "PNG")
+        os.replace(tmp_path, path)  # Never leave a half-written thumbnail under its final name
+    return digest, thumbs, True
+
+
+def find_images(images_dir, catalog_path=None):
+    """Returns {image name: source path} for every image in images_dir, or for those a catalog feed uses."""
+    if catalog_path is None:
+        return {entry.name: entry.path for entry in os.scandir(images_dir)
+                if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS)}
+    from catalog import load_catalog
+    catalog = load_catalog(catalog_path)
+    images, missing = {}, 0
+    for product in catalog.values():
+        if not product.image or product.image in images:
+            continue
+        path = os.path.join(images_dir, product.image)
+        if os.path.isfile(path):
+            images[product.image] = path
+        else:
+            missing += 1
+    if missing:
+        logging.warning("%s image(s) named in %s don't exist in %s.", missing, catalog_path, images_dir)
+    return images
+
+
+def ingest(images_dir, sizes=DEFAULT_SIZES, catalog_path=None, workers=None, force=False):
+    """Brings the thumbnails and manifest of images_dir up to date. Returns a dict of counts."""
+    thumbs_dir = os.path.join(images_dir, THUMBS_DIRNAME)
+    os.makedirs(thumbs_dir, exist_ok=True)
+    entries = ThumbnailManifest(images_dir).load()
+    size_keys = {f"{width}x{height}" for width, height in sizes}
+    sources = find_images(images_dir, catalog_path)
+
+    # Unchanged images (same mtime, size and thumbnail sizes) are settled without reading them
+    todo = {}
+    for name, path in sources.items():
+        stat = os.stat(path)
+        entry = entries.get(name)
+        if (not force and entry is not None and entry["mtime_ns"] == stat.st_mtime_ns and entry["bytes"] == stat.st_size
+                and set(entry["thumbs"]) == size_keys
+                and all(os.path.exists(os.path.join(images_dir, thumb)) for thumb in entry["thumbs"].values())):
+            continue
+        todo[name] = (path, stat)
+
+    counts = {"images": len(sources), "unchanged": len(sources) - len(todo), "resized": 0, "reused": 0, "failed": 0}
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(build_thumbnails, path, sizes, thumbs_dir, force): name
+                       for name, (path, _) in todo.items()}
+            for done, future in enumerate(as_completed(futures), 1):
+                name = futures[future]
+                path, stat = todo[name]
+                try:
+                    digest, thumbs, resized = future.result()
+                except Exception as e:  # Pillow raises a variety of errors for broken files
+                    counts["failed"] += 1
+                    logging.error("Could not build thumbnails for %s: %s", path, e)
+                    entries.pop(name, None)
+                    continue
+                counts["resized" if resized else "reused"] += 1
+                entries[name] = {
+                    "sha256": digest,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "bytes": stat.st_size,
+                    "thumbs": {key: f"{THUMBS_DIRNAME}/{thumb}" for key, thumb in thumbs.items()},
+                }
+                if done % 1000 == 0:
+                    print(f"  {done}/{len(todo)} images processed", flush=True)
+
+    # Forget images that were deleted, then the thumbnails nothing refers to any more
+    for name in [name for name in entries if not os.path.exists(os.path.join(images_dir, name))]:
+        del entries[name]
+    in_use = {os.path.basename(thumb) for entry in entries.values() for thumb in entry["thumbs"].values()}
+    removed = 0
+    for entry in os.scandir(thumbs_dir):
+        if THUMB_NAME.match(entry.name) and entry.name not in in_use:
+            os.remove(entry.path)
+            removed += 1
+    counts["thumbnails_removed"] = removed
+
+    write_json_atomically(os.path.join(images_dir, MANIFEST_FILENAME), {"version": MANIFEST_VERSION, "images": entries})
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-build product thumbnails and the image manifest.")
+    parser.add_argument("--images", default=IMAGES_DIR, help="image directory (default: images/ next to the app)")
+    parser.add_argument("--catalog", help="only ingest the images used by this CSV or JSON Lines product feed")
+    parser.add_argument("--sizes", type=parse_size, nargs="+", default=list(DEFAULT_SIZES),
+                        help="thumbnail sizes as WIDTHxHEIGHT (default: 100x100 200x200)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--force", action="store_true", help="rebuild every thumbnail, changed or not")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    started = time.perf_counter()
+    try:
+        counts = ingest(args.images, tuple(args.sizes), args.catalog, args.workers, args.force)
+    except (OSError, ValueError) as e:
+        sys.exit(f"Ingestion failed: {e}")
+    print(f"{counts['images']} images: {counts['resized']} resized, {counts['reused']} reused by content hash, "
+          f"{counts['unchanged']} unchanged, {counts['failed']} failed; "
+          f"{counts['thumbnails_removed']} unused thumbnails removed in {time.perf_counter() - started:.1f} s")
+    if counts["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
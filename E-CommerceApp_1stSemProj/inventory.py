@@ -0,0 +1,320 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import ExitStack
+
+import metrics
+from storage import write_json_atomically
+
+# --- Inventory ---
+#
+# Stock on hand per SKU (product name), and short-lived reservations held by carts. Adding
+# an item to a cart reserves it; the reservation lapses RESERVATION_TTL seconds after the
+# cart last touched it, so abandoned carts give their stock back. Checkout turns a cart's
+# reservations into a sale in one step, for every line or none.
+#
+# Each SKU has its own lock, so shoppers buying different products never wait for each
+# other. Checkout takes the locks of its SKUs in sorted order, which rules out deadlocks
+# between carts sharing several products. Reservations lapse through a heap ordered by
+# expiry time: every call first pops the entries that are due, so nothing ever scans all
+# reservations. A reservation that is refreshed leaves its old heap entry behind; that
+# entry is recognised as stale and skipped when it comes up.
+#
+# Only SKUs with a stock count are tracked; any other product is treated as unlimited.
+# Stock levels live in stock.json ({"Levis Pants": 12, ...}); SKUs missing from it start at
+# the catalog's 'stock' column, so editing that file restocks. Checkouts don't rewrite it:
+# save() appends just the SKUs that changed as one line of stock.journal, and the order
+# service calls it once per batch of orders, on its own thread. The journal is folded back
+# into stock.json once it grows past COMPACT_BYTES and when the shop closes.
+
+RESERVATION_TTL = 15 * 60  # Seconds a cart holds its items after last changing them
+STOCK_FILENAME = "stock.json"
+COMPACT_BYTES = 1024 * 1024   # Fold the journal into the stock file once it grows past this size
+
+
+class OutOfStock(Exception):
+    """Not enough stock; 'available' maps each short SKU to how many could still be had."""
+
+    def __init__(self, available):
+        super().__init__(", ".join(f"{sku} ({count} left)" for sku, count in available.items()))
+        self.available = available
+
+
+class _Sku:
+    __slots__ = ("lock", "on_hand", "reserved", "holds")
+
+    def __init__(self, on_hand):
+        self.lock = threading.Lock()
+        self.on_hand = on_hand   # In the warehouse, reserved units included
+        self.reserved = 0        # Sum of the holds below
+        self.holds = {}          # holder -> [quantity, expiry time]
+
+    def available(self):
+        return self.on_hand - self.reserved
+
+
+class Inventory:
+    """Per-SKU stock with expiring cart reservations and all-or-nothing checkout."""
+
+    def __init__(self, stock, ttl=RESERVATION_TTL, path=None, clock=time.monotonic):
+        self.skus = {sku: _Sku(count) for sku, count in stock.items()}
+        self.ttl = ttl
+        self.path = path
+        self.clock = clock
+        self.expiry = []                  # Heap of (expiry time, sequence, sku, holder)
+        self.expiry_lock = threading.Lock()
+        self.sequence = itertools.count() # Keeps heap entries with the same expiry from comparing holders
+        self.journal_path = os.path.splitext(path)[0] + ".journal" if path else None
+        self.journal = None
+        self.journal_bytes = 0
+        self.saved = dict(stock)          # sku -> on_hand as the stock file and journal have it
+        self.save_lock = threading.Lock()
+        self.dirty_lock = threading.Lock()
+        self.dirty = set()                # SKUs whose on_hand changed since the last save
+
+    @classmethod
+    def load(cls, path, catalog_stock, ttl=RESERVATION_TTL):
+        """Opens the stock levels saved at 'path' and its journal, starting new SKUs at their catalog stock."""
+        stock = dict(catalog_stock)
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    saved = json.load(f)
+                stock.update((sku, int(count)) for sku, count in saved.items() if sku in stock)
+            except (OSError, ValueError, AttributeError) as e:
+                logging.error("Could not read stock levels from %s: %s. Starting from the catalog's.", path, e)
+        inventory = cls(stock, ttl, path)
+        valid_bytes = 0
+        if os.path.exists(inventory.journal_path):
+            with open(inventory.journal_path, "rb") as f:
+                for line in f:
+                    try:
+                        changes = json.loads(line)
+                    except ValueError:
+                        changes = None
+                    if not line.endswith(b"\n") or not isinstance(changes, dict):
+                        # A torn write at the tail from a crash; everything before it is intact
+                        logging.warning("Ignoring incomplete record at the end of %s.", inventory.journal_path)
+                        break
+                    valid_bytes += len(line)
+                    for sku, count in changes.items():
+                        if sku in inventory.skus:
+                            inventory.skus[sku].on_hand = inventory.saved[sku] = int(count)
+        inventory.journal_bytes = valid_bytes  # The torn tail is cut off before the next append
+        return inventory
+
+    def tracks(self, sku):
+        return sku in self.skus
+
+    def available(self, sku):
+        """Returns how many units of 'sku' can still be reserved, or None if it isn't tracked."""
+        record = self.skus.get(sku)
+        if record is None:
+            return None
+        self._expire_due()
+        with record.lock:
+            return record.available()
+
+    def reserve(self, holder, sku, quantity):
+        """
+        Sets what 'holder' (a cart's owner) reserves of 'sku' to 'quantity', 0 releasing it,
+        and restarts its TTL. Raises OutOfStock if the extra units aren't available.
+        """
+        record = self.skus.get(sku)
+        if record is None:
+            return
+        self._expire_due()
+        with record.lock:
+            hold = record.holds.get(holder)
+            held = hold[0] if hold else 0
+            if quantity - held > record.available():
+                raise OutOfStock({sku: record.available() + held})
+            expires = self._set_hold(record, holder, held, quantity)
+        self._schedule(expires, sku, holder)
+
+    def reserve_up_to(self, holder, sku, quantity):
+        """Like reserve(), but holds as much of 'quantity' as is available instead of raising. Returns how many are held."""
+        record = self.skus.get(sku)
+        if record is None:
+            return quantity
+        self._expire_due()
+        with record.lock:
+            hold = record.holds.get(holder)
+            held = hold[0] if hold else 0
+            quantity = max(min(quantity, record.available() + held), 0)
+            expires = self._set_hold(record, holder, held, quantity)
+        self._schedule(expires, sku, holder)
+        return quantity
+
+    def shrink(self, holder, sku, quantity):
+        """
+        Lowers what 'holder' reserves of 'sku' to at most 'quantity', 0 releasing it, and
+        restarts its TTL. Never raises: handing units back needs no stock, even once the hold has lapsed.
+        """
+        record = self.skus.get(sku)
+        if record is None:
+            return
+        self._expire_due()
+        with record.lock:
+            hold = record.holds.get(holder)
+            if hold is None:
+                return
+            expires = self._set_hold(record, holder, hold[0], max(min(quantity, hold[0]), 0))
+        self._schedule(expires, sku, holder)
+
+    def release(self, holder, skus):
+        """Drops every reservation 'holder' has on 'skus', e.g. when a cart is emptied."""
+        for sku in skus:
+            self.shrink(holder, sku, 0)
+
+    def _set_hold(self, record, holder, held, quantity):
+        """Replaces a hold of 'held' units with one of 'quantity'. Returns its expiry, or None once released."""
+        record.reserved += quantity - held
+        if quantity <= 0:
+            record.holds.pop(holder, None)
+            return None
+        expires = self.clock() + self.ttl
+        record.holds[holder] = [quantity, expires]
+        return expires
+
+    def _schedule(self, expires, sku, holder):
+        if expires is not None:
+            with self.expiry_lock:
+                heapq.heappush(self.expiry, (expires, next(self.sequence), sku, holder))
+
+    def commit(self, holder, lines):
+        """
+        Sells {sku: quantity} to 'holder', using its reservations and whatever stock is free
+        for the rest. Either every line is sold or, raising OutOfStock, none is.
+        """
+        tracked = sorted(sku for sku in lines if sku in self.skus)
+        if not tracked:
+            return
+        self._expire_due()
+        with ExitStack() as stack:
+            for sku in tracked:  # Always in the same order, so two checkouts can't deadlock
+                stack.enter_context(self.skus[sku].lock)
+            short = {}
+            for sku in tracked:
+                record = self.skus[sku]
+                hold = record.holds.get(holder)
+                if lines[sku] - (hold[0] if hold else 0) > record.available():
+                    short[sku] = record.available() + (hold[0] if hold else 0)
+            if short:
+                raise OutOfStock(short)
+            for sku in tracked:
+                record = self.skus[sku]
+                hold = record.holds.pop(holder, None)
+                if hold:
+                    record.reserved -= hold[0]
+                record.on_hand -= lines[sku]
+        self._changed(tracked)
+        metrics.count("inventory.commits")
+
+    def restock(self, lines):
+        """Puts {sku: quantity} back on hand, e.g. for an order that couldn't be saved."""
+        for sku, quantity in lines.items():
+            record = self.skus.get(sku)
+            if record is not None:
+                with record.lock:
+                    record.on_hand += quantity
+        self._changed(lines)
+
+    def _changed(self, skus):
+        with self.dirty_lock:
+            self.dirty.update(sku for sku in skus if sku in self.skus)
+
+    def _expire_due(self):
+        """Releases the reservations whose TTL ran out, oldest first."""
+        now = self.clock()
+        due = []
+        with self.expiry_lock:
+            while self.expiry and self.expiry[0][0] <= now:
+                due.append(heapq.heappop(self.expiry))
+        for expires, _, sku, holder in due:
+            record = self.skus[sku]
+            with record.lock:
+                hold = record.holds.get(holder)
+                if hold is not None and hold[1] == expires:  # Otherwise refreshed or released since
+                    record.reserved -= hold[0]
+                    del record.holds[holder]
+                    metrics.count("inventory.expired")
+
+    def save(self):
+        """
+        Appends the stock levels that changed since the last save to the journal. Checkouts
+        leave this to the order service, which calls it on its thread before each commit.
+        """
+        if self.path is None:
+            return
+        with self.save_lock:
+            with self.dirty_lock:
+                dirty, self.dirty = self.dirty, set()
+            if not dirty:
+                return
+            changes = {}
+            for sku in sorted(dirty):
+                record = self.skus[sku]
+                with record.lock:
+                    changes[sku] = record.on_hand
+            try:
+                self._append(changes)
+                self.saved.update(changes)
+                if self.journal_bytes >= COMPACT_BYTES:
+                    self.compact()
+            except OSError as e:
+                logging.error("Could not save stock levels to %s: %s", self.journal_path, e)
+                with self.dirty_lock:
+                    self.dirty |= dirty  # Try again with the next save
+
+    def _append(self, changes):
+        """Writes one {sku: on_hand} line to the journal and fsyncs it. Called with save_lock held."""
+        if self.journal is None:
+            self.journal = open(self.journal_path, "ab")
+            self.journal.truncate(self.journal_bytes)
+        line = (json.dumps(changes, separators=(",", ":")) + "\n").encode("utf-8")
+        try:
+            self.journal.write(line)
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+        except OSError:
+            self._reopen_journal()  # Drops whatever part of the line made it out
+            raise
+        self.journal_bytes += len(line)
+        metrics.count("storage.bytes_written", len(line))
+
+    def _reopen_journal(self):
+        try:
+            self.journal.close()
+        except OSError:
+            pass
+        self.journal = None  # Reopened and cut back to journal_bytes by the next _append
+
+    def compact(self):
+        """Rewrites the stock file with every saved level and empties the journal. Called with save_lock held."""
+        # Writes what the journal already says, so replaying it over the new file after a crash changes nothing
+        write_json_atomically(self.path, self.saved)
+        if self.journal is None:
+            self.journal = open(self.journal_path, "ab")
+        self.journal.truncate(0)
+        os.fsync(self.journal.fileno())
+        self.journal_bytes = 0
+
+    def close(self):
+        """Saves what is left and folds the journal into the stock file."""
+        if self.path is None:
+            return
+        self.save()
+        with self.save_lock:
+            try:
+                if self.journal_bytes:
+                    self.compact()  # Next startup only has to read the stock file
+            except OSError as e:
+                logging.error("Could not compact %s: %s", self.journal_path, e)
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
@@ -0,0 +1,348 @@
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from itertools import accumulate
+
+import auth
+import metrics
+from benchmark import BACKENDS, environment, synthetic_catalog
+from catalog import load_catalog
+from core import Shop, ShopError
+from inventory import STOCK_FILENAME
+from search import FACETS, tokenize
+from storage import open_user_store
+
+# --- Load Generator ---
+#
+# Simulates many shoppers at once against the shop logic itself (no Tk, no network), to
+# size deployments and to check a change under load:
+#
+#   python loadgen.py --sessions 2000                      # generated traffic, report in loadgen-results.json
+#   python loadgen.py --sessions 500 --record trace.jsonl  # ...and keep the sessions that ran
+#   python loadgen.py --replay trace.jsonl                 # run exactly those sessions again
+#
+# Every session follows the shopper funnel: sign up, log in, a few searches, add some of
+# the results to the cart, maybe a coupon, maybe check out, log out. Searches draw their
+# terms from the catalog's vocabulary with Zipf-distributed popularity, and shoppers pause
+# between steps for a log-normally distributed think time. Sessions start spread over
+# --ramp seconds and all run concurrently on one asyncio loop, the way api_server.py
+# serves them; --speed divides every pause, to push more load through in less time.
+#
+# The report has throughput, p50/p95/p99 latency per step, and write amplification:
+# bytes the process wrote to disk (the store, stock.json) per byte of account and order
+# records the shoppers created.
+#
+# A trace is JSON Lines: a header with the catalog settings, then one line per session
+# with its start offset and its steps as [think seconds, action, arguments]. Items added
+# to the cart are recorded by name, so a replay buys exactly the same things.
+
+DEFAULT_SESSIONS = 1000
+THINK_MEDIAN = 3.0       # Seconds a shopper pauses between steps, typically...
+THINK_SIGMA = 1.0        # ...with a long tail (sigma of the log-normal)
+ZIPF_EXPONENT = 1.1      # Popularity of the n-th most common search term falls off as 1/n**s
+SEARCH_TERMS = 500       # Most common catalog words used as search terms
+PASSWORD = "load-test-password"
+TRACE_VERSION = 1
+
+
+# --- Planning sessions ---
+
+def search_terms(catalog, limit=SEARCH_TERMS):
+    """Returns the words of the most product names and descriptions, most common first, leaving out stop words."""
+    counts = Counter()
+    for name, product in catalog.items():
+        counts.update({token for token in tokenize(f"{name} {product['desc']}") if not token.isdigit()})
+    # Words in most products ("a", "for") are never worth searching for
+    return [term for term, count in counts.most_common() if count <= len(catalog) / 2][:limit]
+
+
+class Zipf:
+    """Draws values with Zipf-distributed probability: the first one most often."""
+
+    def __init__(self, values, exponent=ZIPF_EXPONENT):
+        self.values = values
+        self.cum_weights = list(accumulate(1 / rank ** exponent for rank in range(1, len(values) + 1)))
+
+    def draw(self, rng):
+        return rng.choices(self.values, cum_weights=self.cum_weights)[0]
+
+
+def plan_session(number, rng, terms, facet_values, coupons, think_median=THINK_MEDIAN):
+    """Generates one shopper's steps as [think seconds, action, arguments]."""
+    think = lambda: round(rng.lognormvariate(math.log(think_median), THINK_SIGMA), 3)
+    steps = [[0, "signup", {}], [think(), "login", {}]]
+    added = 0
+    for _ in range(1 + min(int(rng.expovariate(0.5)), 10)):  # Two searches on average
+        if rng.random() < 0.15:
+            facet = rng.choice(FACETS)  # Browsing a category instead of typing
+            steps.append([think(), "search", {"q": "", facet: rng.choice(facet_values[facet])}])
+        else:
+            steps.append([think(), "search", {"q": terms.draw(rng)}])
+        if rng.random() < 0.6:
+            # Shoppers mostly pick from the top of the results
+            steps.append([think(), "add_to_cart", {"rank": min(int(rng.expovariate(0.4)), 19)}])
+            added += 1
+    if added and coupons and rng.random() < 0.3:
+        code = rng.choice(coupons) if rng.random() < 0.9 else "NOTACODE"
+        steps.append([think(), "apply_coupon", {"code": code}])
+    if added and rng.random() < 0.7:
+        steps.append([think(), "checkout", {}])
+    steps.append([think(), "logout", {}])
+    return {"session": number, "user": f"shopper{number}", "steps": steps}
+
+
+def plan_sessions(count, seed, catalog, coupons, ramp, think_median):
+    rng = random.Random(seed)
+    terms = Zipf(search_terms(catalog))
+    facet_values = {facet: catalog.facet_values(facet) for facet in FACETS}
+    plans = []
+    for number in range(count):
+        plan = plan_session(number, rng, terms, facet_values, coupons, think_median)
+        plan["start"] = round(rng.uniform(0, ramp), 3)
+        plans.append(plan)
+    return plans
+
+
+# --- Running sessions ---
+
+class LoadRun:
+    """Runs planned sessions against a Shop and collects latencies, outcomes and the steps as run."""
+
+    def __init__(self, shop, speed=1.0):
+        self.shop = shop
+        self.speed = speed
+        self.latencies = {}      # action -> [seconds]
+        self.outcomes = {}       # action -> Counter of "ok", "rejected" (a ShopError), "error"
+        self.logical_bytes = 0   # JSON size of the accounts and orders created
+        self.orders = 0
+        self.trace = []          # Sessions as they ran, for --record
+
+    async def run(self, plans):
+        self.started = time.perf_counter()
+        await asyncio.gather(*(self.run_session(plan) for plan in plans))
+        self.elapsed = time.perf_counter() - self.started
+
+    async def run_session(self, plan):
+        await asyncio.sleep(plan["start"] / self.speed)
+        session = self.shop.new_session()
+        state = {"results": []}
+        steps = []
+        for think, action, args in plan["steps"]:
+            await asyncio.sleep(think / self.speed)
+            if action == "add_to_cart" and "item" not in args:
+                # Recorded by name, so a replay adds the same item even if its search ranks differently
+                results = state["results"] or self.shop.search()  # Nothing found: pick from the catalog's first page
+                if not results:
+                    # An empty catalog too: there is nothing to add, so count it as the shop refusing the step
+                    self.outcomes.setdefault(action, Counter())["rejected"] += 1
+                    steps.append([think, action, args])
+                    continue
+                args = {"item": results[args["rank"] % min(len(results), 20)]}
+            started = time.perf_counter()
+            try:
+                await self.step(session, plan["user"], state, action, args)
+                outcome = "ok"
+            except ShopError:
+                outcome = "rejected"  # Expected now and then: a bad coupon, an item out of stock
+            except Exception as e:
+                outcome = "error"
+                logging.error("Session %s failed at %s: %s", plan["session"], action, e)
+            self.latencies.setdefault(action, []).append(time.perf_counter() - started)
+            self.outcomes.setdefault(action, Counter())[outcome] += 1
+            steps.append([think, action, args])
+        self.trace.append(dict(plan, steps=steps))
+
+    async def step(self, session, user, state, action, args):
+        """Runs one step of a session."""
+        shop = self.shop
+        if action == "signup":
+            email = f"{user}@example.com"
+            hashed = await asyncio.wrap_future(shop.check_signup(user, PASSWORD, email))
+            # Saves the account, so it runs off the event loop like api_server's handlers
+            await asyncio.get_running_loop().run_in_executor(None, shop.finish_signup, user, hashed, email)
+            self.logical_bytes += len(json.dumps({user: {"password": hashed, "email": email, "wishlist": [], "orders": []}}))
+        elif action == "login":
+            result = await asyncio.wrap_future(shop.check_login(user, PASSWORD))
+            # May save a rehashed password
+            await asyncio.get_running_loop().run_in_executor(None, shop.finish_login, session, user, result)
+        elif action == "search":
+            filters = {facet: args[facet] for facet in FACETS if facet in args}
+            state["results"] = shop.search(args.get("q", ""), **filters)
+        elif action == "add_to_cart":
+            shop.add_to_cart(session, args["item"])
+        elif action == "apply_coupon":
+            shop.apply_coupon(session, args["code"])
+        elif action == "checkout":
+            order = await asyncio.wrap_future(shop.submit_order(session))
+            self.logical_bytes += len(json.dumps(order))
+            self.orders += 1
+        elif action == "logout":
+            shop.logout(session)
+        else:
+            raise ValueError(f"Unknown action {action!r}")
+
+
+# --- Reporting ---
+
+def process_bytes_written():
+    """Bytes this process has passed to write() so far (Linux), or None where that isn't available."""
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(len(ordered) * p / 100) - 1))]
+
+
+def report(run, bytes_written):
+    steps = {}
+    for action, samples in run.latencies.items():
+        ordered = sorted(samples)
+        steps[action] = dict({"count": len(ordered),
+                              "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+                              "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+                              "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+                              "max_ms": round(ordered[-1] * 1000, 3)}, **run.outcomes[action])
+    total_steps = sum(len(samples) for samples in run.latencies.values())
+    return {
+        "sessions": len(run.trace),
+        "elapsed_s": round(run.elapsed, 3),
+        "steps_per_s": round(total_steps / run.elapsed, 1),
+        "orders": run.orders,
+        "orders_per_s": round(run.orders / run.elapsed, 1),
+        "bytes_written": bytes_written,
+        "logical_bytes": run.logical_bytes,
+        "write_amplification": round(bytes_written / run.logical_bytes, 2) if bytes_written and run.logical_bytes else None,
+        "steps": steps,
+    }
+
+
+def print_report(result):
+    print(f"{result['sessions']} sessions in {result['elapsed_s']:.1f} s: {result['steps_per_s']} steps/s, "
+          f"{result['orders']} orders ({result['orders_per_s']}/s)")
+    print(f"{'Step':<16}{'count':>8}{'ok':>8}{'rejected':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for action, stats in result["steps"].items():
+        print(f"{action:<16}{stats['count']:>8}{stats.get('ok', 0):>8}{stats.get('rejected', 0):>10}{stats.get('error', 0):>8}"
+              f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}")
+    if result["write_amplification"] is not None:
+        print(f"Wrote {result['bytes_written']} bytes for {result['logical_bytes']} bytes of records: "
+              f"write amplification {result['write_amplification']}x")
+
+
+# --- Traces ---
+
+def write_trace(path, header, sessions):
+    with open(path, "w") as f:
+        f.write(json.dumps(dict(header, trace=TRACE_VERSION)) + "\n")
+        for session in sorted(sessions, key=lambda session: session["session"]):
+            f.write(json.dumps(session) + "\n")
+
+
+def read_trace(path):
+    """Returns (header, sessions) of a recorded trace. Raises ValueError for a file that isn't one."""
+    with open(path, "r") as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("trace") != TRACE_VERSION:
+            raise ValueError(f"{path} is not a version {TRACE_VERSION} load trace")
+        sessions = [json.loads(line) for line in f if line.strip()]
+    return header, sessions
+
+
+# --- Running ---
+
+def build_catalog(settings):
+    if settings["catalog"]:
+        catalog = load_catalog(settings["catalog"])
+    else:
+        catalog = synthetic_catalog(settings["catalog_size"], random.Random(settings["seed"]))
+    if settings["stock"] is not None:
+        catalog.stock.update((name, settings["stock"]) for name in catalog)
+    return catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent shoppers against the shop logic.")
+    parser.add_argument("--sessions", type=int, default=DEFAULT_SESSIONS, help="shopper sessions to run")
+    parser.add_argument("--ramp", type=float, default=60.0, help="seconds over which the sessions start")
+    parser.add_argument("--think", type=float, default=THINK_MEDIAN, help="median think time between steps, in seconds")
+    parser.add_argument("--speed", type=float, default=1.0, help="divide every start offset and think time by this")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--catalog", help="CSV or JSON Lines product feed (default: a synthetic catalog)")
+    parser.add_argument("--catalog-size", type=int, default=10_000, help="products in the synthetic catalog")
+    parser.add_argument("--stock", type=int, help="give every product this many units (default: stock isn't limited)")
+    parser.add_argument("--backend", choices=BACKENDS, default="sqlite", help="user store to write to")
+    parser.add_argument("--data-dir", help="keep the store here instead of in a temporary directory")
+    parser.add_argument("--bcrypt-rounds", type=int, default=4,
+                        help="bcrypt cost for sign-ups (default: 4; the app's own is %s)" % auth.BCRYPT_ROUNDS)
+    parser.add_argument("--record", metavar="TRACE", help="write the sessions as run to this JSON Lines trace")
+    parser.add_argument("--replay", metavar="TRACE", help="run the sessions of a recorded trace instead of generating them")
+    parser.add_argument("--output", default="loadgen-results.json")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)  # Shoppers' rejected coupons etc. are expected; log writes would also count as bytes written
+    auth.BCRYPT_ROUNDS = args.bcrypt_rounds
+    metrics.enable()
+
+    settings = {"catalog": args.catalog, "catalog_size": args.catalog_size, "seed": args.seed, "stock": args.stock}
+    if args.replay:
+        try:
+            header, plans = read_trace(args.replay)
+        except (OSError, ValueError) as e:
+            sys.exit(f"Could not read trace: {e}")
+        settings.update((key, header[key]) for key in settings if key in header)
+    catalog = build_catalog(settings)
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="loadgen-")
+    os.makedirs(data_dir, exist_ok=True)
+    store = open_user_store(args.backend, data_dir)
+    store.load()
+    shop = Shop(catalog, store, stock_path=os.path.join(data_dir, STOCK_FILENAME))
+    if not args.replay:
+        plans = plan_sessions(args.sessions, args.seed, catalog, list(shop.promotions), args.ramp, args.think)
+    shop.warm_up()  # So the first searches don't time the indexing
+
+    print(f"Running {len(plans)} sessions against {len(catalog)} products ({args.backend} store in {data_dir})...", flush=True)
+    run = LoadRun(shop, args.speed)
+    written_before = process_bytes_written()
+    try:
+        asyncio.run(run.run(plans))
+    finally:
+        shop.close()
+        store.flush()
+        store.close()
+    written_after = process_bytes_written()
+    if written_before is not None:
+        bytes_written = written_after - written_before
+    else:
+        bytes_written = metrics.snapshot()["counters"].get("storage.bytes_written")  # JSON and journal stores only
+    auth.shutdown()
+
+    result = report(run, bytes_written)
+    print_report(result)
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment(), "settings": vars(args), "result": result,
+                   "metrics": metrics.snapshot()}, f, indent=4)
+    print(f"Wrote the report to {args.output}")
+    if args.record:
+        write_trace(args.record, settings, run.trace)
+        print(f"Recorded {len(run.trace)} sessions to {args.record}")
+    if not args.data_dir:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
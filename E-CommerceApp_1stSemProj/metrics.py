@@ -0,0 +1,204 @@
+import functools
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+
+# --- Performance Instrumentation ---
+#
+# Opt-in with MARKETPLACE_METRICS=1 (or enable()). While off, every helper below returns
+# after one flag check. While on, a timing costs two perf_counter() calls and a bisect
+# into a fixed table of buckets, so it can stay on in production:
+#
+#   @metrics.timed("storage.flush")          # every call of the function
+#   with metrics.timer("products.render"):   # a block
+#   metrics.count("widgets.created")         # counters
+#
+# Histograms have BUCKETS_PER_DOUBLING log-spaced buckets per doubling of the duration,
+# so a reported percentile is within about 10% of the true value, however many samples.
+
+BUCKETS_PER_DOUBLING = 4
+MIN_SECONDS = 1e-6
+MAX_SECONDS = 120.0
+_BOUNDS = []  # Upper bound (seconds) of every bucket; one more bucket catches anything above
+_bound = MIN_SECONDS
+while _bound < MAX_SECONDS:
+    _BOUNDS.append(_bound)
+    _bound *= 2 ** (1 / BUCKETS_PER_DOUBLING)
+
+PERCENTILES = (50, 95, 99)
+
+_enabled = os.environ.get("MARKETPLACE_METRICS", "") not in ("", "0")
+_lock = threading.Lock()
+_histograms = {}  # name -> Histogram
+_counters = {}    # name -> number
+_started = time.time()
+
+
+class Histogram:
+    """Counts of durations per bucket, plus count, sum and maximum."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        """Records one duration. Called with _lock held."""
+        self.buckets[bisect_left(_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """Returns the duration (seconds) that p percent of the samples did not exceed."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                # Geometric middle of the bucket, but never past the largest sample
+                upper = _BOUNDS[index] if index < len(_BOUNDS) else self.max
+                lower = _BOUNDS[index - 1] if index else upper
+                return min(math.sqrt(lower * upper), self.max)
+        return self.max
+
+
+def enabled():
+    return _enabled
+
+
+def enable(on=True):
+    """Switches collection on (or off) at runtime."""
+    global _enabled
+    _enabled = on
+
+
+def observe(name, seconds):
+    """Adds one duration to the histogram 'name'."""
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.add(seconds)
+
+
+def count(name, n=1):
+    """Adds 'n' to the counter 'name' (e.g. widgets created, bytes written)."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+class _Timer:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+def timer(name):
+    """Context manager recording how long its block takes under 'name'."""
+    return _Timer(name) if _enabled else _NO_TIMER
+
+
+def timed(name):
+    """Decorator recording the duration of every call under 'name'."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def time_future(name, future):
+    """Records how long 'future' takes from now until it finishes, queueing included."""
+    if _enabled:
+        started = time.perf_counter()
+        future.add_done_callback(lambda f: observe(name, time.perf_counter() - started))
+    return future
+
+
+def snapshot():
+    """Returns every timer and counter as a JSON-serialisable dict (durations in milliseconds)."""
+    with _lock:
+        timers = {}
+        for name, histogram in sorted(_histograms.items()):
+            stats = {"count": histogram.count,
+                     "mean_ms": round(histogram.total / histogram.count * 1000, 3),
+                     "max_ms": round(histogram.max * 1000, 3)}
+            for p in PERCENTILES:
+                stats[f"p{p}_ms"] = round(histogram.percentile(p) * 1000, 3)
+            timers[name] = stats
+        counters = dict(sorted(_counters.items()))
+    return {"enabled": _enabled, "uptime_s": round(time.time() - _started, 1),
+            "taken": datetime.now().isoformat(timespec="seconds"), "timers": timers, "counters": counters}
+
+
+def format_report(data=None):
+    """Formats a snapshot as a plain-text table."""
+    data = data or snapshot()
+    if not data["enabled"] and not data["timers"] and not data["counters"]:
+        return "Instrumentation is off. Start the app with MARKETPLACE_METRICS=1 to collect timings."
+    lines = [f"{'Timer':<28}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+    for name, stats in data["timers"].items():
+        lines.append(f"{name:<28}{stats['count']:>8}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+                     f"{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}")
+    lines.append("")
+    lines.append(f"{'Counter':<28}{'value':>8}")
+    for name, value in data["counters"].items():
+        lines.append(f"{name:<28}{value:>8}")
+    return "\n".join(lines)
+
+
+def export(path):
+    """Writes a snapshot to 'path' as JSON and returns it."""
+    data = snapshot()
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4)
+    return data
+
+
+def reset():
+    """Forgets every timing and counter collected so far."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
@@ -0,0 +1,217 @@
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+
+import metrics
+
+# --- Order Service ---
+#
+# Placing an order only queues it and returns a Future; a committer thread saves whatever
+# orders have queued up with one store.add_orders() call (one SQLite transaction, one
+# journal fsync or one users.json rewrite), so concurrent checkouts share a commit instead
+# of each waiting for its own.
+#
+# Order IDs are time-ordered and unique: ORD-<milliseconds>-<sequence>-<node>, where the
+# sequence counts orders within the same millisecond and the node is random per process,
+# so several servers sharing one store can't hand out the same ID.
+#
+# A checkout may carry an idempotency key. Submitting the same key for the same user again
+# (a double-clicked "Confirm and Pay", a retried request) returns the first order's Future
+# instead of placing a second order.
+#
+# An order that can't be saved fails its Future with OrderNotSaved, which hands back the
+# 'context' it was submitted with (the shop passes the cart) so the caller can put things
+# back on its own thread.
+
+IDEMPOTENCY_KEYS = 10_000  # Keys remembered, oldest forgotten first
+MAX_BATCH = 256            # Most orders saved in one commit
+
+
+class OrderNotSaved(Exception):
+    """The store failed to save an order: 'error' is the storage error, 'context' what submit() was given."""
+
+    def __init__(self, error, context=None):
+        super().__init__(str(error))
+        self.error = error
+        self.context = context
+
+
+class OrderIdGenerator:
+    """Hands out unique, increasing order IDs, even when the clock repeats or steps back."""
+
+    def __init__(self, node=None):
+        self.node = node or secrets.token_hex(3)
+        self.last_ms = 0
+        self.seq = 0
+        self.lock = threading.Lock()
+
+    def next_id(self):
+        with self.lock:
+            now_ms = int(time.time() * 1000)
+            if now_ms > self.last_ms:
+                self.last_ms, self.seq = now_ms, 0
+            else:
+                self.seq += 1
+            return f"ORD-{self.last_ms}-{self.seq:04d}-{self.node}"
+
+
+class OrderService:
+    """Creates orders with unique IDs and group-commits them to a user store on a background thread."""
+
+    def __init__(self, store, on_saved=None, before_commit=None):
+        self.store = store
+        self.on_saved = on_saved       # on_saved(username, order) runs on the committer thread after each save
+        self.before_commit = before_commit  # before_commit() runs on the committer thread before each batch is saved
+        self.ids = OrderIdGenerator()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.commit_lock = threading.Lock()  # Held from saving a batch until on_saved has seen all of it
+        self.pending = []              # [(username, order, idempotency key, on_failure, context, future)] waiting for the next commit
+        self.by_key = OrderedDict()    # (username, idempotency key) -> Future of the order placed with it
+        self.stopping = False
+        self.committer = threading.Thread(target=self._commit_loop, name="orders", daemon=True)
+        self.committer.start()
+
+    def find(self, username, idempotency_key):
+        """Returns the Future of the order 'username' already placed with this key, or None."""
+        if idempotency_key is None:
+            return None
+        with self.lock:
+            return self.by_key.get((username, idempotency_key))
+
+    def claim(self, username, idempotency_key):
+        """
+        Registers a key before its order is ready to submit, e.g. while stock is taken for it.
+        Returns (Future, True) for a new key, to pass to submit() or abandon(); or the Future
+        of the order already placed (or being placed) with it and False.
+        """
+        with self.lock:
+            existing = self.by_key.get((username, idempotency_key))
+            if existing is not None:
+                return existing, False
+            future = self.by_key[(username, idempotency_key)] = Future()
+            if len(self.by_key) > IDEMPOTENCY_KEYS:
+                self.by_key.popitem(last=False)
+            return future, True
+
+    def abandon(self, username, idempotency_key, future, error):
+        """Gives up a claim() whose order won't be submitted: forgets the key and fails its Future with 'error'."""
+        with self.lock:
+            if self.by_key.get((username, idempotency_key)) is future:
+                del self.by_key[(username, idempotency_key)]
+        future.set_exception(error)  # Whoever repeated the key meanwhile gets the same error
+
+    def submit(self, username, items, total, idempotency_key=None, on_failure=None, context=None, future=None,
+               unit_cents=None):
+        """
+        Queues a new order and returns a Future with the order dict once it is saved; 'unit_cents'
+        ({name: price in cents}) records what each item sold for.
+        If the key was used before, returns that order's Future instead, unless 'future' is
+        the one claim() returned for it. If the order can't be saved, on_failure() is called
+        on the committer thread and the Future fails with OrderNotSaved carrying 'context'.
+        """
+        with self.lock:
+            if self.stopping:
+                raise RuntimeError("The order service has been shut down")
+            if idempotency_key is not None and future is None:
+                existing = self.by_key.get((username, idempotency_key))
+                if existing is not None:
+                    return existing
+            order = {
+                "order_id": self.ids.next_id(),
+                "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "items": items,
+                "total": total,
+            }
+            if unit_cents is not None:
+                order["unit_cents"] = unit_cents
+            if future is None:
+                future = Future()
+                if idempotency_key is not None:
+                    self.by_key[(username, idempotency_key)] = future
+                    if len(self.by_key) > IDEMPOTENCY_KEYS:
+                        self.by_key.popitem(last=False)
+            self.pending.append((username, order, idempotency_key, on_failure, context, future))
+            self.wakeup.notify()
+        return future
+
+    def _commit_loop(self):
+        while True:
+            with self.lock:
+                while not self.pending and not self.stopping:
+                    self.wakeup.wait()
+                if not self.pending:
+                    return  # Shutting down and everything is saved
+                batch, self.pending = self.pending[:MAX_BATCH], self.pending[MAX_BATCH:]
+            try:
+                self._commit(batch)
+            except Exception as e:
+                # Never leave a checkout waiting forever, and keep committing the orders behind this batch
+                logging.exception("Order commit failed: %s", e)
+                for *_, context, future in batch:
+                    if not future.done():
+                        future.set_exception(OrderNotSaved(e, context))
+
+    def _call(self, hook, *args):
+        """Runs a hook on the committer thread, logging rather than raising if it fails."""
+        try:
+            hook(*args)
+        except Exception as e:
+            logging.exception("Order service hook %s failed: %s", getattr(hook, "__name__", hook), e)
+
+    def _commit(self, batch):
+        """Saves one batch of orders and settles their Futures."""
+        if self.before_commit is not None:
+            self._call(self.before_commit)
+        error = self._save(batch)
+        if error is not None:
+            logging.error("Could not save %s order(s): %s", len(batch), error)
+            with self.lock:
+                # A retry with the same key should try again rather than get this failure back
+                for username, _, key, _, _, future in batch:
+                    if self.by_key.get((username, key)) is future:
+                        del self.by_key[(username, key)]
+            for _, _, _, on_failure, context, future in batch:
+                if on_failure is not None:
+                    self._call(on_failure)
+                future.set_exception(OrderNotSaved(error, context))
+            return
+        metrics.count("orders.committed", len(batch))
+        metrics.count("orders.commits")
+        for username, order, _, _, _, future in batch:
+            logging.info("User '%s' placed order %s for total $%.2f.", username, order['order_id'], order['total'],
+                         extra={"event": "order_placed", "user": username, "order_id": order['order_id'],
+                                "total": order['total'], "batch": len(batch)})
+            future.set_result(order)
+
+    def _save(self, batch):
+        """Writes one batch to the store and passes it to on_saved. Returns the storage error, if any."""
+        with self.commit_lock:
+            try:
+                with metrics.timer("orders.commit"):
+                    self.store.add_orders([(username, order) for username, order, *_ in batch])
+            except Exception as e:
+                return e
+            if self.on_saved is not None:
+                for username, order, *_ in batch:
+                    self._call(self.on_saved, username, order)
+        return None
+
+    def between_commits(self, function):
+        """
+        Calls function() and returns its result while no batch is being saved, so every order
+        in the store has already been passed to on_saved and no other order is on its way.
+        """
+        with self.commit_lock:
+            return function()
+
+    def close(self):
+        """Saves the orders still queued and stops the committer."""
+        with self.lock:
+            self.stopping = True
+            self.wakeup.notify()
+        self.committer.join()
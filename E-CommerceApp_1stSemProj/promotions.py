@@ -0,0 +1,123 @@
+import json
+import logging
+from datetime import date
+
+from cart import to_cents, format_cents
+from search import FACETS
+
+# --- Promotions ---
+#
+# Coupon definitions come from a JSON file (coupons.json next to the app), one object per code:
+#
+#   {"code": "DISCOUNT20", "type": "percent", "value": 20}
+#   {"code": "SHIRTS5", "type": "fixed", "value": 5, "product": "Shirts", "min_spend": 40, "expires": "2026-12-31"}
+#
+#   type       "percent" (value = percent off) or "fixed" (value = dollars off)
+#   product    optional: only lines of this product type count (likewise "style")
+#   min_spend  optional: dollars the covered lines must add up to before the discount applies
+#   expires    optional: last day (YYYY-MM-DD) the code can be used
+#
+# Each definition is compiled once into a Promotion with its line filter already bound to
+# the catalog, and codes are looked up in a dict, so re-pricing a cart only runs the one
+# applied promotion over the cart's lines.
+
+PERCENT = "percent"
+FIXED = "fixed"
+
+# Used when there is no coupons.json
+DEFAULT_COUPONS = [{"code": "DISCOUNT20", "type": PERCENT, "value": 20}]
+
+
+class Promotion:
+    """One compiled coupon. discount_cents(cart) is called by the cart on every change."""
+    __slots__ = ("code", "kind", "value", "min_spend_cents", "expires", "covers", "description")
+
+    def __init__(self, code, kind, value, min_spend_cents=0, expires=None, covers=None, description=""):
+        self.code = code
+        self.kind = kind
+        self.value = value                      # Percent for PERCENT, cents for FIXED
+        self.min_spend_cents = min_spend_cents
+        self.expires = expires                  # datetime.date or None
+        self.covers = covers                    # covers(item_name) -> bool, or None for the whole cart
+        self.description = description
+
+    def expired(self, today=None):
+        return self.expires is not None and (today or date.today()) > self.expires
+
+    def discount_cents(self, cart):
+        if self.expired():
+            return 0
+        if self.covers is None:
+            eligible_cents = cart.subtotal_cents
+        else:
+            eligible_cents = sum(line.line_cents for line in cart.lines() if self.covers(line.name))
+        if eligible_cents <= 0 or eligible_cents < self.min_spend_cents:
+            return 0
+        if self.kind == PERCENT:
+            return (eligible_cents * self.value + 50) // 100
+        return min(self.value, eligible_cents)
+
+
+def compile_promotion(definition, items):
+    """Builds a Promotion from one coupon definition. Raises KeyError or ValueError if it is invalid."""
+    code = str(definition["code"]).strip().upper()
+    if not code:
+        raise ValueError("empty code")
+    kind = definition["type"]
+    if kind == PERCENT:
+        value = int(definition["value"])
+        if not 0 < value <= 100:
+            raise ValueError(f"percent must be between 1 and 100, got {value}")
+        description = f"{value}% off"
+    elif kind == FIXED:
+        value = to_cents(definition["value"])
+        if value <= 0:
+            raise ValueError("fixed discount must be positive")
+        description = f"${format_cents(value)} off"
+    else:
+        raise ValueError(f"unknown coupon type {kind!r}")
+
+    # The category test is resolved against the catalog here, once, instead of on every re-price
+    scope = {facet: definition[facet] for facet in FACETS if definition.get(facet)}
+    if scope:
+        covers = lambda name: name in items and all(items[name][facet] == value for facet, value in scope.items())
+        label = scope.get("product", "items")
+        if "style" in scope:
+            label = f"{scope['style']} {label}"
+        description += f" {label}"
+    else:
+        covers = None
+        description += " your cart"
+
+    min_spend_cents = to_cents(definition.get("min_spend", 0))
+    if min_spend_cents:
+        description += f" when you spend ${format_cents(min_spend_cents)} or more"
+    expires = date.fromisoformat(definition["expires"]) if definition.get("expires") else None
+    if expires:
+        description += f" (until {expires.isoformat()})"
+    return Promotion(code, kind, value, min_spend_cents, expires, covers, description)
+
+
+def compile_promotions(definitions, items):
+    """Returns a code -> Promotion index. Invalid definitions are logged and skipped."""
+    promotions = {}
+    for definition in definitions:
+        try:
+            promotion = compile_promotion(definition, items)
+        except (KeyError, ValueError, TypeError, ArithmeticError) as e:  # ArithmeticError: bad Decimal amounts
+            logging.warning("Skipping invalid coupon definition %r: %s", definition, e)
+            continue
+        if promotion.code in promotions:
+            logging.warning("Duplicate coupon code %s; keeping the first definition.", promotion.code)
+            continue
+        promotions[promotion.code] = promotion
+    return promotions
+
+
+def load_coupon_definitions(path):
+    """Reads the list of coupon definitions from a JSON file."""
+    with open(path, "r") as f:
+        definitions = json.load(f)
+    if not isinstance(definitions, list):
+        raise ValueError(f"{path} must contain a JSON list of coupons")
+    return definitions
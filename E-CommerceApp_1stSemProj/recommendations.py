@@ -0,0 +1,92 @@
+import heapq
+import threading
+
+# --- "Frequently Bought Together" ---
+#
+# A sparse co-occurrence matrix over past orders: counts[a][b] is the number of orders
+# containing both a and b. Next to it every item keeps its top_k partners, best first, so
+# suggestions are a list slice instead of a scan. Orders only ever add to the counts, so a
+# new order can update those lists in place: a partner whose count rose either moves up
+# within its list or enters it by beating the last entry, O(top_k) per pair.
+
+TOP_K = 10               # Partners kept per item
+MAX_ORDER_ITEMS = 50     # Larger orders only count their first 50 distinct items (pairs grow quadratically)
+
+
+class CoOccurrence:
+    """Item co-occurrence counts from orders, with each item's top partners kept up to date."""
+
+    def __init__(self, top_k=TOP_K):
+        self.top_k = top_k
+        self.counts = {}   # item -> {other item: orders containing both}
+        self.top = {}      # item -> [(count, other item)], highest count first, at most top_k long
+        self.orders = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_orders(cls, orders, top_k=TOP_K):
+        """Builds the matrix in one pass over an iterable of order item dicts ({name: qty})."""
+        matrix = cls(top_k)
+        counts = matrix.counts
+        for items in orders:
+            names = _distinct(items)
+            matrix.orders += 1
+            for a in names:
+                row = counts.setdefault(a, {})
+                for b in names:
+                    if a != b:
+                        row[b] = row.get(b, 0) + 1
+        # Top lists are picked once at the end rather than maintained during the pass
+        for item, row in counts.items():
+            matrix.top[item] = heapq.nlargest(top_k, ((count, other) for other, count in row.items()),
+                                              key=lambda pair: pair[0])
+        return matrix
+
+    def add_order(self, items):
+        """Counts one new order."""
+        names = _distinct(items)
+        with self.lock:
+            self.orders += 1
+            for a in names:
+                row = self.counts.setdefault(a, {})
+                for b in names:
+                    if a != b:
+                        count = row.get(b, 0) + 1
+                        row[b] = count
+                        self._promote(a, b, count)
+
+    def _promote(self, item, other, count):
+        """Moves 'other' up (or into) item's top list now that their count is 'count'."""
+        top = self.top.setdefault(item, [])
+        for index, (_, name) in enumerate(top):
+            if name == other:
+                del top[index]
+                break
+        else:
+            if len(top) >= self.top_k and count <= top[-1][0]:
+                return
+        index = len(top)
+        while index > 0 and top[index - 1][0] < count:
+            index -= 1
+        top.insert(index, (count, other))
+        del top[self.top_k:]
+
+    def related(self, item, k=5):
+        """Returns up to k items most often bought with 'item', best first."""
+        with self.lock:
+            return [other for _, other in self.top.get(item, ())[:k]]
+
+    def suggest(self, items, k=3):
+        """Returns up to k items most often bought with any of 'items', leaving out 'items' themselves."""
+        scores = {}
+        with self.lock:
+            for item in items:
+                for count, other in self.top.get(item, ()):
+                    if other not in items:
+                        scores[other] = scores.get(other, 0) + count
+        return heapq.nlargest(k, scores, key=scores.__getitem__)
+
+
+def _distinct(items):
+    names = list(dict.fromkeys(items))
+    return names[:MAX_ORDER_ITEMS]
@@ -0,0 +1,175 @@
+import tkinter as tk
+from tkinter import ttk
+
+import metrics
+
+# --- Reconciling List Renderer ---
+
+class KeyedRows:
+    """
+    Keeps one persistent row widget per key inside 'parent'.
+    render() only creates rows for new keys, updates rows whose data changed,
+    and hides/re-packs rows whose visibility or position changed.
+    """
+
+    def __init__(self, parent, create_row, update_row, empty_text=None, empty_pady=20, **pack_opts):
+        self.parent = parent
+        self.create_row = create_row  # create_row(parent, key) -> widget
+        self.update_row = update_row  # update_row(widget, key, data)
+        self.pack_opts = pack_opts or {"fill": tk.X}
+        self.rows = {}    # key -> widget
+        self.data = {}    # key -> data the widget currently shows
+        self.order = []   # keys currently packed, in display order
+        self.empty_label = ttk.Label(parent, text=empty_text, style="TLabel") if empty_text else None
+        self.empty_pady = empty_pady
+        self.empty_shown = False
+
+    def render(self, entries):
+        """Shows exactly the (key, data) pairs in 'entries', in that order."""
+        metrics.count("renders")
+        new_keys = [key for key, _ in entries]
+        new_set = set(new_keys)
+        old_set = set(self.order)
+
+        # Hide rows that dropped out of the list
+        for key in self.order:
+            if key not in new_set:
+                self.rows[key].pack_forget()
+
+        # Create missing rows and refresh the ones whose data changed
+        for key, data in entries:
+            row = self.rows.get(key)
+            if row is None:
+                row = self.rows[key] = self.create_row(self.parent, key)
+                metrics.count("widgets.created")
+            if key not in self.data or self.data[key] != data:
+                self.update_row(row, key, data)
+                self.data[key] = data
+
+        kept_old_order = [key for key in self.order if key in new_set]
+        kept_new_order = [key for key in new_keys if key in old_set]
+        if kept_old_order == kept_new_order:
+            # Relative order unchanged, only slot the newly visible rows in place
+            prev = None
+            for key in new_keys:
+                if key not in old_set:
+                    if prev is not None:
+                        self.rows[key].pack(after=self.rows[prev], **self.pack_opts)
+                    elif kept_new_order:
+                        self.rows[key].pack(before=self.rows[kept_new_order[0]], **self.pack_opts)
+                    else:
+                        self.rows[key].pack(**self.pack_opts)
+                prev = key
+        else:
+            # Order changed: re-pack the visible rows in their new sequence
+            for key in kept_old_order:
+                self.rows[key].pack_forget()
+            for key in new_keys:
+                self.rows[key].pack(**self.pack_opts)
+        self.order = new_keys
+
+        if self.empty_label is not None:
+            if not new_keys and not self.empty_shown:
+                self.empty_label.pack(pady=self.empty_pady)
+                self.empty_shown = True
+            elif new_keys and self.empty_shown:
+                self.empty_label.pack_forget()
+                self.empty_shown = False
+
+    def clear(self):
+        """Destroys every row, e.g. when the list now belongs to a different user."""
+        for row in self.rows.values():
+            row.destroy()
+        self.rows = {}
+        self.data = {}
+        self.order = []
+
+
+# --- Virtualized List Renderer ---
+
+class VirtualList:
+    """
+    Fixed-height rows drawn straight onto 'canvas'. Only the rows inside the
+    viewport plus 'overscan' rows above and below exist as widgets; they are
+    recycled as the user scrolls, so the widget count doesn't depend on len(entries).
+    """
+
+    def __init__(self, canvas, scrollbar, create_row, update_row, row_height, overscan=3, empty_text=None, padx=10, pady=5):
+        self.canvas = canvas
+        self.scrollbar = scrollbar
+        self.create_row = create_row  # create_row(canvas, None) -> widget, bound to a key by update_row
+        self.update_row = update_row  # update_row(widget, key, data)
+        self.row_height = row_height
+        self.overscan = overscan
+        self.padx = padx
+        self.pady = pady
+        self.entries = []
+        self.pool = []        # [widget, canvas window id, (key, data) currently shown]
+        self.visible = None   # (first, last) row range drawn by the last refresh
+        self.empty_item = canvas.create_text(padx, 20, text=empty_text or "", anchor="nw", state="hidden")
+
+        canvas.configure(yscrollcommand=self._on_scroll)
+        scrollbar.configure(command=self._yview)
+        canvas.bind("<Configure>", self._on_resize)
+
+    def render(self, entries):
+        """Shows the (key, data) pairs in 'entries', keeping the scroll position when possible."""
+        metrics.count("renders")
+        self.entries = entries
+        self.visible = None
+        height = len(entries) * self.row_height
+        self.canvas.configure(scrollregion=(0, 0, self.canvas.winfo_width(), height))
+        self.canvas.itemconfigure(self.empty_item, state="hidden" if entries else "normal")
+        if self.canvas.canvasy(0) > height:
+            self.canvas.yview_moveto(0)
+        self.refresh()
+
+    def refresh(self):
+        """Binds pooled row widgets to whichever rows are now inside the viewport."""
+        top = self.canvas.canvasy(0)
+        view_height = max(self.canvas.winfo_height(), self.row_height)
+        first = max(0, int(top // self.row_height) - self.overscan)
+        last = min(len(self.entries), int((top + view_height) // self.row_height) + 1 + self.overscan)
+        if (first, last) == self.visible:
+            return
+        self.visible = (first, last)
+
+        needed = max(0, last - first)
+        width = max(self.canvas.winfo_width() - 2 * self.padx, 1)
+        while len(self.pool) < needed:
+            widget = self.create_row(self.canvas, None)
+            metrics.count("widgets.created")
+            window = self.canvas.create_window(self.padx, 0, window=widget, anchor="nw",
+                                               width=width, height=self.row_height - self.pady * 2)
+            self.pool.append([widget, window, None])
+
+        # Row i always lands in slot i % len(pool), so scrolling only rebinds rows that just came into view
+        used = set()
+        for index in range(first, last):
+            slot = self.pool[index % len(self.pool)]
+            used.add(index % len(self.pool))
+            key, data = self.entries[index]
+            if slot[2] is None or slot[2][0] != key or slot[2][1] is not data:
+                self.update_row(slot[0], key, data)
+                slot[2] = (key, data)
+            self.canvas.coords(slot[1], self.padx, index * self.row_height + self.pady)
+            self.canvas.itemconfigure(slot[1], state="normal")
+        for i, slot in enumerate(self.pool):
+            if i not in used:
+                self.canvas.itemconfigure(slot[1], state="hidden")
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.refresh()
+
+    def _yview(self, *args):
+        self.canvas.yview(*args)
+        self.refresh()
+
+    def _on_resize(self, event):
+        width = max(event.width - 2 * self.padx, 1)
+        for _, window, _ in self.pool:
+            self.canvas.itemconfigure(window, width=width)
+        self.canvas.configure(scrollregion=(0, 0, event.width, len(self.entries) * self.row_height))
+        self.visible = None
+        self.refresh()
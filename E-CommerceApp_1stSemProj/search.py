@@ -0,0 +1,138 @@
+import re
+import threading
+
+# --- Product Search Index ---
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Scores per matching term: a hit in the name outranks one in the description,
+# and a whole-word hit outranks a prefix hit
+NAME_WEIGHT = 2
+DESC_WEIGHT = 1
+FULL_WORD_BONUS = 2
+
+FACETS = ("product", "style")
+
+
+def tokenize(text):
+    """Splits text into lowercase alphanumeric tokens."""
+    return TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex:
+    """
+    Prefix index over item names and descriptions, plus one set of item names per
+    facet value. Queries intersect postings starting from the smallest one, so their
+    cost follows the size of the result rather than the size of the catalog.
+    Safe to query from a worker thread while the UI thread adds or removes items.
+    """
+
+    def __init__(self, items=None):
+        self._postings = {}   # prefix -> {name: score}
+        self._doc_prefixes = {}  # name -> prefixes the item was indexed under
+        self._facets = {facet: {} for facet in FACETS}  # facet -> value -> set of names
+        self._doc_facets = {}  # name -> {facet: value}
+        self._order = {}  # name -> insertion sequence, keeps catalog order for ties
+        self._next_seq = 0
+        self._lock = threading.Lock()
+        for name, data in (items or {}).items():
+            self.add(name, data)
+
+    def __len__(self):
+        return len(self._order)
+
+    def add(self, name, data):
+        """Indexes (or re-indexes) one item; a re-indexed item keeps its catalog position."""
+        with self._lock:
+            self._add(name, data)
+
+    def _add(self, name, data):
+        seq = self._order.get(name)
+        if seq is None:
+            seq = self._next_seq
+            self._next_seq += 1
+        else:
+            self._remove(name)
+        scores = {}
+        for text, weight in ((name, NAME_WEIGHT), (data.get('desc', ''), DESC_WEIGHT)):
+            for token in tokenize(text):
+                for end in range(1, len(token) + 1):
+                    prefix = token[:end]
+                    score = weight * FULL_WORD_BONUS if end == len(token) else weight
+                    if score > scores.get(prefix, 0):
+                        scores[prefix] = score
+        for prefix, score in scores.items():
+            self._postings.setdefault(prefix, {})[name] = score
+        self._doc_prefixes[name] = list(scores)
+
+        self._doc_facets[name] = {}
+        for facet in FACETS:
+            value = data.get(facet)
+            self._facets[facet].setdefault(value, set()).add(name)
+            self._doc_facets[name][facet] = value
+
+        self._order[name] = seq
+
+    def remove(self, name):
+        """Drops one item from the index; unknown names are ignored."""
+        with self._lock:
+            self._remove(name)
+
+    def _remove(self, name):
+        if name not in self._order:
+            return
+        for prefix in self._doc_prefixes.pop(name):
+            posting = self._postings[prefix]
+            del posting[name]
+            if not posting:
+                del self._postings[prefix]
+        for facet, value in self._doc_facets.pop(name).items():
+            names = self._facets[facet][value]
+            names.discard(name)
+            if not names:
+                del self._facets[facet][value]
+        del self._order[name]
+
+    def facet_values(self, facet):
+        """Returns the sorted distinct values of a facet ('product' or 'style')."""
+        with self._lock:
+            return sorted(value for value in self._facets[facet] if value is not None)
+
+    def search(self, query="", product=None, style=None):
+        """
+        Returns the names of items matching every term of 'query' (as a word prefix in
+        the name or description) and the given facet values, best matches first.
+        """
+        with self._lock:
+            return self._search(query, product, style)
+
+    def _search(self, query, product, style):
+        terms = tokenize(query)
+        postings = []
+        for term in set(terms):
+            posting = self._postings.get(term)
+            if not posting:
+                return []
+            postings.append(posting)
+
+        facet_sets = []
+        for facet, value in (("product", product), ("style", style)):
+            if value is not None:
+                names = self._facets[facet].get(value)
+                if not names:
+                    return []
+                facet_sets.append(names)
+
+        if not postings and not facet_sets:
+            return sorted(self._order, key=self._order.__getitem__)
+
+        # Start from the smallest candidate set and only probe the others with it
+        candidates = sorted(postings + facet_sets, key=len)
+        smallest, rest = candidates[0], candidates[1:]
+        matches = [name for name in smallest if all(name in other for other in rest)]
+
+        if postings:
+            matches.sort(key=lambda name: (-sum(posting[name] for posting in postings), self._order[name]))
+        else:
+            matches.sort(key=self._order.__getitem__)
+        return matches
@@ -0,0 +1,52 @@
+# --- Observable Shopper State ---
+#
+# Whenever part of the shopper's state changes, the client publishes its topic. Every
+# view remembers which of the topics it depends on changed since it last rendered (its
+# dirty set) and only renders while it is on screen; hidden views catch up when shown.
+
+USER = "user"
+CART = "cart"
+WISHLIST = "wishlist"
+ORDERS = "orders"
+TOPICS = frozenset((USER, CART, WISHLIST, ORDERS))
+
+
+class View:
+    """One screen region that is redrawn from some of the topics."""
+
+    def __init__(self, render, is_visible):
+        self.render = render          # render(changed_topics) redraws the view
+        self.is_visible = is_visible
+        self.dirty = set(TOPICS)      # Never rendered yet, so everything counts as changed
+
+    def refresh(self):
+        """Renders the view if any of its topics changed since the last render."""
+        if self.dirty:
+            changed, self.dirty = self.dirty, set()
+            self.render(changed)
+
+
+class StateChanges:
+    """Routes published topics to the views that depend on them."""
+
+    def __init__(self):
+        self.views = {topic: [] for topic in TOPICS}
+
+    def add_view(self, topics, render, is_visible):
+        """Registers a view depending on 'topics' and returns it."""
+        view = View(render, is_visible)
+        for topic in topics:
+            self.views[topic].append(view)
+        return view
+
+    def publish(self, *topics):
+        """Marks every view depending on 'topics' dirty and re-renders the visible ones once."""
+        touched = []
+        for topic in topics:
+            for view in self.views[topic]:
+                view.dirty.add(topic)
+                if view not in touched:
+                    touched.append(view)
+        for view in touched:
+            if view.is_visible():
+                view.refresh()
@@ -0,0 +1,695 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections.abc import MutableMapping
+
+import metrics
+
+# --- User Data Persistence ---
+#
+# Every store exposes its accounts as a mapping in the same shape users.json always had:
+#   {username: {"password": ..., "email": ..., "wishlist": [...], "orders": [...]}}
+# and persists each change through one of the mutation methods below. The file-based
+# stores read everything up front; SQLite only reads an account when it is first used
+# and leaves "orders" out of it, since order history is read a page at a time through
+# orders_page() on every store.
+
+JSON_FILENAME = "users.json"
+SQLITE_FILENAME = "users.db"
+SNAPSHOT_FILENAME = "users.snapshot.json"
+JOURNAL_FILENAME = "users.journal"
+
+
+class CorruptFileError(ValueError):
+    """A store file that can't be read back; 'path' names it, so it can be set aside."""
+
+    def __init__(self, path, error):
+        super().__init__(f"{path}: {error}")
+        self.path = path
+
+
+def read_json(path):
+    """Reads a JSON file, raising CorruptFileError if it doesn't parse."""
+    with open(path, "r") as f:
+        try:
+            return json.load(f)
+        except ValueError as e:
+            raise CorruptFileError(path, e) from e
+
+
+def write_json_atomically(path, data):
+    """Writes 'data' to a temporary file and renames it over 'path', so a crash never leaves half a file."""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+            metrics.count("storage.bytes_written", f.tell())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class LazyUsers(MutableMapping):
+    """
+    The users mapping of a SqliteUserStore. Accounts are read from the database the first
+    time they are looked up and then cached, so startup doesn't depend on how many users exist.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.cache = {}
+
+    def __getitem__(self, username):
+        user = self.cache.get(username)
+        if user is None:
+            user = self.store.fetch_user(username)
+            if user is None:
+                raise KeyError(username)
+            self.cache[username] = user
+        return user
+
+    def __contains__(self, username):
+        return username in self.cache or self.store.has_user(username)
+
+    def __setitem__(self, username, user):
+        self.cache[username] = user
+
+    def __delitem__(self, username):
+        del self.cache[username]
+
+    def __iter__(self):
+        return iter(self.store.usernames())
+
+    def __len__(self):
+        return self.store.count_users()
+
+
+class UserStore:
+    """Base class for user stores; subclasses implement load() and the _persist_* hooks."""
+
+    def __init__(self, path):
+        self.path = path
+        self.users = {}
+        self.lock = threading.RLock()  # Held while self.users changes, so background writers see a consistent dict
+
+    def load(self):
+        """Prepares self.users from disk and returns it."""
+        raise NotImplementedError
+
+    def passwords(self, skip_prefixes=()):
+        """
+        (username, stored password) for every account whose password doesn't start with
+        one of 'skip_prefixes', without loading wishlists or orders.
+        """
+        return [(username, user["password"]) for username, user in self.users.items()
+                if not user["password"].startswith(tuple(skip_prefixes))]
+
+    def add_user(self, username, password_hash, email):
+        with self.lock:
+            self.users[username] = {"password": password_hash, "email": email, "wishlist": [], "orders": []}
+            self._persist_user(username)
+
+    def set_password(self, username, password_hash):
+        with self.lock:
+            self.users[username]["password"] = password_hash
+            self._persist_password(username)
+
+    def add_to_wishlist(self, username, item_name):
+        """Returns False if the item was already on the wishlist."""
+        with self.lock:
+            wishlist = self.users[username]["wishlist"]
+            if item_name in wishlist:
+                return False
+            wishlist.append(item_name)
+            self._persist_wishlist_add(username, item_name)
+            return True
+
+    def remove_from_wishlist(self, username, item_name):
+        """Returns False if the item wasn't on the wishlist."""
+        with self.lock:
+            wishlist = self.users[username]["wishlist"]
+            if item_name not in wishlist:
+                return False
+            wishlist.remove(item_name)
+            self._persist_wishlist_remove(username, item_name)
+            return True
+
+    def add_order(self, username, order):
+        self.add_orders([(username, order)])
+
+    def add_orders(self, entries):
+        """
+        Saves several (username, order) pairs at once, with a single write where the store
+        allows it. If the write fails none of them is kept, in memory either.
+        """
+        with self.lock:
+            for username, order in entries:
+                self.users[username]["orders"].append(order)
+            try:
+                self._persist_orders(entries)
+            except BaseException:
+                # Otherwise the next successful write would save them after all, and a retry twice
+                for username, _ in reversed(entries):
+                    self.users[username]["orders"].pop()
+                raise
+
+    def orders_page(self, username, offset, limit):
+        """Returns up to 'limit' of the user's orders, newest first, skipping the 'offset' newest."""
+        with self.lock:
+            orders = self.users[username]["orders"]
+            end = max(len(orders) - offset, 0)
+            return orders[max(end - limit, 0):end][::-1]
+
+    def order_count(self, username):
+        with self.lock:
+            return len(self.users[username]["orders"])
+
+    def order_mark(self):
+        """Returns a marker for the orders saved so far; iter_orders(until=marker) reads only those."""
+        with self.lock:
+            return {username: len(user["orders"]) for username, user in self.users.items()}
+
+    def iter_orders(self, until=None):
+        """Yields every order of every user (or those saved before order_mark() returned 'until'), one user at a time."""
+        with self.lock:
+            users = list(self.users.items())
+        for username, user in users:
+            with self.lock:
+                orders = user["orders"] if until is None else user["orders"][:until.get(username, 0)]
+                orders = list(orders)
+            yield from orders
+
+    def iter_order_items(self, until=None):
+        """Yields the {name: qty} items of every order, or of those iter_orders(until) reads."""
+        for order in self.iter_orders(until=until):
+            yield order["items"]
+
+    def flush(self):
+        """Makes sure everything is on disk (used when the app closes)."""
+
+    def close(self):
+        """Releases any open files or connections."""
+
+    def _persist_user(self, username):
+        raise NotImplementedError
+
+    def _persist_password(self, username):
+        raise NotImplementedError
+
+    def _persist_wishlist_add(self, username, item_name):
+        raise NotImplementedError
+
+    def _persist_wishlist_remove(self, username, item_name):
+        raise NotImplementedError
+
+    def _persist_order(self, username, order):
+        raise NotImplementedError
+
+    def _persist_orders(self, entries):
+        for username, order in entries:
+            self._persist_order(username, order)
+
+
+class JsonUserStore(UserStore):
+    """The original users.json format. Every change rewrites the whole file (atomically)."""
+
+    def load(self):
+        if os.path.exists(self.path):
+            self.users = read_json(self.path)
+        return self.users
+
+    def flush(self):
+        write_json_atomically(self.path, self.users)
+
+    def _persist_user(self, username):
+        self.flush()
+
+    def _persist_password(self, username):
+        self.flush()
+
+    def _persist_wishlist_add(self, username, item_name):
+        self.flush()
+
+    def _persist_wishlist_remove(self, username, item_name):
+        self.flush()
+
+    def _persist_order(self, username, order):
+        self.flush()
+
+    def _persist_orders(self, entries):
+        self.flush()
+
+
+class SqliteUserStore(UserStore):
+    """
+    SQLite in WAL mode with one table each for users, wishlist entries and orders.
+    Every change is a single-row transaction, so its cost doesn't grow with the number of users.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL,
+            email TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS wishlist (
+            id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL REFERENCES users(username),
+            item TEXT NOT NULL,
+            UNIQUE (username, item)
+        );
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY,
+            order_id TEXT NOT NULL,
+            username TEXT NOT NULL REFERENCES users(username),
+            date TEXT NOT NULL,
+            total REAL NOT NULL,
+            items TEXT NOT NULL,
+            unit_cents TEXT
+        );
+        CREATE INDEX IF NOT EXISTS orders_by_user ON orders (username, id);
+        CREATE INDEX IF NOT EXISTS orders_by_order_id ON orders (order_id);
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(self.SCHEMA)
+        if "unit_cents" not in {row[1] for row in self.conn.execute("PRAGMA table_info(orders)")}:
+            # Databases from before orders kept what each item sold for
+            self.conn.execute("ALTER TABLE orders ADD COLUMN unit_cents TEXT")
+
+    def load(self):
+        self.users = LazyUsers(self)  # Nothing is read until an account is looked up
+        return self.users
+
+    def fetch_user(self, username):
+        """Reads one account with its wishlist (but not its orders), or returns None if it doesn't exist."""
+        with self.lock:
+            row = self.conn.execute("SELECT password, email FROM users WHERE username = ?", (username,)).fetchone()
+            if row is None:
+                return None
+            wishlist = [item for (item,) in self.conn.execute(
+                "SELECT item FROM wishlist WHERE username = ? ORDER BY id", (username,))]
+        return {"password": row[0], "email": row[1], "wishlist": wishlist}
+
+    def has_user(self, username):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone() is not None
+
+    def usernames(self):
+        with self.lock:
+            return [username for (username,) in self.conn.execute("SELECT username FROM users ORDER BY username")]
+
+    def count_users(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def passwords(self, skip_prefixes=()):
+        # Filtered in SQL: at startup only the few legacy passwords leave the database, not every row
+        where = " AND ".join("substr(password, 1, ?) != ?" for _ in skip_prefixes) or "1"
+        params = [value for prefix in skip_prefixes for value in (len(prefix), prefix)]
+        with self.lock:
+            return self.conn.execute(f"SELECT username, password FROM users WHERE {where}", params).fetchall()
+
+    def add_user(self, username, password_hash, email):
+        with self.lock:
+            self.users[username] = {"password": password_hash, "email": email, "wishlist": []}
+            self._persist_user(username)
+
+    def add_order(self, username, order):
+        with self.lock:
+            self._persist_order(username, order)
+
+    def add_orders(self, entries):
+        with self.lock:
+            self._persist_orders(entries)
+
+    def orders_page(self, username, offset, limit):
+        # Walks the orders_by_user index backwards, so the newest pages are cheap whatever the history's length,
+        # but OFFSET still steps over every skipped row: a page 100k orders deep takes milliseconds, not microseconds
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT order_id, date, total, items, unit_cents FROM orders WHERE username = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+                (username, limit, offset)).fetchall()
+        return [self._order(*row) for row in rows]
+
+    def order_count(self, username):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM orders WHERE username = ?", (username,)).fetchone()[0]
+
+    def order_mark(self):
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM orders").fetchone()[0]
+
+    def iter_orders(self, until=None, chunk_size=1000):
+        # Keyset-paged, so the lock is only held per chunk and memory stays flat however many orders there are
+        last_id = 0
+        if until is None:
+            until = self.order_mark()
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT id, order_id, date, total, items, unit_cents FROM orders WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+                    (last_id, until, chunk_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._order(*row[1:])
+            last_id = rows[-1][0]
+
+    @staticmethod
+    def _order(order_id, date, total, items_json, unit_cents_json):
+        """Turns an orders row back into the order dict it was saved from."""
+        order = {"order_id": order_id, "date": date, "items": json.loads(items_json), "total": total}
+        if unit_cents_json is not None:
+            order["unit_cents"] = json.loads(unit_cents_json)
+        return order
+
+    @staticmethod
+    def _order_row(username, order):
+        unit_cents = order.get("unit_cents")
+        return (order["order_id"], username, order["date"], order["total"], json.dumps(order["items"]),
+                None if unit_cents is None else json.dumps(unit_cents))
+
+    def close(self):
+        self.conn.close()
+
+    def _persist_user(self, username):
+        user = self.users[username]
+        with self.conn:
+            self.conn.execute("INSERT INTO users (username, password, email) VALUES (?, ?, ?)",
+                              (username, user["password"], user["email"]))
+
+    def _persist_password(self, username):
+        with self.conn:
+            self.conn.execute("UPDATE users SET password = ? WHERE username = ?",
+                              (self.users[username]["password"], username))
+
+    def _persist_wishlist_add(self, username, item_name):
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO wishlist (username, item) VALUES (?, ?)", (username, item_name))
+
+    def _persist_wishlist_remove(self, username, item_name):
+        with self.conn:
+            self.conn.execute("DELETE FROM wishlist WHERE username = ? AND item = ?", (username, item_name))
+
+    def _persist_order(self, username, order):
+        self._persist_orders([(username, order)])
+
+    def _persist_orders(self, entries):
+        with self.conn:
+            self.conn.executemany("INSERT INTO orders (order_id, username, date, total, items, unit_cents) VALUES (?, ?, ?, ?, ?, ?)",
+                                  [self._order_row(username, order) for username, order in entries])
+
+    def is_empty(self):
+        return self.conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is None
+
+    def import_users(self, users):
+        """Inserts accounts in users.json format in one transaction. Existing usernames are skipped."""
+        imported = 0
+        with self.conn:
+            for username, user in users.items():
+                cursor = self.conn.execute("INSERT OR IGNORE INTO users (username, password, email) VALUES (?, ?, ?)",
+                                           (username, user["password"], user.get("email", "")))
+                if cursor.rowcount == 0:
+                    continue
+                imported += 1
+                self.conn.executemany("INSERT OR IGNORE INTO wishlist (username, item) VALUES (?, ?)",
+                                      [(username, item) for item in user.get("wishlist", [])])
+                self.conn.executemany(
+                    "INSERT INTO orders (order_id, username, date, total, items, unit_cents) VALUES (?, ?, ?, ?, ?, ?)",
+                    [self._order_row(username, order) for order in user.get("orders", [])])
+        return imported
+
+
+class JournalUserStore(UserStore):
+    """
+    Log-structured store: every change is appended as one JSON line to users.journal,
+    and a background thread periodically folds the journal into users.snapshot.json.
+    Each record carries a sequence number and the snapshot remembers the last one it
+    includes, so replaying snapshot + journal after a crash is always exact.
+    """
+
+    FSYNC_BATCH = 32          # fsync right away once this many records are waiting
+    FSYNC_INTERVAL = 0.05     # ...otherwise the background thread fsyncs within this many seconds
+    COMPACT_BYTES = 1024 * 1024   # Compact once the journal grows past this size
+    COMPACT_SECONDS = 300         # ...or once it has been non-empty for this long
+
+    def __init__(self, directory):
+        super().__init__(os.path.join(directory, JOURNAL_FILENAME))
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILENAME)
+        self.legacy_json_path = os.path.join(directory, JSON_FILENAME)
+        self.seq = 0                # Sequence number of the last record written
+        self.journal = None
+        self.journal_bytes = 0
+        self.unsynced = 0
+        self.last_compaction = time.monotonic()
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.worker = None
+
+    def load(self):
+        snapshot_seq = 0
+        # Nothing is opened or started until snapshot and journal are read, so a CorruptFileError leaves nothing behind
+        if os.path.exists(self.snapshot_path):
+            snapshot = read_json(self.snapshot_path)
+            try:
+                self.users, snapshot_seq = snapshot["users"], snapshot["seq"]
+            except (KeyError, TypeError) as e:
+                raise CorruptFileError(self.snapshot_path, f"missing {e}")
+        elif not os.path.exists(self.path) and os.path.exists(self.legacy_json_path):
+            # First run after switching from users.json: start from its contents
+            self.users = read_json(self.legacy_json_path)
+        self.seq = snapshot_seq
+
+        valid_bytes = 0
+        if os.path.exists(self.path):
+            torn = None
+            with open(self.path, "rb") as f:
+                for number, line in enumerate(f, 1):
+                    if torn is not None:
+                        # Only the last line can be torn by a crash; a bad one with records after it is damage
+                        raise CorruptFileError(self.path, torn)
+                    try:
+                        record = json.loads(line)
+                    except ValueError as e:
+                        torn = f"line {number}: {e}"
+                        continue
+                    valid_bytes += len(line)
+                    try:
+                        if record["seq"] > snapshot_seq:
+                            self._apply(record)
+                            self.seq = record["seq"]
+                    except (KeyError, TypeError) as e:
+                        # E.g. a record for a user the snapshot and the journal never added
+                        raise CorruptFileError(self.path, f"line {number}: bad record ({e!r})")
+            if torn is not None:
+                # A torn write at the tail from a crash; everything before it is intact
+                logging.warning("Ignoring incomplete record at the end of %s.", self.path)
+
+        self.journal = open(self.path, "ab")
+        self.journal.truncate(valid_bytes)
+        self.journal_bytes = valid_bytes
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._background_loop, name="journal", daemon=True)
+            self.worker.start()
+        return self.users
+
+    def _apply(self, record):
+        """Replays one journal record onto self.users."""
+        op, username = record["op"], record["user"]
+        if op == "add_user":
+            self.users[username] = {"password": record["password"], "email": record["email"], "wishlist": [], "orders": []}
+        elif op == "set_password":
+            self.users[username]["password"] = record["password"]
+        elif op == "wishlist_add":
+            if record["item"] not in self.users[username]["wishlist"]:
+                self.users[username]["wishlist"].append(record["item"])
+        elif op == "wishlist_remove":
+            if record["item"] in self.users[username]["wishlist"]:
+                self.users[username]["wishlist"].remove(record["item"])
+        elif op == "order":
+            self.users[username]["orders"].append(record["order"])
+
+    def _append(self, record):
+        """Writes one record to the journal. Called with self.lock held."""
+        self.seq += 1
+        record["seq"] = self.seq
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        self.journal.write(line)
+        self.journal.flush()
+        self.journal_bytes += len(line)
+        metrics.count("storage.bytes_written", len(line))
+        self.unsynced += 1
+        if self.unsynced >= self.FSYNC_BATCH:
+            self._sync()
+        else:
+            self.wakeup.set()
+
+    def _sync(self):
+        if self.unsynced:
+            os.fsync(self.journal.fileno())
+            self.unsynced = 0
+
+    def _persist_user(self, username):
+        user = self.users[username]
+        self._append({"op": "add_user", "user": username, "password": user["password"], "email": user["email"]})
+
+    def _persist_password(self, username):
+        self._append({"op": "set_password", "user": username, "password": self.users[username]["password"]})
+
+    def _persist_wishlist_add(self, username, item_name):
+        self._append({"op": "wishlist_add", "user": username, "item": item_name})
+
+    def _persist_wishlist_remove(self, username, item_name):
+        self._append({"op": "wishlist_remove", "user": username, "item": item_name})
+
+    def _persist_order(self, username, order):
+        self._append({"op": "order", "user": username, "order": order})
+
+    def _persist_orders(self, entries):
+        offset, seq, unsynced = self.journal_bytes, self.seq, self.unsynced
+        try:
+            for username, order in entries:
+                self._append({"op": "order", "user": username, "order": order})
+            self._sync()  # Orders are confirmed once saved, so don't leave them to the background fsync
+        except BaseException:
+            self._truncate(offset, seq, unsynced)
+            raise
+
+    def _truncate(self, offset, seq, unsynced):
+        """Cuts the journal back to 'offset' bytes, dropping records that failed to save. Called with self.lock held."""
+        try:
+            self.journal.close()  # Also discards whatever is still buffered
+        except OSError:
+            pass
+        try:
+            self.journal = open(self.path, "ab")
+            self.journal.truncate(offset)
+        except OSError as e:
+            logging.error("Could not drop unsaved records from %s: %s", self.path, e)
+        self.journal_bytes, self.seq, self.unsynced = offset, seq, unsynced
+
+    def _background_loop(self):
+        """Batches fsyncs and triggers compaction when the journal is big or old enough."""
+        while not self.stopping:
+            self.wakeup.wait(self.FSYNC_INTERVAL if self.unsynced else 1.0)
+            self.wakeup.clear()
+            try:
+                with self.lock:
+                    if self.journal is None:
+                        continue
+                    self._sync()
+                if self.journal_bytes >= self.COMPACT_BYTES or (
+                        self.journal_bytes and time.monotonic() - self.last_compaction >= self.COMPACT_SECONDS):
+                    self.compact()
+            except (OSError, ValueError) as e:
+                logging.error("User journal background work failed: %s", e)
+
+    def compact(self):
+        """Writes a fresh snapshot and drops the journal records it now contains."""
+        with self.lock:
+            snapshot = json.dumps({"seq": self.seq, "users": self.users})
+            snapshot_offset = self.journal_bytes
+        # The slow part runs without the lock; new changes keep going to the journal meanwhile
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=os.path.dirname(self.snapshot_path))
+        with os.fdopen(fd, "w") as f:
+            f.write(snapshot)
+            f.flush()
+            os.fsync(f.fileno())
+            metrics.count("storage.bytes_written", f.tell())
+        os.replace(tmp_path, self.snapshot_path)
+
+        with self.lock:
+            # Keep only the records appended after the snapshot was taken
+            self.journal.flush()
+            with open(self.path, "rb") as f:
+                f.seek(snapshot_offset)
+                tail = f.read()
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(tail)
+                f.flush()
+                os.fsync(f.fileno())
+            metrics.count("storage.bytes_written", len(tail))
+            self.journal.close()
+            os.replace(tmp_path, self.path)
+            self.journal = open(self.path, "ab")
+            self.journal_bytes = len(tail)
+            self.unsynced = 0
+            self.last_compaction = time.monotonic()
+        logging.info("Compacted user journal into %s.", self.snapshot_path)
+
+    def flush(self):
+        with self.lock:
+            if self.journal is not None:
+                self.journal.flush()
+                self._sync()
+
+    def close(self):
+        self.stopping = True
+        self.wakeup.set()
+        if self.worker is not None:
+            self.worker.join()
+        if self.journal is None:
+            return
+        if self.journal_bytes:
+            self.compact()  # Next startup only has to read the snapshot
+        with self.lock:
+            self.journal.close()
+            self.journal = None
+
+
+def migrate_json_to_sqlite(json_path, db_path):
+    """Copies the accounts from a users.json file into a SQLite store. Returns how many were imported."""
+    users = read_json(json_path)
+    store = SqliteUserStore(db_path)
+    try:
+        return store.import_users(users)
+    finally:
+        store.close()
+
+
+def open_user_store(backend, directory):
+    """
+    Opens the user store for 'backend' ("sqlite", "journal" or "json") in 'directory'.
+    A new SQLite store imports an existing users.json the first time it is opened, and
+    raises CorruptFileError (closing itself again) if that file can't be read.
+    """
+    json_path = os.path.join(directory, JSON_FILENAME)
+    if backend == "json":
+        return JsonUserStore(json_path)
+    if backend == "journal":
+        return JournalUserStore(directory)
+    if backend == "sqlite":
+        store = SqliteUserStore(os.path.join(directory, SQLITE_FILENAME))
+        if store.is_empty() and os.path.exists(json_path):
+            try:
+                imported = store.import_users(read_json(json_path))
+            except BaseException:
+                store.close()
+                raise
+            logging.info("Migrated %s users from %s into SQLite.", imported, json_path)
+        return store
+    raise ValueError(f"Unknown user store backend: {backend!r}")
+
+
+if __name__ == "__main__":
+    # python storage.py users.json users.db
+    import sys
+    if len(sys.argv) != 3:
+        sys.exit("usage: python storage.py <users.json> <users.db>")
+    print(f"Imported {migrate_json_to_sqlite(sys.argv[1], sys.argv[2])} users.")
@@ -0,0 +1,68 @@
+import pytest
+
+from analytics import OrderColumns, SalesAnalytics, UNKNOWN
+from core import DEFAULT_ITEMS, Shop
+from storage import JsonUserStore
+
+
+def order(items, total, unit_cents=None, day="2024-01-31"):
+    order = {"order_id": f"ORD-{day}", "date": f"{day} 12:00:00", "items": items, "total": total}
+    if unit_cents is not None:
+        order["unit_cents"] = unit_cents
+    return order
+
+
+def test_revenue_uses_the_prices_the_order_paid():
+    sold = order({"Levis Pants": 1, "Arrow Polo": 1}, 90.0, {"Levis Pants": 3000, "Arrow Polo": 6000})
+    catalog = {name: dict(item) for name, item in DEFAULT_ITEMS.items()}
+    catalog["Levis Pants"]["price"] = 500  # A later price change doesn't rewrite the order
+    analytics = SalesAnalytics.from_orders([sold], catalog)
+    assert dict((name, cents) for name, _, cents in analytics.top("item")) == {"Arrow Polo": 6000, "Levis Pants": 3000}
+    assert analytics.summary()["revenue_cents"] == 9000
+
+
+def test_items_the_catalog_dropped_still_add_up_to_the_order_total():
+    old = order({"Retired Hat": 1, "Retired Scarf": 3}, 40.0)  # Saved before orders kept their prices
+    analytics = SalesAnalytics.from_orders([old], {})
+    assert sum(cents for _, _, cents in analytics.top("item")) == 4000
+    assert analytics.top("product") == [(UNKNOWN, 4, 4000)]
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_date_range_totals_match_the_running_totals(use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    orders = [order({"Levis Pants": 2}, 70.2, {"Levis Pants": 3900}, "2024-01-30"),
+              order({"Arrow Polo": 1, "Levis Pants": 1}, 98.0, {"Arrow Polo": 5900, "Levis Pants": 3900}, "2024-02-01")]
+    columns = OrderColumns.from_orders(orders, DEFAULT_ITEMS, use_numpy)
+    assert columns.totals("item") == {name: [units, cents] for name, units, cents in
+                                      SalesAnalytics.from_orders(orders, DEFAULT_ITEMS).top("item")}
+    assert columns.totals("item", start="2024-02-01") == {"Arrow Polo": [1, 5900], "Levis Pants": [1, 3900]}
+
+
+def test_a_rebuild_counts_orders_saved_while_it_scans(tmp_path, monkeypatch):
+    store = JsonUserStore(str(tmp_path / "users.json"))
+    store.load()
+    store.add_user("admin", "hash", "admin@example.com")
+    shop = Shop(DEFAULT_ITEMS, store)
+    try:
+        session = shop.new_session()
+        session.user = "admin"
+        for _ in range(2):
+            shop.add_to_cart(session, "Levis Pants")
+            shop.place_order(session)
+        assert shop.analytics.orders == 2
+        iter_orders = store.iter_orders
+
+        def checkout_midway(until=None):
+            for n, saved in enumerate(iter_orders(until=until)):
+                if n == 0:
+                    shop.add_to_cart(session, "Arrow Polo")
+                    shop.place_order(session)
+                yield saved
+        monkeypatch.setattr(store, "iter_orders", checkout_midway)
+        analytics = shop.rebuild_analytics(session)
+        assert analytics is shop.analytics
+        assert analytics.summary() == {"orders": 3, "revenue_cents": 3900 * 2 + 5900, "units": 3}
+    finally:
+        shop.close()
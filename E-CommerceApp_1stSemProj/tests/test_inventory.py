@@ -0,0 +1,195 @@
+import threading
+
+import pytest
+
+from core import DEFAULT_ITEMS, Shop
+from inventory import Inventory, OutOfStock
+from storage import JsonUserStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def inventory(clock):
+    return Inventory({"Levis Pants": 5, "Arrow Polo": 2}, ttl=60, clock=clock)
+
+
+def test_reserve_holds_stock_until_released(inventory):
+    inventory.reserve("alice", "Levis Pants", 3)
+    assert inventory.available("Levis Pants") == 2
+    with pytest.raises(OutOfStock) as e:
+        inventory.reserve("bob", "Levis Pants", 3)
+    assert e.value.available == {"Levis Pants": 2}
+    inventory.release("alice", ["Levis Pants"])
+    assert inventory.available("Levis Pants") == 5
+
+
+def test_untracked_items_are_unlimited(inventory):
+    inventory.reserve("alice", "Pepe Jeans", 1000)
+    assert inventory.available("Pepe Jeans") is None
+
+
+def test_reservations_lapse_after_ttl(inventory, clock):
+    inventory.reserve("alice", "Arrow Polo", 2)
+    clock.now = 59
+    assert inventory.available("Arrow Polo") == 0
+    clock.now = 60
+    assert inventory.available("Arrow Polo") == 2
+
+
+def test_refreshing_a_reservation_restarts_its_ttl(inventory, clock):
+    inventory.reserve("alice", "Arrow Polo", 1)
+    clock.now = 50
+    inventory.reserve("alice", "Arrow Polo", 2)
+    clock.now = 100  # The first hold's expiry is stale by now
+    assert inventory.available("Arrow Polo") == 0
+    clock.now = 110
+    assert inventory.available("Arrow Polo") == 2
+
+
+def test_shrink_never_checks_availability(inventory, clock):
+    inventory.reserve("alice", "Arrow Polo", 2)
+    clock.now = 60  # Alice's hold lapses and Bob takes the stock
+    inventory.reserve("bob", "Arrow Polo", 2)
+    inventory.shrink("alice", "Arrow Polo", 1)
+    assert inventory.available("Arrow Polo") == 0
+    inventory.shrink("bob", "Arrow Polo", 5)  # Never grows a hold
+    assert inventory.available("Arrow Polo") == 0
+    inventory.shrink("bob", "Arrow Polo", 1)
+    assert inventory.available("Arrow Polo") == 1
+    inventory.release("bob", ["Arrow Polo"])
+    assert inventory.available("Arrow Polo") == 2
+
+
+def test_decreasing_a_lapsed_cart_line_does_not_raise(tmp_path, clock):
+    store = JsonUserStore(str(tmp_path / "users.json"))
+    store.load()
+    shop = Shop(DEFAULT_ITEMS, store)
+    shop.inventory = Inventory({"Arrow Polo": 2}, ttl=60, clock=clock)
+    try:
+        alice, bob = shop.new_session(), shop.new_session()
+        alice.user, bob.user = "alice", "bob"
+        shop.add_to_cart(alice, "Arrow Polo")
+        shop.add_to_cart(alice, "Arrow Polo")
+        clock.now = 60
+        shop.add_to_cart(bob, "Arrow Polo")
+        shop.add_to_cart(bob, "Arrow Polo")
+        shop.decrease_cart_item(alice, "Arrow Polo")
+        assert alice.cart.quantity("Arrow Polo") == 1
+        shop.logout(alice)
+        assert shop.inventory.available("Arrow Polo") == 0
+    finally:
+        shop.close()
+
+
+def test_commit_sells_every_line_or_none(inventory):
+    inventory.reserve("alice", "Levis Pants", 2)
+    inventory.reserve("bob", "Arrow Polo", 2)
+    with pytest.raises(OutOfStock) as e:
+        inventory.commit("alice", {"Levis Pants": 2, "Arrow Polo": 1})
+    assert e.value.available == {"Arrow Polo": 0}
+    assert inventory.available("Levis Pants") == 3  # Alice's hold is untouched
+    inventory.commit("alice", {"Levis Pants": 2, "Pepe Jeans": 4})
+    assert inventory.available("Levis Pants") == 3
+    assert inventory.skus["Levis Pants"].on_hand == 3
+    assert inventory.skus["Levis Pants"].holds == {}
+
+
+def test_concurrent_checkouts_never_oversell(inventory):
+    sold = []
+
+    def shopper(name):
+        try:
+            inventory.reserve(name, "Levis Pants", 1)
+            inventory.commit(name, {"Levis Pants": 1, "Arrow Polo": 0})
+            sold.append(name)
+        except OutOfStock:
+            pass
+
+    threads = [threading.Thread(target=shopper, args=(f"user{i}",)) for i in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(sold) == 5
+    assert inventory.available("Levis Pants") == 0
+
+
+def test_save_appends_only_the_changed_skus(tmp_path):
+    path = str(tmp_path / "stock.json")
+    inventory = Inventory.load(path, {"Levis Pants": 5, "Arrow Polo": 2})
+    inventory.commit("alice", {"Levis Pants": 2})
+    assert not (tmp_path / "stock.journal").exists()  # Checkout itself doesn't write
+    inventory.save()
+    inventory.save()  # Nothing changed since
+    assert (tmp_path / "stock.journal").read_text() == '{"Levis Pants":3}\n'
+    assert not (tmp_path / "stock.json").exists()
+
+    reopened = Inventory.load(path, {"Levis Pants": 5, "Arrow Polo": 2})
+    assert reopened.available("Levis Pants") == 3
+    assert reopened.available("Arrow Polo") == 2
+
+
+def test_load_ignores_a_torn_journal_line(tmp_path):
+    path = str(tmp_path / "stock.json")
+    (tmp_path / "stock.json").write_text('{"Levis Pants": 4, "Arrow Polo": 2}')
+    (tmp_path / "stock.journal").write_text('{"Levis Pants":3}\n{"Arrow Polo":')
+    inventory = Inventory.load(path, {"Levis Pants": 5, "Arrow Polo": 5})
+    assert inventory.available("Levis Pants") == 3
+    assert inventory.available("Arrow Polo") == 2
+    inventory.commit("alice", {"Arrow Polo": 1})
+    inventory.save()  # Cuts off the torn tail before appending
+    assert (tmp_path / "stock.journal").read_text() == '{"Levis Pants":3}\n{"Arrow Polo":1}\n'
+
+
+def test_close_folds_the_journal_into_the_stock_file(tmp_path):
+    path = str(tmp_path / "stock.json")
+    inventory = Inventory.load(path, {"Levis Pants": 5, "Arrow Polo": 2})
+    inventory.commit("alice", {"Levis Pants": 1})
+    inventory.save()
+    inventory.restock({"Levis Pants": 1, "Arrow Polo": 3})
+    inventory.close()
+    assert (tmp_path / "stock.journal").read_bytes() == b""
+    reopened = Inventory.load(path, {"Levis Pants": 5, "Arrow Polo": 2})
+    assert (reopened.available("Levis Pants"), reopened.available("Arrow Polo")) == (5, 5)
+
+
+def test_a_crash_before_the_journal_is_emptied_replays_to_the_same_levels(tmp_path):
+    path = str(tmp_path / "stock.json")
+    inventory = Inventory.load(path, {"Levis Pants": 5})
+    inventory.commit("alice", {"Levis Pants": 1})
+    inventory.save()
+    inventory.commit("bob", {"Levis Pants": 1})  # Not saved yet, so not in the compacted file either
+    journal = (tmp_path / "stock.journal").read_bytes()
+    with inventory.save_lock:
+        inventory.compact()
+    (tmp_path / "stock.journal").write_bytes(journal)  # As if the crash came before the truncate
+    reopened = Inventory.load(path, {"Levis Pants": 5})
+    assert reopened.available("Levis Pants") == 4
+
+
+def test_checkout_saves_stock_on_the_order_thread(tmp_path):
+    store = JsonUserStore(str(tmp_path / "users.json"))
+    store.load()
+    store.add_user("alice", "hash", "alice@example.com")
+    shop = Shop(DEFAULT_ITEMS, store, stock_path=str(tmp_path / "stock.json"))
+    try:
+        session = shop.new_session()
+        session.user = "alice"
+        shop.add_to_cart(session, "Arrow Polo")
+        shop.place_order(session)
+        assert (tmp_path / "stock.journal").read_text() == '{"Arrow Polo":39}\n'
+    finally:
+        shop.close()
+    assert Inventory.load(str(tmp_path / "stock.json"), {"Arrow Polo": 40}).available("Arrow Polo") == 39
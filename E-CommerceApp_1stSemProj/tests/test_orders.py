@@ -0,0 +1,245 @@
+import threading
+import time
+
+import pytest
+
+from core import DEFAULT_ITEMS, Shop, ShopError
+from orders import OrderIdGenerator, OrderNotSaved, OrderService
+from storage import JsonUserStore
+
+
+class FakeStore:
+    """Records each add_orders() call; fails while 'error' is set and waits while 'gate' is closed."""
+
+    def __init__(self):
+        self.batches = []
+        self.error = None
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def add_orders(self, entries):
+        self.gate.wait()
+        if self.error is not None:
+            raise self.error
+        self.batches.append(list(entries))
+
+
+@pytest.fixture
+def store():
+    return FakeStore()
+
+
+@pytest.fixture
+def service(store):
+    service = OrderService(store)
+    yield service
+    service.close()
+
+
+@pytest.fixture
+def shop(tmp_path):
+    users = JsonUserStore(str(tmp_path / "users.json"))
+    users.load()
+    users.add_user("alice", "hash", "alice@example.com")
+    shop = Shop(DEFAULT_ITEMS, users)
+    yield shop
+    shop.close()
+
+
+def test_order_ids_are_unique_and_increasing():
+    ids = OrderIdGenerator(node="abc")
+    generated = [ids.next_id() for _ in range(1000)]
+    assert len(set(generated)) == 1000
+    assert generated == sorted(generated)
+
+
+def test_orders_queued_together_share_a_commit(store, service):
+    store.gate.clear()
+    first = service.submit("alice", {"Levis Pants": 1}, 39.0)
+    futures = [service.submit(f"user{i}", {"Arrow Polo": 1}, 59.0) for i in range(10)]
+    store.gate.set()
+    assert first.result(timeout=5)["items"] == {"Levis Pants": 1}
+    assert all(future.result(timeout=5)["total"] == 59.0 for future in futures)
+    assert sum(len(batch) for batch in store.batches) == 11
+    assert len(store.batches) <= 2  # At most the first order alone, then everything queued behind it
+
+
+def test_an_idempotency_key_places_one_order(store, service):
+    first = service.submit("alice", {"Levis Pants": 1}, 39.0, idempotency_key="k1")
+    again = service.submit("alice", {"Levis Pants": 2}, 78.0, idempotency_key="k1")
+    other_user = service.submit("bob", {"Levis Pants": 1}, 39.0, idempotency_key="k1")
+    assert again is first
+    assert service.find("alice", "k1") is first
+    assert other_user.result(timeout=5)["order_id"] != first.result(timeout=5)["order_id"]
+    assert sum(len(batch) for batch in store.batches) == 2
+
+
+def test_a_failed_commit_fails_every_order_in_it(store, service):
+    store.gate.clear()
+    store.error = OSError("disk full")
+    restocked = []
+    futures = [service.submit("alice", {"Levis Pants": 1}, 39.0, idempotency_key=f"k{i}",
+                              on_failure=lambda i=i: restocked.append(i), context=f"cart{i}")
+               for i in range(3)]
+    store.gate.set()
+    for i, future in enumerate(futures):
+        with pytest.raises(OrderNotSaved) as e:
+            future.result(timeout=5)
+        assert e.value.context == f"cart{i}"
+        assert isinstance(e.value.error, OSError)
+    assert sorted(restocked) == [0, 1, 2]
+    # The keys are forgotten, so a retry places the order rather than getting the failure back
+    assert service.find("alice", "k0") is None
+    store.error = None
+    assert service.submit("alice", {"Levis Pants": 1}, 39.0, idempotency_key="k0").result(timeout=5)
+    assert len(store.batches) == 1
+
+
+def test_close_saves_the_orders_still_queued(store):
+    service = OrderService(store)
+    store.gate.clear()
+    futures = [service.submit("alice", {"Levis Pants": 1}, 39.0) for _ in range(5)]
+    store.gate.set()
+    service.close()
+    assert all(future.done() for future in futures)
+    with pytest.raises(RuntimeError):
+        service.submit("alice", {"Levis Pants": 1}, 39.0)
+
+
+def test_checkout_with_the_same_key_is_placed_once(shop):
+    session = shop.new_session()
+    session.user = "alice"
+    shop.add_to_cart(session, "Levis Pants")
+    first = shop.place_order(session, "checkout-1")
+    assert shop.place_order(session, "checkout-1") == first  # Even with the cart already emptied
+    assert shop.order_count(session) == 1
+
+
+def test_a_failed_checkout_restores_the_cart_and_its_reservations(shop, monkeypatch):
+    session, other = shop.new_session(), shop.new_session()
+    session.user, other.user = "alice", "alice"
+    for _ in range(2):
+        shop.add_to_cart(session, "Van Heusen Shirt")
+    shop.add_to_cart(session, "Levis Pants")
+
+    def disk_full(entries):
+        raise OSError("No space left on device")
+    restock = shop.inventory.restock
+
+    def restock_and_sell(lines):
+        restock(lines)
+        shop._reserve(other, "Van Heusen Shirt", 19)  # Someone else gets in before the cart is restored
+    monkeypatch.setattr(shop.store, "add_orders", disk_full)
+    monkeypatch.setattr(shop.inventory, "restock", restock_and_sell)
+    with pytest.raises(ShopError):
+        shop.place_order(session)
+
+    assert dict(session.cart.items()) == {"Van Heusen Shirt": 1, "Levis Pants": 1}
+    assert shop.inventory.available("Van Heusen Shirt") == 0
+    assert shop.inventory.available("Levis Pants") == 49
+    assert shop.order_count(session) == 0
+
+
+def test_failing_hooks_never_stop_the_committer(store):
+    def broken(*args):
+        raise RuntimeError("hook bug")
+    service = OrderService(store, on_saved=broken, before_commit=broken)
+    try:
+        for _ in range(3):
+            assert service.submit("alice", {"Levis Pants": 1}, 39.0).result(timeout=5)
+        store.error = OSError("disk full")
+        with pytest.raises(OrderNotSaved):
+            service.submit("alice", {"Levis Pants": 1}, 39.0, on_failure=broken).result(timeout=5)
+        store.error = None
+        assert service.submit("alice", {"Levis Pants": 1}, 39.0).result(timeout=5)
+    finally:
+        service.close()
+
+
+def test_concurrent_checkouts_with_the_same_key_sell_the_cart_once(shop, monkeypatch):
+    session = shop.new_session()
+    session.user = "alice"
+    shop.add_to_cart(session, "Van Heusen Shirt")
+    commit = shop.inventory.commit
+
+    def slow_commit(holder, lines):
+        commit(holder, lines)
+        time.sleep(0.2)  # The second request arrives while the first is taking the stock
+    monkeypatch.setattr(shop.inventory, "commit", slow_commit)
+    futures = []
+    threads = [threading.Thread(target=lambda: futures.append(shop.submit_order(session, "checkout-1")))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(futures) == 2 and futures[0] is futures[1]
+    assert futures[0].result(timeout=5)["items"] == {"Van Heusen Shirt": 1}
+    assert shop.inventory.available("Van Heusen Shirt") == 19
+    assert shop.order_count(session) == 1
+
+
+def test_a_key_whose_checkout_failed_can_be_retried(shop):
+    session = shop.new_session()
+    session.user = "alice"
+    with pytest.raises(ShopError):
+        shop.submit_order(session, "checkout-1")  # Empty cart
+    shop.add_to_cart(session, "Levis Pants")
+    assert shop.place_order(session, "checkout-1")["items"] == {"Levis Pants": 1}
+
+
+def test_a_checkout_the_order_service_refuses_gives_the_stock_back(shop):
+    session = shop.new_session()
+    session.user = "alice"
+    shop.add_to_cart(session, "Van Heusen Shirt")
+    shop.orders.close()
+    with pytest.raises(RuntimeError):
+        shop.submit_order(session, "checkout-1")
+    assert shop.inventory.available("Van Heusen Shirt") == 20
+
+
+def test_orders_saved_during_a_build_are_counted_once(shop, monkeypatch):
+    session = shop.new_session()
+    session.user = "alice"
+    for _ in range(3):
+        shop.add_to_cart(session, "Levis Pants")
+        shop.add_to_cart(session, "Arrow Polo")
+        shop.place_order(session)
+    iter_order_items = shop.store.iter_order_items
+
+    def checkout_midway(until=None):
+        for n, items in enumerate(iter_order_items(until)):
+            if n == 1:  # Two more orders: one saved before the scan gets to it, one after
+                for _ in range(2):
+                    shop.add_to_cart(session, "Levis Pants")
+                    shop.add_to_cart(session, "Arrow Polo")
+                    shop.place_order(session)
+            yield items
+    monkeypatch.setattr(shop.store, "iter_order_items", checkout_midway)
+    recommendations = shop.recommendations
+    assert recommendations.orders == 5
+    assert recommendations.counts["Levis Pants"]["Arrow Polo"] == 5
+    shop.add_to_cart(session, "Levis Pants")
+    shop.place_order(session)
+    assert recommendations.orders == 6
+
+
+def test_search_does_not_wait_for_the_recommendations_build(shop, monkeypatch):
+    scanning, release = threading.Event(), threading.Event()
+
+    def slow_scan(until=None):
+        scanning.set()
+        release.wait(5)
+        return iter(())
+    monkeypatch.setattr(shop.store, "iter_order_items", slow_scan)
+    build = threading.Thread(target=lambda: shop.recommendations)
+    build.start()
+    try:
+        assert scanning.wait(5)
+        started = time.monotonic()
+        assert shop.search("polo")
+        assert time.monotonic() - started < 2
+    finally:
+        release.set()
+        build.join()
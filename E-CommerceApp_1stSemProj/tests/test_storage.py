@@ -0,0 +1,240 @@
+import pytest
+
+import storage
+from storage import CorruptFileError, JournalUserStore, SqliteUserStore, open_user_store
+
+BACKENDS = ("json", "journal", "sqlite")
+
+
+def order(n):
+    return {"order_id": f"ORD-{n}", "date": "2024-01-31 12:00:00", "items": {"Levis Pants": n}, "total": 39.0 * n}
+
+
+def reopen(store, backend, directory):
+    store.close()
+    store = open_user_store(backend, str(directory))
+    store.load()
+    return store
+
+
+@pytest.fixture
+def journal(tmp_path):
+    store = JournalUserStore(str(tmp_path))
+    store.load()
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_changes_survive_a_reopen(tmp_path, backend):
+    store = open_user_store(backend, str(tmp_path))
+    store.load()
+    store.add_user("alice", "hash", "alice@example.com")
+    store.add_to_wishlist("alice", "Arrow Polo")
+    store.add_orders([("alice", order(1)), ("alice", order(2))])
+    store = reopen(store, backend, tmp_path)
+    try:
+        assert store.users["alice"]["wishlist"] == ["Arrow Polo"]
+        assert [o["order_id"] for o in store.orders_page("alice", 0, 10)] == ["ORD-2", "ORD-1"]
+        assert [o["order_id"] for o in store.orders_page("alice", 1, 10)] == ["ORD-1"]
+        assert store.order_count("alice") == 2
+    finally:
+        store.close()
+
+
+@pytest.mark.parametrize("backend", ["json", "journal"])
+def test_an_order_that_fails_to_save_is_not_kept(tmp_path, monkeypatch, backend):
+    store = open_user_store(backend, str(tmp_path))
+    store.load()
+    store.add_user("alice", "hash", "alice@example.com")
+
+    def disk_full(*args):
+        raise OSError("No space left on device")
+    if backend == "json":
+        monkeypatch.setattr(storage, "write_json_atomically", disk_full)
+    else:
+        monkeypatch.setattr(store, "_sync", disk_full)
+    with pytest.raises(OSError):
+        store.add_orders([("alice", order(1))])
+    assert store.order_count("alice") == 0
+    monkeypatch.undo()
+
+    store.add_orders([("alice", order(2))])  # Must not bring the failed order back with it
+    store = reopen(store, backend, tmp_path)
+    try:
+        assert [o["order_id"] for o in store.orders_page("alice", 0, 10)] == ["ORD-2"]
+    finally:
+        store.close()
+
+
+def crash(journal):
+    """Stops the journal store as a crash would: no compaction, nothing more written."""
+    journal.stopping = True
+    journal.worker.join()
+    journal.journal.close()
+    journal.journal = None
+
+
+def test_journal_replay_stops_at_a_torn_line(tmp_path, journal):
+    journal.add_user("alice", "hash", "alice@example.com")
+    journal.add_orders([("alice", order(1))])
+    crash(journal)
+    with open(journal.path, "ab") as f:
+        f.write(b'{"op":"order","user":"alice","ord')
+
+    store = JournalUserStore(str(tmp_path))
+    store.load()
+    try:
+        assert [o["order_id"] for o in store.users["alice"]["orders"]] == ["ORD-1"]
+        store.add_orders([("alice", order(2))])  # Appended after the torn bytes are cut off
+    finally:
+        store.close()
+    store = JournalUserStore(str(tmp_path))
+    store.load()
+    try:
+        assert [o["order_id"] for o in store.users["alice"]["orders"]] == ["ORD-1", "ORD-2"]
+    finally:
+        store.close()
+
+
+def test_a_bad_line_before_the_last_is_reported_not_truncated(tmp_path, journal):
+    journal.add_user("alice", "hash", "alice@example.com")
+    journal.add_orders([("alice", order(1))])
+    journal.add_orders([("alice", order(2))])
+    crash(journal)
+    with open(journal.path, "rb") as f:
+        lines = f.read().splitlines(keepends=True)
+    lines[1] = b'{"op":"order","user":"al\n'  # Damaged in the middle: ORD-2 still follows it
+    with open(journal.path, "wb") as f:
+        f.write(b"".join(lines))
+
+    store = JournalUserStore(str(tmp_path))
+    with pytest.raises(CorruptFileError) as e:
+        store.load()
+    assert e.value.path == journal.path
+    assert store.journal is None and store.worker is None
+    store.close()
+    with open(journal.path, "rb") as f:
+        assert f.read() == b"".join(lines)  # Left as found, for whoever repairs it
+
+
+def test_a_record_for_an_unknown_user_is_reported(tmp_path, journal):
+    journal.add_user("alice", "hash", "alice@example.com")
+    crash(journal)
+    with open(journal.path, "ab") as f:
+        f.write(b'{"op":"set_password","user":"bob","password":"x","seq":2}\n')
+
+    store = JournalUserStore(str(tmp_path))
+    with pytest.raises(CorruptFileError) as e:
+        store.load()
+    assert e.value.path == journal.path
+    store.close()
+
+
+def test_a_crash_mid_compaction_replays_each_record_once(tmp_path, journal):
+    journal.add_user("alice", "hash", "alice@example.com")
+    journal.add_orders([("alice", order(1))])
+    with open(journal.path, "rb") as f:
+        before = f.read()
+    journal.compact()
+    journal.add_orders([("alice", order(2))])
+    with open(journal.path, "rb") as f:
+        after = f.read()
+    crash(journal)
+    # The new snapshot is in place but the crash came before the journal was rewritten
+    with open(journal.path, "wb") as f:
+        f.write(before + after)
+
+    store = JournalUserStore(str(tmp_path))
+    store.load()
+    try:
+        assert [o["order_id"] for o in store.users["alice"]["orders"]] == ["ORD-1", "ORD-2"]
+    finally:
+        store.close()
+
+
+def test_sqlite_store_loads_accounts_lazily(tmp_path):
+    store = SqliteUserStore(str(tmp_path / "users.db"))
+    try:
+        users = store.load()
+        store.add_user("alice", "hash", "alice@example.com")
+        assert "alice" in users and "bob" not in users
+        assert users["alice"]["email"] == "alice@example.com"
+    finally:
+        store.close()
+
+
+@pytest.mark.parametrize("backend, damaged", [("json", "users.json"), ("journal", "users.snapshot.json"),
+                                              ("sqlite", "users.json")])
+def test_a_corrupt_file_is_named_in_the_error(tmp_path, backend, damaged):
+    (tmp_path / damaged).write_text('{"alice": {"password": ')
+    with pytest.raises(CorruptFileError) as e:
+        store = open_user_store(backend, str(tmp_path))
+        try:
+            store.load()
+        finally:
+            store.close()
+    assert e.value.path == str(tmp_path / damaged)
+
+
+def test_a_journal_store_that_failed_to_load_starts_nothing(tmp_path):
+    (tmp_path / "users.snapshot.json").write_text('{"users": {}}')  # No "seq"
+    store = JournalUserStore(str(tmp_path))
+    with pytest.raises(CorruptFileError):
+        store.load()
+    assert store.worker is None and store.journal is None
+    store.close()
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_iter_orders_stops_at_the_mark(tmp_path, backend):
+    store = open_user_store(backend, str(tmp_path))
+    store.load()
+    try:
+        store.add_user("alice", "hash", "alice@example.com")
+        store.add_orders([("alice", order(1))])
+        until = store.order_mark()
+        store.add_user("bob", "hash", "bob@example.com")
+        store.add_orders([("alice", order(2)), ("bob", order(3))])
+        assert [o["order_id"] for o in store.iter_orders(until=until)] == ["ORD-1"]
+        assert sorted(o["order_id"] for o in store.iter_orders()) == ["ORD-1", "ORD-2", "ORD-3"]
+    finally:
+        store.close()
+
+
+def test_sqlite_keeps_order_prices_and_upgrades_old_databases(tmp_path):
+    import sqlite3
+    path = str(tmp_path / "users.db")
+    conn = sqlite3.connect(path)  # The orders table as it was before unit_cents
+    conn.executescript("""
+        CREATE TABLE users (username TEXT PRIMARY KEY, password TEXT NOT NULL, email TEXT NOT NULL);
+        CREATE TABLE orders (id INTEGER PRIMARY KEY, order_id TEXT NOT NULL, username TEXT NOT NULL,
+                             date TEXT NOT NULL, total REAL NOT NULL, items TEXT NOT NULL);
+        INSERT INTO users VALUES ('alice', 'hash', 'alice@example.com');
+        INSERT INTO orders (order_id, username, date, total, items)
+            VALUES ('ORD-1', 'alice', '2024-01-31 12:00:00', 39.0, '{"Levis Pants": 1}');
+    """)
+    conn.close()
+    store = SqliteUserStore(path)
+    try:
+        store.load()
+        store.add_orders([("alice", dict(order(2), unit_cents={"Levis Pants": 3900}))])
+        assert [o.get("unit_cents") for o in store.iter_orders()] == [None, {"Levis Pants": 3900}]
+        assert store.orders_page("alice", 0, 1)[0]["unit_cents"] == {"Levis Pants": 3900}
+    finally:
+        store.close()
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_passwords_skips_the_given_prefixes(tmp_path, backend):
+    store = open_user_store(backend, str(tmp_path))
+    store.load()
+    try:
+        store.add_user("alice", "$2b$12$hashed", "alice@example.com")
+        store.add_user("bob", "plaintext", "bob@example.com")
+        store.add_user("carol", "$2y$04$hashed", "carol@example.com")
+        assert sorted(store.passwords()) == [("alice", "$2b$12$hashed"), ("bob", "plaintext"),
+                                             ("carol", "$2y$04$hashed")]
+        assert [tuple(row) for row in store.passwords(skip_prefixes=("$2b$", "$2y$"))] == [("bob", "plaintext")]
+    finally:
+        store.close()
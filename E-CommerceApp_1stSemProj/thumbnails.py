@@ -0,0 +1,140 @@
+import json
+import os
+import logging
+from collections import OrderedDict
+
+import metrics
+
+# --- Thumbnail Cache ---
+#
+# PIL is imported on the first thumbnail request rather than at module import, so the
+# window can come up before Pillow (and its plugins) have been loaded.
+
+# Upper bound for decoded PhotoImage objects kept alive (RGBA, 4 bytes per pixel)
+MAX_CACHE_BYTES = 32 * 1024 * 1024
+
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+
+# Pre-resized thumbnails are written here so a restart doesn't have to resize again.
+# Set to None to keep the cache purely in memory.
+DISK_CACHE_DIR = os.path.join(IMAGES_DIR, ".thumbs")
+
+# Written by ingest_images.py: image name -> content hash and the thumbnails built for it
+MANIFEST_FILENAME = "manifest.json"
+
+_cache = OrderedDict()  # (path, mtime_ns, size) -> PhotoImage, least recently used first
+_cache_bytes = 0
+
+
+class ThumbnailManifest:
+    """
+    Looks up the thumbnails ingest_images.py built ahead of time. The manifest is read on
+    the first lookup; a missing or unreadable one just means every lookup misses.
+    """
+
+    def __init__(self, images_dir=IMAGES_DIR):
+        self.images_dir = images_dir
+        self.entries = None
+
+    def load(self):
+        """Reads the manifest; returns its image name -> entry dict."""
+        path = os.path.join(self.images_dir, MANIFEST_FILENAME)
+        self.entries = {}
+        if not os.path.exists(path):
+            return self.entries
+        try:
+            with open(path, "r") as f:
+                self.entries = json.load(f)["images"]
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning("Ignoring unreadable image manifest %s: %s", path, e)
+        return self.entries
+
+    def thumbnail_path(self, image_name, size):
+        """
+        Returns the pre-built thumbnail of 'image_name' at 'size', or None if there is none or
+        the source image changed since it was built.
+        """
+        if self.entries is None:
+            self.load()
+        entry = self.entries.get(image_name)
+        if entry is None:
+            return None
+        thumb = entry["thumbs"].get(f"{size[0]}x{size[1]}")
+        if thumb is None:
+            return None
+        try:
+            if os.stat(os.path.join(self.images_dir, image_name)).st_mtime_ns != entry["mtime_ns"]:
+                return None  # Edited since the last ingest run; resize the original instead
+        except OSError:
+            pass  # Source removed, but its thumbnail is still good
+        return os.path.join(self.images_dir, thumb)
+
+
+def _disk_cache_path(path, mtime_ns, size):
+    """Builds the on-disk thumbnail filename for a source image, its mtime and the target size."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(DISK_CACHE_DIR, f"{stem}_{size[0]}x{size[1]}_{mtime_ns}.png")
+
+
+def _load_resized(path, mtime_ns, size):
+    """Returns a resized PIL image, reusing the on-disk thumbnail when there is one."""
+    from PIL import Image
+    with Image.open(path) as img:
+        if img.size == tuple(size):
+            img.load()
+            return img.copy()  # Already a thumbnail (e.g. from ingest_images.py)
+
+    if DISK_CACHE_DIR:
+        thumb_path = _disk_cache_path(path, mtime_ns, size)
+        if os.path.exists(thumb_path):
+            with Image.open(thumb_path) as thumb:
+                thumb.load()
+                return thumb.copy()
+
+    with Image.open(path) as img:
+        resized = img.resize(size, Image.LANCZOS)
+
+    if DISK_CACHE_DIR:
+        try:
+            os.makedirs(DISK_CACHE_DIR, exist_ok=True)
+            resized.save(_disk_cache_path(path, mtime_ns, size), "PNG")
+        except OSError as e:
+            # The disk cache is only an optimisation, the in-memory image is still usable
+            logging.warning("Could not write thumbnail cache for %s: %s", path, e)
+    return resized
+
+
+def get_thumbnail(path, size=(100, 100)):
+    """
+    Returns a PhotoImage of the image at 'path' resized to 'size'.
+    Images are decoded once per (path, mtime, size) and then served from an LRU cache.
+    Raises FileNotFoundError if the image does not exist.
+    """
+    global _cache_bytes
+    mtime_ns = os.stat(path).st_mtime_ns  # Raises FileNotFoundError for missing images
+    key = (path, mtime_ns, tuple(size))
+
+    photo = _cache.get(key)
+    if photo is not None:
+        _cache.move_to_end(key)
+        return photo
+
+    from PIL import ImageTk
+    with metrics.timer("image.decode"):
+        photo = ImageTk.PhotoImage(_load_resized(path, mtime_ns, tuple(size)))
+    metrics.count("images.decoded")
+    _cache[key] = photo
+    _cache_bytes += size[0] * size[1] * 4
+
+    # Evict least recently used thumbnails until we're back under the memory cap
+    while _cache_bytes > MAX_CACHE_BYTES and len(_cache) > 1:
+        (_, _, old_size), _ = _cache.popitem(last=False)
+        _cache_bytes -= old_size[0] * old_size[1] * 4
+    return photo
+
+
+def clear_thumbnail_cache():
+    """Drops every cached PhotoImage (the on-disk thumbnails are kept)."""
+    global _cache_bytes
+    _cache.clear()
+    _cache_bytes = 0